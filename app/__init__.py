@@ -8,4 +8,4 @@ templates_path = os.path.join(parent_path, 'logs')
 if not os.path.exists(templates_path):
     os.makedirs(templates_path)
 
-logging.basicConfig(filename='logs/LOGS_REQUISICAO.log', encoding='utf-8')
\ No newline at end of file
+logging.basicConfig(filename='logs/LOGS_REQUISICAO.log', encoding='utf-8', level=logging.INFO)
\ No newline at end of file
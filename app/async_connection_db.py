@@ -0,0 +1,116 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from app.async_database import AsyncDatabase
+from app.connection_db import Connection
+from app.database import Database
+from app.schema import SchemaSnapshot
+
+logger = logging.getLogger(__name__)
+
+class AsyncConnection:
+    '''
+    Async counterpart of Connection for the introspection and DDL of a run,
+    sharing its settings. Every statement waits on the semaphore bounding the
+    statements in flight.
+    '''
+    def __init__(self, connection:Connection, semaphore:asyncio.Semaphore) -> None:
+        self.connection = connection
+        self.semaphore = semaphore
+
+
+    @property
+    def name(self) -> str:
+        return self.connection.name
+
+
+    @asynccontextmanager
+    async def __create_connection(self, database = None):
+        async with self.semaphore:
+            async with AsyncDatabase(
+                self.connection.dbms, self.connection.host, self.connection.port, self.connection.user,
+                self.connection.password, database, self.connection.pool_options
+            ) as database_connection:
+                yield database_connection
+
+
+    async def find_existing_databases(self):
+        async with self.__create_connection() as database_connection:
+            existing_databases = await database_connection.run(Database.find_databases)
+
+        self.connection.select_databases(existing_databases)
+        return self.connection.database
+
+
+    async def load_schema_snapshot(self, databases):
+        '''
+        Introspect every given database, the four INFORMATION_SCHEMA queries
+        running side by side.
+        '''
+        if len(databases) == 0:
+            return SchemaSnapshot()
+
+        async def query(method):
+            async with self.__create_connection() as database_connection:
+                return await database_connection.run(method, databases)
+
+        return SchemaSnapshot.build(*await asyncio.gather(
+            query(Database.find_schema_tables),
+            query(Database.find_schema_columns),
+            query(Database.find_schema_constraints),
+            query(Database.find_schema_statistics),
+        ))
+
+
+    async def show_create_table(self, database, table):
+        try:
+            async with self.__create_connection(database) as database_connection:
+                return (await database_connection.run(Database.show_create_table, table))[0][1]
+        except Exception as e:
+            logger.error("Could not show table on %s: %s", self.name, e)
+            return False
+
+
+    async def create_database(self, database):
+        try:
+            async with self.__create_connection() as database_connection:
+                await database_connection.run(Database.create_database, database)
+            return True
+        except Exception as e:
+            logger.error("Could not create database on %s: %s", self.name, e)
+            return False
+
+
+    async def create_table(self, database, script_creation):
+        try:
+            async with self.__create_connection(database) as database_connection:
+                await database_connection.run(Database.create_table, script_creation)
+            return True
+        except Exception as e:
+            logger.error("Could not create table on %s: %s", self.name, e)
+            return False
+
+
+    async def apply_migration_plan(self, migration_plan):
+        '''
+        Same algorithm fallback as Connection.apply_migration_plan.
+        '''
+        try:
+            async with self.__create_connection(migration_plan.database) as database_connection:
+                if not database_connection.combined_alter:
+                    for statement in migration_plan.clause_statements():
+                        await database_connection.run(Database.alter_table, statement)
+                    return True
+
+                for algorithm in migration_plan.algorithm_candidates():
+                    try:
+                        await database_connection.run(Database.alter_table, migration_plan.statement(algorithm))
+                        return True
+                    except Exception:
+                        if algorithm is None:
+                            raise
+            return False
+        except Exception as e:
+            logger.error("Could not apply migration plan on %s: %s", self.name, e)
+            return False
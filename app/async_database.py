@@ -0,0 +1,95 @@
+import asyncio
+
+from sqlalchemy import text
+
+from app.backends import BACKENDS, create_database
+from app.database import Database
+from app.engine_registry import engine_registry
+
+class AsyncDatabase:
+    '''
+    Database on SQLAlchemy's async engine. The statements are the ones of
+    Database, run on the synchronous facade of the async connection.
+    Backends without an async driver, such as SQLite, run their own
+    Database on a worker thread instead, so only their waiting is async.
+    '''
+    def __init__(self, dbms, host, port, user, password, database = None, pool_options = None) -> None:
+        self.connection = None
+        self.sync_database = None
+        self.database = database
+        self.database_url = None
+        self.engine = None
+        self.settings = (dbms, host, port, user, password, database, pool_options)
+        driver = self.__verify_driver(dbms)
+
+        if driver is not None:
+            self.database_url = f"{dbms}+{driver}://{user}:{password}@{host}:{port}"
+            self.engine = engine_registry.get_async_engine(self.database_url, pool_options)
+
+
+    async def __aenter__(self):
+        await self.create_connection()
+        return self
+
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+    @property
+    def combined_alter(self) -> bool:
+        if self.sync_database is not None:
+            return self.sync_database.combined_alter
+        return Database.combined_alter
+
+
+    def __verify_driver(self, dbms):
+        '''
+        Verify if an async driver is available for the given DBMS, None when
+        only its synchronous backend is.
+        '''
+        available_drivers = {
+            "mysql": "aiomysql",
+        }
+
+        if dbms not in available_drivers and dbms not in BACKENDS:
+            raise ValueError(f"Async driver not available to DBMS {dbms}")
+
+        return available_drivers.get(dbms)
+
+
+    async def create_connection(self):
+        if self.engine is None:
+            self.sync_database = await asyncio.to_thread(create_database, *self.settings)
+            return
+
+        try:
+            self.connection = await self.engine.connect()
+            if self.database:
+                await self.connection.execute(text(f"USE `{self.database}`"))
+
+        except Exception as e:
+            await self.close()
+            raise ValueError(f"Error creating connection: {e}")
+
+
+    async def close(self):
+        if self.sync_database is not None:
+            await asyncio.to_thread(self.sync_database.close)
+            self.sync_database = None
+        if self.connection is not None:
+            await self.connection.close()
+            self.connection = None
+
+
+    async def run(self, method, *arguments):
+        '''
+        Await a Database method, such as Database.find_schema_tables, on this connection.
+        '''
+        if self.sync_database is not None:
+            return await asyncio.to_thread(getattr(self.sync_database, method.__name__), *arguments)
+
+        def call(sync_connection):
+            return method(Database.bind(sync_connection, self.database), *arguments)
+
+        return await self.connection.run_sync(call)
@@ -0,0 +1,190 @@
+import asyncio
+import logging
+
+from app.async_connection_db import AsyncConnection
+from app.engine_registry import engine_registry
+from app.instrumentation import instrumentation
+from app.replicator import Replicator
+from app.schema import SchemaSnapshot
+
+logger = logging.getLogger(__name__)
+
+class AsyncReplicator(Replicator):
+    '''
+    Replicator whose run issues the structure steps concurrently on asyncio
+    (run_async). It is a thin layer over Replicator: the data steps, the
+    probe and online schema changes run on threads, as do the statements
+    of backends without an async driver.
+    '''
+    def __init__(self, config_file = "connections.json") -> None:
+        super().__init__(config_file)
+
+        self.async_concurrency = int(self.config_file.get("ASYNC_CONCURRENCY", 10))
+        if self.async_concurrency < 1:
+            raise ValueError("ASYNC_CONCURRENCY must be at least 1")
+
+
+    def run(self):
+        try:
+            return asyncio.run(self.run_async())
+        finally:
+            engine_registry.dispose_all()
+
+
+    async def run_async(self):
+        '''
+        The run of run() with the introspection of every server and the DDL of
+        every target issued concurrently on the async engine, at most
+        ASYNC_CONCURRENCY statements in flight. Rows are then copied by the
+        same threaded copiers as run().
+        '''
+        semaphore = asyncio.Semaphore(self.async_concurrency)
+        source = AsyncConnection(self.replicated_connection, semaphore)
+        targets = [AsyncConnection(connection, semaphore) for connection in self.other_connections]
+
+        try:
+            instrumentation.reset()
+            with instrumentation.span("run", mode="async"):
+                with instrumentation.span("discover"):
+                    databases = await source.find_existing_databases()
+                with instrumentation.span("probe"):
+                    await asyncio.to_thread(self.probe_schemas)
+                if self.nothing_to_replicate():
+                    logger.info("No table changed since the last run")
+                    return
+
+                with instrumentation.span("introspect"):
+                    snapshots = await asyncio.gather(
+                        source.load_schema_snapshot(databases),
+                        *[target.load_schema_snapshot(databases) for target in targets]
+                    )
+                    self.use_source_schema(snapshots[0])
+                    self.associate_tables_to_databases()
+                with instrumentation.span("sort"):
+                    self.sort_tables_by_dependencies()
+                with instrumentation.span("replicate"):
+                    await self.__replicate_to_others_connections_async(source, targets, snapshots[1:])
+
+        except Exception as e:
+            raise ValueError(f"Error creating connection: {e}")
+
+        finally:
+            if self.fingerprint_cache is not None:
+                self.fingerprint_cache.save()
+            self.write_run_report()
+            await engine_registry.dispose_async_engines()
+
+
+    async def __replicate_to_others_connections_async(self, source:AsyncConnection, targets:list, target_schemas:list):
+        '''
+        Structures of every target at once, then their rows like
+        replicate_databases_and_tables_to_others_connections.
+        '''
+        self.target_errors = {}
+        shared_targets = self.shared_copy_targets()
+        create_statements = await self.__show_create_tables_async(source, targets, target_schemas)
+
+        results = await asyncio.gather(
+            *[
+                self.__replicate_to_connection_async(
+                    target, target_schema, create_statements, target.connection not in shared_targets
+                )
+                for target, target_schema in zip(targets, target_schemas)
+            ],
+            return_exceptions=True
+        )
+        for target, result in zip(targets, results):
+            if isinstance(result, Exception):
+                self.record_target_error(target.connection, result)
+
+        shared_targets = [connection for connection in shared_targets if connection.name not in self.target_errors]
+        if shared_targets:
+            await asyncio.to_thread(instrumentation.bind(self.replicate_shared_data), shared_targets)
+
+        if self.target_errors:
+            raise ValueError(f"Replication failed for {', '.join(self.target_errors)}")
+
+
+    async def __show_create_tables_async(self, source:AsyncConnection, targets:list, target_schemas:list):
+        '''
+        CREATE TABLE statements of the tables missing on any target, read once
+        from the source and shared by every target.
+        '''
+        missing_tables = sorted({
+            (database, table)
+            for target, target_schema in zip(targets, target_schemas)
+            for database, tables in self.replicated_connection.table_associated_to_database.items()
+            for table in tables
+            if target_schema.get_table(database, table) is None
+                and self.should_replicate(target.connection, database, table)
+        })
+
+        statements = await asyncio.gather(
+            *[source.show_create_table(database, table) for database, table in missing_tables]
+        )
+        return dict(zip(missing_tables, statements))
+
+
+    async def __replicate_to_connection_async(self, target:AsyncConnection, target_schema:SchemaSnapshot, create_statements:dict, copy_data = True):
+        connection = target.connection
+        databases = list(self.replicated_connection.table_associated_to_database.keys())
+        self.restore_pending_index_builds(connection)
+
+        for database in databases:
+            if not target_schema.has_database(database):
+                await target.create_database(database)
+
+            created_tables = []
+            for level in self.table_levels[database]:
+                tables = [table for table in level if self.should_replicate(connection, database, table)]
+                created = await asyncio.gather(
+                    *[
+                        self.__replicate_table_structure_async(target, database, table, target_schema, create_statements)
+                        for table in tables
+                    ]
+                )
+                created_tables.extend(table for table, was_created in zip(tables, created) if was_created)
+
+            await asyncio.gather(
+                *[
+                    target.apply_migration_plan(migration_plan)
+                    for migration_plan in self.deferred_foreign_key_plans(connection, database, created_tables)
+                ]
+            )
+
+        if copy_data:
+            await asyncio.to_thread(instrumentation.bind(self.replicate_connection_data), connection, databases)
+
+
+    async def __replicate_table_structure_async(self, target:AsyncConnection, database, table, target_schema:SchemaSnapshot, create_statements:dict):
+        '''
+        Async Replicator.__replicate_table_structure. ALTERs large enough for an online
+        schema change run on the threaded connection.
+        '''
+        connection = target.connection
+        target_table = target_schema.get_table(database, table)
+
+        if target_table is None:
+            script_creation = create_statements.get((database, table))
+            if not script_creation:
+                logger.error("Could not read the structure of %s.%s", database, table)
+                return False
+
+            script_creation = self.creation_script(connection, database, table, script_creation)
+            if not await target.create_table(database, script_creation):
+                logger.error("Could not create table %s.%s on %s", database, table, connection.name)
+                return False
+            return True
+
+        migration_plan = self.table_migration_plan(connection, database, table, target_table)
+        if migration_plan is None:
+            return False
+
+        table_bytes = (target_table.data_length or 0) + (target_table.index_length or 0)
+        if 0 < connection.online_change_threshold <= table_bytes:
+            await asyncio.to_thread(
+                connection.apply_migration_plan, migration_plan, table_bytes=table_bytes, target_schema=target_schema
+            )
+        else:
+            await target.apply_migration_plan(migration_plan)
+        return False
@@ -0,0 +1,20 @@
+from app.database import Database
+from app.sqlite_database import SQLiteDatabase
+
+BACKENDS = {
+    "mysql": Database,
+    "sqlite": SQLiteDatabase,
+}
+
+def register_backend(dbms, database_class):
+    '''
+    Make a Database subclass available to connections configured with DBMS dbms.
+    '''
+    BACKENDS[dbms] = database_class
+
+
+def create_database(dbms, host, port, user, password, database = None, pool_options = None) -> Database:
+    if dbms not in BACKENDS:
+        raise ValueError(f"Backend not available to DBMS {dbms}")
+
+    return BACKENDS[dbms](dbms, host, port, user, password, database, pool_options)
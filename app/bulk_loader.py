@@ -0,0 +1,104 @@
+import datetime
+import decimal
+import os
+import re
+import tempfile
+
+BINARY_TYPES = ("binary", "varbinary", "blob", "tinyblob", "mediumblob", "longblob", "bit", "geometry")
+
+ESCAPES = {
+    ord("\\"): b"\\\\",
+    ord("\t"): b"\\t",
+    ord("\n"): b"\\n",
+    ord("\r"): b"\\r",
+    0: b"\\0",
+}
+ESCAPED_BYTES = re.compile(rb"[\\\t\n\r\x00]")
+
+def is_binary_type(column_type):
+    return column_type.split("(")[0].split()[0].lower() in BINARY_TYPES
+
+
+def escape_bytes(value:bytes):
+    if ESCAPED_BYTES.search(value) is None:
+        return value
+    return ESCAPED_BYTES.sub(lambda match: ESCAPES[match.group()[0]], value)
+
+
+def format_timedelta(value:datetime.timedelta):
+    '''
+    MySQL TIME literal, which may be negative or above 24 hours.
+    '''
+    sign = "-" if value < datetime.timedelta(0) else ""
+    value = abs(value)
+    hours, remainder = divmod(value.days * 86400 + value.seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    text = f"{sign}{hours:02d}:{minutes:02d}:{seconds:02d}"
+    if value.microseconds:
+        text = f"{text}.{value.microseconds:06d}"
+    return text
+
+
+def encode_value(value, binary = False):
+    '''
+    Tab separated field for LOAD DATA: NULL as \\N, binary columns as hex
+    decoded by UNHEX on the server, everything else escaped UTF-8 text.
+    '''
+    if value is None:
+        return b"\\N"
+    if binary:
+        return bytes(value).hex().encode("ascii") if not isinstance(value, str) else value.encode("utf-8").hex().encode("ascii")
+    if isinstance(value, bool):
+        return b"1" if value else b"0"
+    if isinstance(value, (int, float, decimal.Decimal)):
+        return str(value).encode("ascii")
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=" ").encode("ascii")
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat().encode("ascii")
+    if isinstance(value, datetime.timedelta):
+        return format_timedelta(value).encode("ascii")
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return escape_bytes(bytes(value))
+
+    return escape_bytes(str(value).encode("utf-8"))
+
+
+class LoadDataWriter:
+    '''
+    Write row batches with LOAD DATA LOCAL INFILE through a temporary file
+    reused for every batch of a table, encoded by the table's RowConverter.
+    '''
+    def __init__(self, converter) -> None:
+        self.converter = converter
+        self.file = tempfile.NamedTemporaryFile(prefix="datarep_", suffix=".tsv", delete=False)
+
+
+    def write(self, target_connection, table, columns, rows):
+        self.file.seek(0)
+        self.file.truncate()
+        for line in self.converter.encode_rows(rows):
+            self.file.write(line)
+            self.file.write(b"\n")
+        self.file.flush()
+
+        return target_connection.load_data_infile(table, columns, self.file.name, self.converter.binary_columns)
+
+
+    def close(self):
+        self.file.close()
+        if os.path.exists(self.file.name):
+            os.remove(self.file.name)
+
+
+class InsertWriter:
+    def __init__(self, converter) -> None:
+        self.converter = converter
+
+
+    def write(self, target_connection, table, columns, rows):
+        return target_connection.insert_rows(table, columns, self.converter.tuples(rows))
+
+
+    def close(self):
+        pass
@@ -0,0 +1,351 @@
+import json
+import logging
+import os
+import time
+
+from app.connection_db import Connection
+from app.data_copy import DataCopier
+from app.instrumentation import instrumentation
+
+logger = logging.getLogger(__name__)
+
+class ChangeEvent:
+    '''
+    Row or DDL change read from the source. "commit" events mark the end of a
+    source transaction and carry the position to resume from.
+    '''
+    kinds = ("insert", "update", "delete", "ddl", "commit")
+
+    def __init__(self, kind, database = None, table = None, rows = None, statement = None, position = None) -> None:
+        if kind not in self.kinds:
+            raise ValueError(f"Unknown change event {kind}")
+
+        self.kind = kind
+        self.database = database
+        self.table = table
+        self.rows = rows or []
+        self.statement = statement
+        self.position = position
+
+
+    @classmethod
+    def from_dict(cls, event:dict):
+        return cls(
+            event.get("kind"), event.get("database"), event.get("table"),
+            event.get("rows"), event.get("statement"), event.get("position")
+        )
+
+
+    def to_dict(self):
+        return {
+            "kind": self.kind,
+            "database": self.database,
+            "table": self.table,
+            "rows": self.rows,
+            "statement": self.statement,
+            "position": self.position,
+        }
+
+
+class SyntheticEventSource:
+    '''
+    Replay events built in memory, for tests and benchmarks.
+    '''
+    def __init__(self, events) -> None:
+        self.events = list(events)
+
+
+    def events_from(self, position = None):
+        skipping = position is not None
+        for event in self.events:
+            if skipping:
+                if event.position == position:
+                    skipping = False
+                continue
+            yield event
+
+
+class RecordedEventSource(SyntheticEventSource):
+    '''
+    Replay a recorded stream, one JSON encoded ChangeEvent per line.
+    '''
+    def __init__(self, path) -> None:
+        if not os.path.exists(path):
+            raise ValueError(f"Recorded event file {path} not found")
+
+        with open(path, encoding="utf-8") as file_open:
+            events = [ChangeEvent.from_dict(json.loads(line)) for line in file_open if line.strip()]
+
+        super().__init__(events)
+
+
+class BinlogEventSource:
+    '''
+    Tail the row based binlog of the source with python-mysql-replication.
+    Without a saved position it starts at the current end of the binlog.
+    '''
+    def __init__(self, connection:Connection, databases, server_id = 1001, heartbeat = 1.0) -> None:
+        self.connection = connection
+        self.databases = list(databases)
+        self.server_id = server_id
+        self.heartbeat = heartbeat
+
+
+    def events_from(self, position = None):
+        try:
+            from pymysqlreplication import BinLogStreamReader
+            from pymysqlreplication.event import HeartbeatLogEvent, QueryEvent, XidEvent
+            from pymysqlreplication.row_event import DeleteRowsEvent, UpdateRowsEvent, WriteRowsEvent
+        except ImportError:
+            raise ValueError("Binlog streaming requires the mysql-replication package")
+
+        stream = BinLogStreamReader(
+            connection_settings={
+                "host": self.connection.host,
+                "port": int(self.connection.port),
+                "user": self.connection.user,
+                "passwd": self.connection.password,
+            },
+            server_id=self.server_id,
+            blocking=True,
+            resume_stream=True,
+            log_file=position["log_file"] if position else None,
+            log_pos=position["log_pos"] if position else None,
+            only_events=[WriteRowsEvent, UpdateRowsEvent, DeleteRowsEvent, QueryEvent, XidEvent, HeartbeatLogEvent],
+            slave_heartbeat=self.heartbeat,
+        )
+
+        try:
+            for binlog_event in stream:
+                current_position = {"log_file": stream.log_file, "log_pos": stream.log_pos}
+
+                if isinstance(binlog_event, HeartbeatLogEvent):
+                    yield None
+                elif isinstance(binlog_event, XidEvent):
+                    yield ChangeEvent("commit", position=current_position)
+                elif isinstance(binlog_event, QueryEvent):
+                    event = self.__query_event(binlog_event, current_position)
+                    if event is not None:
+                        yield event
+                elif binlog_event.schema in self.databases:
+                    yield self.__row_event(binlog_event, WriteRowsEvent, UpdateRowsEvent)
+        finally:
+            stream.close()
+
+
+    def __query_event(self, binlog_event, position):
+        statement = binlog_event.query.strip()
+        database = binlog_event.schema
+        if isinstance(database, bytes):
+            database = database.decode("utf-8")
+
+        if statement.upper() in ("BEGIN", "COMMIT"):
+            return ChangeEvent("commit", position=position) if statement.upper() == "COMMIT" else None
+        if database not in self.databases:
+            return None
+
+        return ChangeEvent("ddl", database, statement=statement, position=position)
+
+
+    def __row_event(self, binlog_event, insert_event, update_event):
+        if isinstance(binlog_event, insert_event):
+            return ChangeEvent("insert", binlog_event.schema, binlog_event.table, [row["values"] for row in binlog_event.rows])
+        if isinstance(binlog_event, update_event):
+            return ChangeEvent(
+                "update", binlog_event.schema, binlog_event.table,
+                [[row["before_values"], row["after_values"]] for row in binlog_event.rows]
+            )
+
+        return ChangeEvent("delete", binlog_event.schema, binlog_event.table, [row["values"] for row in binlog_event.rows])
+
+
+class PositionCheckpoint:
+    '''
+    Source position to resume from. When a DDL event failed on some targets,
+    the targets which applied it are kept next to it, in <path>.ddl, so the
+    replay of that event skips them.
+    '''
+    def __init__(self, path) -> None:
+        self.path = path
+        self.ddl_path = f"{path}.ddl"
+
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+
+        with open(self.path, encoding="utf-8") as file_open:
+            return json.load(file_open)
+
+
+    def save(self, position):
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file_open:
+            json.dump(position, file_open)
+        os.replace(temporary_path, self.path)
+
+
+    def ddl_targets(self, position):
+        '''
+        Names of the targets which applied the DDL event at position.
+        '''
+        if not os.path.exists(self.ddl_path):
+            return []
+
+        with open(self.ddl_path, encoding="utf-8") as file_open:
+            progress = json.load(file_open)
+        return progress["targets"] if progress["position"] == position else []
+
+
+    def save_ddl_targets(self, position, targets):
+        with open(self.ddl_path, "w", encoding="utf-8") as file_open:
+            json.dump({"position": position, "targets": list(targets)}, file_open)
+
+
+    def clear_ddl_targets(self):
+        if os.path.exists(self.ddl_path):
+            os.remove(self.ddl_path)
+
+
+class ChangeApplier:
+    '''
+    Buffer source transactions and apply them to every target in batches,
+    saving the source position only once every target committed them.
+    Inserts and updates are written as upserts so replaying events after a
+    crash is harmless.
+    '''
+    def __init__(self, source:Connection, targets:list, source_schema, checkpoint:PositionCheckpoint, batch_size = 500, flush_interval = 1.0) -> None:
+        self.source = source
+        self.targets = targets
+        self.source_schema = source_schema
+        self.checkpoint = checkpoint
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.pending_rows = 0
+        self.pending_position = None
+        self.committed_events = 0
+        self.last_flush = time.monotonic()
+        self.applied_events = 0
+
+
+    def handle(self, event):
+        '''
+        Take the next event, None meaning the source is idle.
+        '''
+        if event is None:
+            if self.pending and time.monotonic() - self.last_flush >= self.flush_interval:
+                self.flush()
+            return
+
+        if event.kind == "ddl":
+            self.flush()
+            self.__apply_ddl(event)
+            if event.position is not None:
+                self.checkpoint.save(event.position)
+            return
+
+        if event.kind == "commit":
+            self.pending_position = event.position
+            self.committed_events = len(self.pending)
+            if self.pending_rows >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval:
+                self.flush()
+            return
+
+        self.pending.append(event)
+        self.pending_rows += len(event.rows)
+
+
+    def flush(self):
+        '''
+        Apply the buffered events up to the last complete source transaction.
+        '''
+        if self.pending_position is None:
+            return
+
+        committed = self.pending[:self.committed_events]
+        for target in self.targets:
+            self.__apply_rows(target, committed)
+        instrumentation.add_rows(sum(len(event.rows) for event in committed))
+
+        self.checkpoint.save(self.pending_position)
+        self.applied_events += len(committed)
+        self.pending = self.pending[self.committed_events:]
+        self.pending_rows = sum(len(event.rows) for event in self.pending)
+        self.pending_position = None
+        self.committed_events = 0
+        self.last_flush = time.monotonic()
+
+
+    def __apply_ddl(self, event):
+        '''
+        Apply a DDL event to every target. When a target fails, the stream
+        stops with the checkpoint still before the event, so the next run
+        replays it on the targets which did not apply it.
+        '''
+        applied_targets = self.checkpoint.ddl_targets(event.position)
+        failed_targets = []
+        for target in self.targets:
+            if target.name in applied_targets:
+                continue
+            if target.execute_ddl(event.database, event.statement):
+                applied_targets.append(target.name)
+            else:
+                logger.error("Could not apply DDL on %s: %s", target.name, event.statement)
+                failed_targets.append(target.name)
+
+        if failed_targets:
+            self.checkpoint.save_ddl_targets(event.position, applied_targets)
+            raise ValueError(f"Could not apply DDL on {', '.join(failed_targets)}: {event.statement}")
+        self.checkpoint.clear_ddl_targets()
+
+        refreshed_schema = self.source.load_schema_snapshot([event.database])
+        self.source_schema.databases[event.database] = refreshed_schema.tables(event.database)
+
+
+    def __apply_rows(self, target:Connection, events):
+        '''
+        Consecutive events of the same kind and table are written together.
+        '''
+        groups = []
+        for event in events:
+            if groups and (groups[-1][0].kind, groups[-1][0].database, groups[-1][0].table) == (event.kind, event.database, event.table):
+                groups[-1][1].extend(event.rows)
+            else:
+                groups.append((event, list(event.rows)))
+
+        databases = {event.database for event, _ in groups}
+        for database in databases:
+            with target.checkout(database) as target_connection:
+                target_connection.set_session_variable("FOREIGN_KEY_CHECKS", 0)
+                try:
+                    for event, rows in groups:
+                        if event.database == database:
+                            self.__apply_group(target_connection, event, rows)
+                    target_connection.commit()
+                finally:
+                    target_connection.set_session_variable("FOREIGN_KEY_CHECKS", 1)
+
+
+    def __apply_group(self, target_connection, event, rows):
+        table = self.source_schema.get_table(event.database, event.table)
+        if table is None:
+            logger.warning("Ignoring change of unknown table %s.%s", event.database, event.table)
+            return
+
+        image = rows[0][-1] if event.kind == "update" else rows[0]
+        columns = [column for column in DataCopier.copy_columns(table) if column in image]
+        key_columns = table.primary_key() or columns
+
+        if event.kind == "insert":
+            target_connection.upsert_rows(table.name, columns, [[row.get(column) for column in columns] for row in rows])
+        elif event.kind == "delete":
+            target_connection.delete_keys(table.name, key_columns, [[row.get(column) for column in key_columns] for row in rows])
+        elif event.kind == "update":
+            moved_keys = [
+                [before.get(column) for column in key_columns] for before, after in rows
+                if any(before.get(column) != after.get(column) for column in key_columns)
+            ]
+            if moved_keys:
+                target_connection.delete_keys(table.name, key_columns, moved_keys)
+            target_connection.upsert_rows(table.name, columns, [[after.get(column) for column in columns] for _, after in rows])
@@ -0,0 +1,58 @@
+import heapq
+import time
+
+class ChangeScheduler:
+    '''
+    Tables waiting to be synced by the daemon, hottest first. Every change
+    detected on a table adds one to its heat, which halves every half_life
+    seconds, so tables changing all the time go before tables changing once.
+    '''
+    def __init__(self, half_life = 600) -> None:
+        self.half_life = half_life
+        self.heat = {}
+        self.pending = {}
+
+
+    def __len__(self) -> int:
+        return len(self.pending)
+
+
+    def record(self, tables, kind):
+        '''
+        Queue the tables, keyed "database.table", for a sync of the given kind
+        (structure or data).
+        '''
+        now = time.monotonic()
+        for table in tables:
+            self.heat[table] = (self.__heat(table, now) + 1, now)
+            self.pending.setdefault(table, set()).add(kind)
+
+
+    def requeue(self, tables):
+        '''
+        Put back (table, kinds) pairs which could not be synced, without heating them.
+        '''
+        for table, kinds in tables:
+            self.pending.setdefault(table, set()).update(kinds)
+
+
+    def next_tables(self, limit = 0):
+        '''
+        Take the (table, kinds) pairs to sync now, hottest first, at most limit
+        of them when limit is positive.
+        '''
+        now = time.monotonic()
+        queue = [(-self.__heat(table, now), table) for table in self.pending]
+        heapq.heapify(queue)
+
+        count = len(queue) if limit <= 0 else min(limit, len(queue))
+        tables = []
+        for _ in range(count):
+            _, table = heapq.heappop(queue)
+            tables.append((table, self.pending.pop(table)))
+        return tables
+
+
+    def __heat(self, table, now):
+        heat, updated_at = self.heat.get(table, (0.0, now))
+        return heat * 0.5 ** ((now - updated_at) / self.half_life)
@@ -0,0 +1,116 @@
+import json
+import sqlite3
+import threading
+import time
+
+from app.key_ranges import KeyRange
+
+class CheckpointJournal:
+    '''
+    Local SQLite journal of the progress made on each target: key ranges of
+    the tables being copied and DDL still pending, so an interrupted run
+    resumes where it stopped. Applied DDL is not journaled, a new run finds
+    it by diffing the target again. A target's entries are cleared once it
+    replicated successfully.
+    '''
+    def __init__(self, path) -> None:
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS copy_tables (
+                target TEXT, database_name TEXT, table_name TEXT, status TEXT, key_ranges TEXT, updated_at REAL,
+                PRIMARY KEY (target, database_name, table_name)
+            );
+            CREATE TABLE IF NOT EXISTS copy_ranges (
+                target TEXT, database_name TEXT, table_name TEXT, position INTEGER, row_count INTEGER, completed_at REAL,
+                PRIMARY KEY (target, database_name, table_name, position)
+            );
+            CREATE TABLE IF NOT EXISTS pending_ddl (
+                target TEXT, database_name TEXT, table_name TEXT, kind TEXT, statement TEXT, updated_at REAL,
+                PRIMARY KEY (target, database_name, table_name, kind)
+            );
+        """)
+
+
+    def __execute(self, sql, parameters = ()):
+        with self.lock:
+            cursor = self.connection.execute(sql, parameters)
+            rows = cursor.fetchall()
+            self.connection.commit()
+            return rows
+
+
+    def start_table(self, target, database, table, key_ranges):
+        serialized_ranges = json.dumps([key_range.to_json() for key_range in key_ranges])
+        self.__execute("DELETE FROM copy_ranges WHERE target = ? AND database_name = ? AND table_name = ?", (target, database, table))
+        self.__execute(
+            "INSERT OR REPLACE INTO copy_tables VALUES (?, ?, ?, 'started', ?, ?)",
+            (target, database, table, serialized_ranges, time.time())
+        )
+
+
+    def table_state(self, target, database, table):
+        '''
+        Status, key ranges and completed range positions of a table copy, or
+        (None, None, set()) when the table has not been started.
+        '''
+        rows = self.__execute(
+            "SELECT status, key_ranges FROM copy_tables WHERE target = ? AND database_name = ? AND table_name = ?",
+            (target, database, table)
+        )
+        if not rows:
+            return None, None, set()
+
+        status, serialized_ranges = rows[0]
+        key_ranges = [KeyRange.from_json(key_range) for key_range in json.loads(serialized_ranges or "[]")]
+        completed = self.__execute(
+            "SELECT position FROM copy_ranges WHERE target = ? AND database_name = ? AND table_name = ?",
+            (target, database, table)
+        )
+        return status, key_ranges, {row[0] for row in completed}
+
+
+    def complete_range(self, target, database, table, position, rows):
+        self.__execute(
+            "INSERT OR REPLACE INTO copy_ranges VALUES (?, ?, ?, ?, ?, ?)",
+            (target, database, table, position, rows, time.time())
+        )
+
+
+    def finish_table(self, target, database, table):
+        self.__execute(
+            "UPDATE copy_tables SET status = 'done', updated_at = ? WHERE target = ? AND database_name = ? AND table_name = ?",
+            (time.time(), target, database, table)
+        )
+
+
+    def add_pending_ddl(self, target, database, table, kind, statement):
+        self.__execute(
+            "INSERT OR REPLACE INTO pending_ddl VALUES (?, ?, ?, ?, ?, ?)",
+            (target, database, table, kind, statement, time.time())
+        )
+
+
+    def pending_ddl(self, target, kind):
+        return self.__execute(
+            "SELECT database_name, table_name, statement FROM pending_ddl WHERE target = ? AND kind = ?",
+            (target, kind)
+        )
+
+
+    def complete_ddl(self, target, database, table, kind):
+        self.__execute(
+            "DELETE FROM pending_ddl WHERE target = ? AND database_name = ? AND table_name = ? AND kind = ?",
+            (target, database, table, kind)
+        )
+
+
+    def clear(self, target):
+        for table in ("copy_tables", "copy_ranges", "pending_ddl"):
+            self.__execute(f"DELETE FROM {table} WHERE target = ?", (target,))
+
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
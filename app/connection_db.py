@@ -1,4 +1,16 @@
-from app.database import Database
+import logging
+
+from app.backends import BACKENDS, create_database
+from app.online_schema_change import OnlineSchemaChange
+from app.throttle import Throttle
+from app.schema import SchemaSnapshot
+
+logger = logging.getLogger(__name__)
+
+DDL_COUNTERS = [
+    "Com_create_table", "Com_alter_table", "Com_drop_table", "Com_rename_table", "Com_create_index", "Com_drop_index"
+]
+
 class Connection:
     def __init__(self, data_connection:dict, replicated_connection = False) -> None:
         self.replicated_connection = replicated_connection
@@ -11,6 +23,41 @@ class Connection:
         self.database = data_connection.get("DATABASE")
         self.data = data_connection.get("DATA", False)
         self.dbms = data_connection.get("DBMS")
+        self.batch_size = int(data_connection.get("BATCH_SIZE", 1000))
+        self.sync_mode = str(data_connection.get("SYNC_MODE", "full")).lower()
+        self.chunk_size = int(data_connection.get("CHUNK_SIZE", 10000))
+        self.min_chunk_size = int(data_connection.get("MIN_CHUNK_SIZE", 100))
+        self.defer_indexes = bool(data_connection.get("DEFER_INDEXES", False))
+        self.load_method = str(data_connection.get("LOAD_METHOD", "auto")).lower()
+        self.parallel_copy_threshold = int(data_connection.get("PARALLEL_COPY_THRESHOLD", 0))
+        self.parallel_copy_workers = int(data_connection.get("PARALLEL_COPY_WORKERS", 4))
+        self.online_change_threshold = int(data_connection.get("ONLINE_CHANGE_THRESHOLD", 1024 ** 3))
+        self.online_change_pause = float(data_connection.get("ONLINE_CHANGE_PAUSE", 0))
+        self.local_infile_available = None
+        self.throttle = None
+        if data_connection.get("THROTTLE"):
+            self.throttle = Throttle(self, data_connection.get("THROTTLE"), self.batch_size)
+        self.pool_options = self.__read_pool_options(data_connection)
+
+        if self.sync_mode not in ("full", "delta", "check"):
+            raise ValueError(f"Invalid SYNC_MODE {self.sync_mode}")
+        if self.load_method not in ("auto", "infile", "insert"):
+            raise ValueError(f"Invalid LOAD_METHOD {self.load_method}")
+
+
+    @property
+    def alter_definitions(self) -> bool:
+        '''
+        Whether ALTER TABLE adds indexes and foreign keys on this backend, so
+        they may be left out of a CREATE TABLE and added afterwards.
+        '''
+        backend = BACKENDS.get(self.dbms)
+        return backend is None or backend.alter_definitions
+
+
+    @property
+    def name(self) -> str:
+        return f"{self.host}:{self.port}"
 
 
     @property
@@ -79,14 +126,23 @@ class Connection:
 
 
     def find_existing_databases(self):
-        database_connection = self.__create_connection()
+        with self.__create_connection() as database_connection:
+            existing_databases = database_connection.find_databases()
+
+        self.select_databases(existing_databases)
+
+
+    def select_databases(self, existing_databases):
+        '''
+        Keep the databases found on the server which are to be replicated.
+        '''
         databases_to_ignore = [
             "information_schema", "mysql", "performance_schema", "sys"
         ]
         databases_found = []
         database_informed = True if len(self.database) != 0 else False
 
-        for database in database_connection.find_databases():
+        for database in existing_databases:
             database = database[0]
 
             if database in databases_to_ignore or database_informed and database not in self.database:
@@ -104,10 +160,11 @@ class Connection:
 
 
     def find_tables_from_database(self, database):
-        database_connection = self.__create_connection(database)
+        with self.__create_connection(database) as database_connection:
+            existing_tables = database_connection.show_tables()
         tables = []
 
-        for table in database_connection.show_tables():
+        for table in existing_tables:
             tables.append(table[0])
         
         if len(tables) == 0:
@@ -118,82 +175,296 @@ class Connection:
 
     def verify_if_database_exists(self, database):
         try:
-            self.__create_connection(database)
-            return True
-        except Exception:
+            with self.__create_connection(database):
+                return True
+        except Exception as e:
+            logger.debug("Database not found on %s: %s", self.name, e)
             return False
 
 
     def create_database(self, database):
         try:
-            database_connection = self.__create_connection()
-            database_connection.create_database(database)
+            with self.__create_connection() as database_connection:
+                database_connection.create_database(database)
             return True
-        except Exception:
+        except Exception as e:
+            logger.error("Could not create database on %s: %s", self.name, e)
             return False
         
 
     def create_table(self, database, script_creation):
         try:
-            database_connection = self.__create_connection(database)
-            database_connection.create_table(f"""{script_creation}""")
+            with self.__create_connection(database) as database_connection:
+                database_connection.create_table(f"""{script_creation}""")
             return True
-        except Exception:
+        except Exception as e:
+            logger.error("Could not create table on %s: %s", self.name, e)
             return False
         
 
+    def execute_ddl(self, database, statement):
+        try:
+            with self.__create_connection(database) as database_connection:
+                database_connection.execute_ddl(statement)
+            return True
+        except Exception as e:
+            logger.error("Could not execute statement on %s: %s", self.name, e)
+            return False
+
+
     def add_column(self, database, table, column):
         try:
-            database_connection = self.__create_connection(database)
-            database_connection.add_column(table, column)
+            with self.__create_connection(database) as database_connection:
+                database_connection.add_column(table, column)
             return True
-        except Exception:
+        except Exception as e:
+            logger.error("Could not add column on %s: %s", self.name, e)
             return False
 
 
     def modify_constraint(self, database, table, constraint):
         try:
-            database_connection = self.__create_connection(database)
-            database_connection.modify_constraint(table, constraint)
+            with self.__create_connection(database) as database_connection:
+                database_connection.modify_constraint(table, constraint)
             return True
-        except Exception:
+        except Exception as e:
+            logger.error("Could not modify constraint on %s: %s", self.name, e)
             return False
 
 
     def drop_column(self, database, table, column):
         try:
-            database_connection = self.__create_connection(database)
-            database_connection.drop_column(table, column)
+            with self.__create_connection(database) as database_connection:
+                database_connection.drop_column(table, column)
             return True
-        except Exception:
+        except Exception as e:
+            logger.error("Could not drop column on %s: %s", self.name, e)
             return False
         
 
+    def apply_migration_plan(self, migration_plan, foreign_key_checks = True, table_bytes = 0, target_schema = None):
+        '''
+        Run the plan as one ALTER TABLE, trying the cheapest eligible algorithm
+        first and letting the server choose when it is refused. Without
+        foreign_key_checks, foreign keys are added in place without
+        validating the existing rows. Tables of at least
+        ONLINE_CHANGE_THRESHOLD bytes get an online schema change instead of
+        an ALTER TABLE copying the table, checked against target_schema when
+        the caller holds it. Backends without combined ALTERs run one
+        statement per change.
+        '''
+        online_change = 0 < self.online_change_threshold <= table_bytes
+        candidates = migration_plan.algorithm_candidates()
+        if online_change:
+            candidates = [algorithm for algorithm in candidates if algorithm not in ("COPY", None)]
+
+        try:
+            with self.__create_connection(migration_plan.database) as database_connection:
+                if not foreign_key_checks:
+                    database_connection.set_session_variable("FOREIGN_KEY_CHECKS", 0)
+                try:
+                    if not database_connection.combined_alter:
+                        for statement in migration_plan.clause_statements():
+                            database_connection.alter_table(statement)
+                        return True
+
+                    for algorithm in candidates:
+                        try:
+                            database_connection.alter_table(migration_plan.statement(algorithm))
+                            return True
+                        except Exception:
+                            if algorithm is None:
+                                raise
+                finally:
+                    if not foreign_key_checks:
+                        database_connection.set_session_variable("FOREIGN_KEY_CHECKS", 1)
+
+            if online_change:
+                return self.__apply_online_change(migration_plan, target_schema)
+            return False
+        except Exception as e:
+            logger.error("Could not apply migration plan on %s: %s", self.name, e)
+            return False
+
+
+    def __apply_online_change(self, migration_plan, target_schema):
+        '''
+        Shadow table copy for a plan the server would only run with the COPY
+        algorithm, or a plain ALTER TABLE when the table does not allow it.
+        '''
+        online_schema_change = OnlineSchemaChange(self, migration_plan, self.online_change_pause)
+        if online_schema_change.run(target_schema):
+            return True
+
+        with self.__create_connection(migration_plan.database) as database_connection:
+            database_connection.alter_table(migration_plan.statement())
+        return True
+
+
     def find_constraint_for_table(self, database, table, column):
         try:
-            database_connection = self.__create_connection(database)
-            return database_connection.describe_constraint_for_column(table, column)
-        except Exception:
+            with self.__create_connection(database) as database_connection:
+                return database_connection.describe_constraint_for_column(table, column)
+        except Exception as e:
+            logger.error("Could not describe constraint on %s: %s", self.name, e)
             return False
         
 
     def find_structure_table(self, database, table):
         try:
-            database_connection = self.__create_connection(database)
-            return database_connection.find_table(table)
-        except Exception:
+            with self.__create_connection(database) as database_connection:
+                return database_connection.find_table(table)
+        except Exception as e:
+            logger.debug("Could not describe table on %s: %s", self.name, e)
             return False
 
     
     def show_create_table(self, database, table):
         try:
-            database_connection = self.__create_connection(database)
-            return database_connection.show_create_table(table)[0][1]
-        except Exception:
+            with self.__create_connection(database) as database_connection:
+                return database_connection.show_create_table(table)[0][1]
+        except Exception as e:
+            logger.error("Could not show table on %s: %s", self.name, e)
             return False
 
 
+    def supports_local_infile(self):
+        '''
+        Whether the server accepts LOAD DATA LOCAL INFILE, checked once.
+        '''
+        if self.load_method == "insert" or self.dbms != "mysql":
+            return False
+
+        if self.local_infile_available is None:
+            try:
+                with self.__create_connection() as database_connection:
+                    self.local_infile_available = bool(int(database_connection.find_global_variable("local_infile")))
+            except Exception as e:
+                logger.warning("Could not check local_infile on %s: %s", self.name, e)
+                self.local_infile_available = False
+
+            if not self.local_infile_available:
+                logger.warning("local_infile is disabled on %s, rows will be inserted", self.name)
+
+        return self.local_infile_available
+
+
+    def sample_health(self, database_connection = None):
+        '''
+        Threads_running and replica lag of the server, None when unknown. A
+        connection held by the caller is used rather than another one from
+        the pool.
+        '''
+        try:
+            if database_connection is not None:
+                return self.__read_health(database_connection)
+            with self.__create_connection() as database_connection:
+                return self.__read_health(database_connection)
+        except Exception as e:
+            logger.warning("Could not sample the health of %s: %s", self.name, e)
+            return None, None
+
+
+    def __read_health(self, database_connection):
+        threads_running = database_connection.find_status_variable("Threads_running")
+        threads_running = int(threads_running) if threads_running is not None else None
+        return threads_running, database_connection.find_replica_lag()
+
+
+    def ddl_counter(self):
+        '''
+        Sum of the DDL statement counters of the server, None when it keeps none.
+        It only tells that some DDL ran since the last sample, on any database.
+        '''
+        try:
+            with self.__create_connection() as database_connection:
+                values = [database_connection.find_status_variable(variable) for variable in DDL_COUNTERS]
+        except Exception as e:
+            logger.debug("Could not read the DDL counters of %s: %s", self.name, e)
+            return None
+
+        if any(value is None for value in values):
+            return None
+        return sum(int(value) for value in values)
+
+
+    def table_activity(self, databases):
+        '''
+        Update time, row estimate and data length of every table, keyed by
+        "database.table", from the same query as the schema snapshot but with
+        fresh statistics.
+        '''
+        if len(databases) == 0:
+            return {}
+
+        with self.__create_connection() as database_connection:
+            rows = database_connection.find_table_activity(databases)
+
+        return {f"{row[0]}.{row[1]}": (str(row[8]), row[4], row[5]) for row in rows}
+
+
+    def checkout(self, database = None):
+        '''
+        Pooled connection kept open by the caller, for work spanning several statements.
+        '''
+        return self.__create_connection(database)
+
+
+    def load_schema_snapshot(self, databases):
+        '''
+        Introspect every given database in one pass over INFORMATION_SCHEMA.
+        '''
+        if len(databases) == 0:
+            return SchemaSnapshot()
+
+        return SchemaSnapshot.build(*self.find_schema_rows(databases))
+
+
+    def find_schema_rows(self, databases):
+        '''
+        Rows of the INFORMATION_SCHEMA tables, columns, constraints and
+        statistics a SchemaSnapshot is built from.
+        '''
+        with self.__create_connection() as database_connection:
+            return (
+                database_connection.find_schema_tables(databases),
+                database_connection.find_schema_columns(databases),
+                database_connection.find_schema_constraints(databases),
+                database_connection.find_schema_statistics(databases),
+            )
+
+
+    def probe_schema(self, databases):
+        '''
+        Change probe of every table, keyed by "database.table".
+        '''
+        if len(databases) == 0:
+            return {}
+
+        with self.__create_connection() as database_connection:
+            rows = database_connection.find_schema_probe(databases)
+
+        return {
+            f"{row[0]}.{row[1]}": "|".join(str(value) for value in row[2:]) for row in rows
+        }
+
+
+    def __read_pool_options(self, data_connection:dict):
+        '''
+        local_infile is only enabled on targets which may load rows with LOAD DATA.
+        '''
+        pool_options = {}
+        if data_connection.get("POOL_SIZE") is not None:
+            pool_options["pool_size"] = int(data_connection.get("POOL_SIZE"))
+        if data_connection.get("MAX_OVERFLOW") is not None:
+            pool_options["max_overflow"] = int(data_connection.get("MAX_OVERFLOW"))
+        if not self.replicated_connection and self.data and self.load_method != "insert":
+            pool_options["connect_args"] = {"local_infile": True}
+
+        return pool_options
+
+
     def __create_connection(self, database = None):
-        return Database(
-            self.dbms, self.host, self.port, self.user, self.password, database
+        return create_database(
+            self.dbms, self.host, self.port, self.user, self.password, database, self.pool_options
         )
\ No newline at end of file
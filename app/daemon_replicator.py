@@ -0,0 +1,185 @@
+import logging
+import signal
+import threading
+
+from app.change_scheduler import ChangeScheduler
+from app.connection_db import Connection
+from app.data_copy import DataCopier
+from app.delta_sync import DeltaSynchronizer
+from app.engine_registry import engine_registry
+from app.instrumentation import instrumentation
+from app.replicator import Replicator
+
+logger = logging.getLogger(__name__)
+
+class DaemonReplicator(Replicator):
+    '''
+    Replicator staying resident (serve), syncing the tables which changed on
+    the source since its last poll.
+    '''
+    def __init__(self, config_file = "connections.json") -> None:
+        super().__init__(config_file)
+        self.source_ddl_counter = None
+        self.source_activity = {}
+
+        daemon = self.config_file.get("DAEMON", {})
+        self.daemon_interval = float(daemon.get("INTERVAL", 30))
+        self.daemon_max_tables = int(daemon.get("MAX_TABLES_PER_CYCLE", 0))
+        self.daemon_heat_half_life = float(daemon.get("HEAT_HALF_LIFE", 600))
+        if self.daemon_interval <= 0 or self.daemon_heat_half_life <= 0:
+            raise ValueError("DAEMON INTERVAL and HEAT_HALF_LIFE must be positive")
+
+
+    def serve(self, max_cycles = None):
+        '''
+        Stay resident: a full pass first, then every INTERVAL seconds a poll of
+        cheap change signals on the source (DDL counters, the schema probe and
+        the update time and size of every table) and a sync of the tables
+        which changed only, hottest first. Engines, the source schema and the
+        journal stay open between cycles. Stops on SIGINT or SIGTERM, or after
+        max_cycles polls.
+        '''
+        scheduler = ChangeScheduler(self.daemon_heat_half_life)
+        stopped = threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+
+        try:
+            self.find_databases_to_replicate()
+            self.__detect_changes(self.replicated_connection.database)
+            try:
+                self.run_pass()
+            except Exception as e:
+                logger.error("First daemon pass failed, only changed tables will be synced: %s", e)
+            if self.source_schema is None:
+                self.load_source_schema()
+                self.associate_tables_to_databases()
+                self.sort_tables_by_dependencies()
+
+            cycles = 0
+            while not stopped.wait(self.daemon_interval):
+                try:
+                    self.__serve_cycle(scheduler)
+                except Exception as e:
+                    logger.error("Daemon cycle failed: %s", e)
+
+                cycles += 1
+                if max_cycles is not None and cycles >= max_cycles:
+                    return
+        except KeyboardInterrupt:
+            logger.info("Daemon stopped")
+        finally:
+            if self.journal is not None:
+                self.journal.close()
+            engine_registry.dispose_all()
+
+
+    def __detect_changes(self, databases):
+        '''
+        Tables, keyed "database.table", whose structure and whose rows changed
+        since the last call. The schema probe is skipped while the DDL counters
+        of the server stay still.
+        '''
+        structure_changes = set()
+        ddl_counter = self.replicated_connection.ddl_counter()
+        if ddl_counter is None or ddl_counter != self.source_ddl_counter:
+            probes = self.replicated_connection.probe_schema(databases)
+            structure_changes = {table for table, probe in probes.items() if self.source_probes.get(table) != probe}
+            self.source_probes = probes
+            self.source_ddl_counter = ddl_counter
+
+        activity = self.replicated_connection.table_activity(databases)
+        data_changes = {table for table, signal in activity.items() if self.source_activity.get(table) != signal}
+        self.source_activity = activity
+        return structure_changes, data_changes
+
+
+    def __serve_cycle(self, scheduler:ChangeScheduler):
+        instrumentation.reset()
+        self.data_reports = []
+        self.drift_reports = {}
+        with instrumentation.span("cycle"):
+            with instrumentation.span("poll"):
+                structure_changes, data_changes = self.__detect_changes(self.replicated_connection.database)
+            scheduler.record(structure_changes, "structure")
+            if any(connection.data for connection in self.other_connections):
+                scheduler.record(data_changes, "data")
+            if not len(scheduler):
+                return
+
+            tables = scheduler.next_tables(self.daemon_max_tables)
+            logger.info(
+                "Syncing %s changed tables, %s left for the next cycles: %s",
+                len(tables), len(scheduler), ", ".join(table for table, _ in tables)
+            )
+
+            structure_tables = {table for table, kinds in tables if "structure" in kinds}
+            databases = sorted({table.split(".", 1)[0] for table in structure_tables})
+            if databases:
+                with instrumentation.span("introspect", databases=databases):
+                    self.source_schema.replace_databases(self.replicated_connection.load_schema_snapshot(databases), databases)
+                    self.associate_tables_to_databases()
+                    self.sort_tables_by_dependencies()
+
+            failed = False
+            for connection in self.other_connections:
+                try:
+                    with instrumentation.span("target", target=connection.name):
+                        self.__sync_changed_tables(connection, tables, structure_tables, databases)
+                except Exception as e:
+                    logger.error("Daemon sync of %s failed: %s", connection.name, e)
+                    failed = True
+
+            if failed:
+                scheduler.requeue(tables)
+
+        for connection in self.other_connections:
+            if self.drift_reports.get(connection.name):
+                self.write_drift_report(connection, [report.to_dict() for report in self.drift_reports[connection.name]])
+        self.write_run_report()
+
+
+    def __sync_changed_tables(self, connection:Connection, tables:list, structure_tables:set, databases:list):
+        '''
+        Diff the changed structures database by database, in dependency order,
+        then sync the rows of the changed tables in the scheduler's order.
+        Tables created with their indexes deferred get them at the end of the
+        cycle, like at the end of a run.
+        '''
+        self.tables_to_replicate[connection.name] = structure_tables
+        if structure_tables:
+            target_schema = connection.load_schema_snapshot(databases)
+            for database in databases:
+                self.replicate_databases(connection, database, target_schema)
+                self.replicate_tables(connection, database, target_schema)
+
+        if connection.data:
+            try:
+                self.__sync_changed_rows(connection, tables)
+            finally:
+                with instrumentation.span("build indexes", target=connection.name):
+                    self.build_deferred_indexes(connection)
+
+        self.complete_connection(connection, databases)
+
+
+    def __sync_changed_rows(self, connection:Connection, tables:list):
+        for table, _ in tables:
+            database, name = table.split(".", 1)
+            table_structure = self.source_schema.get_table(database, name)
+            if table_structure is None or table_structure.table_type != "BASE TABLE":
+                continue
+
+            with instrumentation.span("table data", target=connection.name, table=table):
+                if connection.sync_mode == "full":
+                    self.data_reports.append(
+                        DataCopier(
+                            self.replicated_connection, connection, deferred_tables=self.deferred_tables(connection)
+                        ).copy_table(table_structure)
+                    )
+                else:
+                    synchronizer = DeltaSynchronizer(
+                        self.replicated_connection, connection, check_only=connection.sync_mode == "check"
+                    )
+                    self.drift_reports.setdefault(connection.name, []).append(synchronizer.sync_table(table_structure))
+    
@@ -0,0 +1,307 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.bulk_loader import InsertWriter, LoadDataWriter
+from app.connection_db import Connection
+from app.instrumentation import instrumentation
+from app.key_ranges import find_key_ranges
+from app.row_converter import RowConverter
+from app.schema import Table
+
+logger = logging.getLogger(__name__)
+
+class TableCopyReport:
+    def __init__(self, database, table) -> None:
+        self.database = database
+        self.table = table
+        self.rows = 0
+        self.seconds = 0.0
+        self.lock = threading.Lock()
+
+
+    def add_rows(self, rows):
+        with self.lock:
+            self.rows += rows
+
+
+    @property
+    def rows_per_second(self) -> float:
+        if self.seconds == 0:
+            return float(self.rows)
+        return self.rows / self.seconds
+
+
+    def to_dict(self):
+        return {
+            "database": self.database,
+            "table": self.table,
+            "rows": self.rows,
+            "seconds": round(self.seconds, 3),
+            "rows_per_second": round(self.rows_per_second, 1),
+        }
+
+
+class DataCopier:
+    '''
+    Copy table rows from the source to a target, streaming from the source
+    and writing multi-row INSERT batches so memory stays flat.
+    '''
+    def __init__(self, source:Connection, target:Connection, batch_size = None, journal = None, deferred_tables = ()) -> None:
+        self.source = source
+        self.target = target
+        self.batch_size = batch_size or target.batch_size
+        self.journal = journal
+        self.deferred_tables = deferred_tables
+
+
+    @staticmethod
+    def copy_columns(table:Table):
+        '''
+        Columns that can be written, generated columns are computed by the target.
+        '''
+        return [
+            column.name for column in sorted(table.columns.values(), key=lambda column: column.position)
+            if "GENERATED" not in (column.extra or "").upper()
+        ]
+
+
+    def relaxes_unique_checks(self, table:Table):
+        '''
+        Rows are loaded with UNIQUE_CHECKS=0 only into tables created by the
+        run with their secondary indexes deferred, (database, table) pairs of
+        deferred_tables. Tables which already existed keep their checks.
+        '''
+        return (table.database, table.name) in self.deferred_tables
+
+
+    def create_writer(self, table:Table, columns = None):
+        '''
+        LOAD DATA LOCAL INFILE when the target allows it, batched INSERTs
+        otherwise, both converting rows with a converter compiled for the
+        columns written.
+        '''
+        converter = RowConverter.for_table(table, columns or self.copy_columns(table))
+        if self.target.supports_local_infile():
+            return LoadDataWriter(converter)
+        return InsertWriter(converter)
+
+
+    def write_rows(self, writer, target_connection, table:Table, columns, rows):
+        '''
+        Write a batch, falling back to INSERTs when the server refuses LOAD DATA.
+        '''
+        try:
+            writer.write(target_connection, table.name, columns, rows)
+            return writer
+        except Exception as e:
+            if not isinstance(writer, LoadDataWriter):
+                raise
+
+            logger.warning("LOAD DATA failed on %s, falling back to INSERT: %s", self.target.name, e)
+            self.target.local_infile_available = False
+            writer.close()
+            writer = InsertWriter(writer.converter)
+            writer.write(target_connection, table.name, columns, rows)
+            return writer
+
+
+    def copy_table(self, table:Table):
+        report = TableCopyReport(table.database, table.name)
+        columns = self.copy_columns(table)
+        key_columns = table.primary_key()
+        started_at = time.perf_counter()
+
+        status, key_ranges, completed = None, None, set()
+        if self.journal is not None:
+            status, key_ranges, completed = self.journal.table_state(self.target.name, table.database, table.name)
+
+        if status == "done":
+            logger.info("Skipping %s.%s, copied before the previous run stopped", table.database, table.name)
+            return report
+
+        if key_columns and (self.journal is not None or self.__copies_in_parallel(table, key_columns)):
+            if status is None:
+                self.clear_table(table)
+                key_ranges = self.__find_key_ranges(table, key_columns)
+                if self.journal is not None:
+                    self.journal.start_table(self.target.name, table.database, table.name, key_ranges)
+            else:
+                logger.info(
+                    "Resuming %s.%s: %s/%s ranges already copied", table.database, table.name, len(completed), len(key_ranges)
+                )
+            self.__copy_ranges(table, columns, key_columns, key_ranges, completed, report)
+        else:
+            self.clear_table(table)
+            if self.journal is not None:
+                self.journal.start_table(self.target.name, table.database, table.name, [])
+            self.__copy_range(table, columns, key_columns, None, report)
+
+        if self.journal is not None:
+            self.journal.finish_table(self.target.name, table.database, table.name)
+
+        report.seconds = time.perf_counter() - started_at
+        logger.info(
+            "Copied %s.%s: %s rows in %.2fs (%.1f rows/s)",
+            table.database, table.name, report.rows, report.seconds, report.rows_per_second
+        )
+
+        return report
+
+
+    def copy_range(self, table:Table, key_range):
+        '''
+        Replace one primary key range of the target table with the source rows,
+        for copies split across processes.
+        '''
+        report = TableCopyReport(table.database, table.name)
+        started_at = time.perf_counter()
+        self.__copy_range(table, self.copy_columns(table), table.primary_key(), key_range, report)
+        report.seconds = time.perf_counter() - started_at
+        return report
+
+
+    def __copies_in_parallel(self, table:Table, key_columns):
+        threshold = self.target.parallel_copy_threshold
+        return bool(key_columns) and self.target.parallel_copy_workers > 1 and 0 < threshold <= table.rows
+
+
+    def clear_table(self, table:Table):
+        with self.target.checkout(table.database) as target_connection:
+            target_connection.set_session_variable("FOREIGN_KEY_CHECKS", 0)
+            try:
+                target_connection.delete_rows(table.name)
+                target_connection.commit()
+            finally:
+                target_connection.set_session_variable("FOREIGN_KEY_CHECKS", 1)
+
+
+    def __find_key_ranges(self, table:Table, key_columns):
+        chunk_size = self.target.chunk_size
+        if self.__copies_in_parallel(table, key_columns):
+            chunk_size = max(chunk_size, table.rows // (self.target.parallel_copy_workers * 4))
+
+        with self.source.checkout(table.database) as source_connection:
+            return find_key_ranges(source_connection, table.name, key_columns, chunk_size)
+
+
+    def __copy_ranges(self, table:Table, columns, key_columns, key_ranges, completed, report):
+        '''
+        Copy the primary key ranges not completed yet, by several workers, each
+        with its own source and target connection, when the table is large.
+        '''
+        workers = self.target.parallel_copy_workers if self.__copies_in_parallel(table, key_columns) else 1
+        progress = RangeProgress(table, key_ranges, completed)
+        pending = [position for position in range(len(key_ranges)) if position not in completed]
+        logger.info(
+            "Copying %s.%s in %s ranges with %s workers", table.database, table.name, len(pending), workers
+        )
+
+        def copy_range(position):
+            rows = self.__copy_range(table, columns, key_columns, key_ranges[position], report)
+            if self.journal is not None:
+                self.journal.complete_range(self.target.name, table.database, table.name, position, rows)
+            progress.complete(position, rows)
+
+        if workers == 1:
+            for position in pending:
+                copy_range(position)
+            return
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(instrumentation.bind(copy_range), pending))
+
+
+    def __copy_range(self, table:Table, columns, key_columns, key_range, report):
+        '''
+        Stream one key range, or the whole table without a range, to the target.
+        '''
+        throttle = self.target.throttle
+        batch_size = throttle.current_batch_size() if throttle is not None else self.batch_size
+
+        with self.source.checkout(table.database) as source_connection:
+            if key_range is None:
+                batches = source_connection.stream_rows(table.name, columns, batch_size)
+            else:
+                batches = source_connection.stream_range(table.name, columns, key_columns, key_range, batch_size)
+
+            return self.write_batches(table, columns, batches, report, key_columns, key_range)
+
+
+    def write_batches(self, table:Table, columns, batches, report, key_columns = None, key_range = None):
+        '''
+        Write row batches to the target table. A key range replaces the target
+        rows of the range and is committed as a single transaction, so writing
+        it again after a failure is safe; other batches are committed one by one.
+        '''
+        writer = self.create_writer(table, columns)
+        throttle = self.target.throttle
+        relaxes_unique_checks = self.relaxes_unique_checks(table)
+        copied_rows = 0
+
+        with self.target.checkout(table.database) as target_connection:
+            target_connection.set_session_variable("FOREIGN_KEY_CHECKS", 0)
+            if relaxes_unique_checks:
+                target_connection.set_session_variable("UNIQUE_CHECKS", 0)
+            try:
+                if key_range is not None:
+                    target_connection.delete_range(table.name, key_columns, key_range)
+
+                for rows in batches:
+                    written_at = time.perf_counter()
+                    writer = self.write_rows(writer, target_connection, table, columns, rows)
+                    if key_range is None:
+                        target_connection.commit()
+                    copied_rows += len(rows)
+                    report.add_rows(len(rows))
+                    instrumentation.add_rows(len(rows))
+                    if throttle is not None:
+                        throttle.wait(time.perf_counter() - written_at, target_connection)
+
+                target_connection.commit()
+            finally:
+                writer.close()
+                target_connection.set_session_variable("FOREIGN_KEY_CHECKS", 1)
+                if relaxes_unique_checks:
+                    target_connection.set_session_variable("UNIQUE_CHECKS", 1)
+
+        return copied_rows
+
+
+class RangeProgress:
+    '''
+    Track the ranges of a table copy. The watermark is the upper bound of
+    the longest prefix of ranges that are all complete.
+    '''
+    def __init__(self, table:Table, key_ranges, completed = ()) -> None:
+        self.table = table
+        self.key_ranges = key_ranges
+        self.completed = [position in completed for position in range(len(key_ranges))]
+        self.completed_prefix = 0
+        self.rows = 0
+        self.lock = threading.Lock()
+
+        while self.completed_prefix < len(self.completed) and self.completed[self.completed_prefix]:
+            self.completed_prefix += 1
+
+
+    @property
+    def watermark(self):
+        if self.completed_prefix == 0:
+            return None
+        return self.key_ranges[self.completed_prefix - 1].upper
+
+
+    def complete(self, position, rows):
+        with self.lock:
+            self.completed[position] = True
+            self.rows += rows
+            while self.completed_prefix < len(self.completed) and self.completed[self.completed_prefix]:
+                self.completed_prefix += 1
+
+            logger.info(
+                "%s.%s: %s/%s ranges copied, %s rows, complete up to key %s",
+                self.table.database, self.table.name, self.completed.count(True), len(self.completed),
+                self.rows, self.watermark
+            )
@@ -1,19 +1,47 @@
 import logging
 
-from sqlalchemy import create_engine, text
+from sqlalchemy import bindparam, text
+
+from app.engine_registry import engine_registry
+from app.key_ranges import order_by
 
 class Database:
-    def __init__(self, dbms, host, port, user, password, database = None) -> None:
+    combined_alter = True
+    alter_definitions = True
+
+    def __init__(self, dbms, host, port, user, password, database = None, pool_options = None) -> None:
         self.connection = None
+        self.database = database
         driver = self.__verify_driver(dbms)
         
         self.database_url = f"{dbms}+{driver}://{user}:{password}@{host}:{port}"
-        if database:
-            self.database_url = f"{self.database_url}/{database}"
+        self.engine = engine_registry.get_engine(self.database_url, pool_options)
         
         self.create_connection()
 
 
+    @classmethod
+    def bind(cls, connection, database = None):
+        '''
+        Database running its statements on an already open connection, such as
+        the synchronous facade of an async connection.
+        '''
+        database_connection = cls.__new__(cls)
+        database_connection.connection = connection
+        database_connection.database = database
+        database_connection.database_url = None
+        database_connection.engine = None
+        return database_connection
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
     def __verify_driver(self, dbms):
         '''
         Verify if driver is available for the given DBMS.
@@ -29,18 +57,38 @@ class Database:
 
 
     def create_connection(self):
+        '''
+        Check out a connection from the shared pool and select the database.
+        '''
         try:
-            engine = create_engine(self.database_url)
-            self.connection = engine.connect()
+            self.connection = self.engine.connect()
+            if self.database:
+                self.use_database(self.database)
 
         except Exception as e:
+            self.close()
             raise ValueError(f"Error creating connection: {e}")
+
+
+    def use_database(self, database):
+        self.connection.execute(text(f"USE `{database}`"))
+        self.database = database
+
+
+    def close(self):
+        '''
+        Return the connection to the pool.
+        '''
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
         
 
+
     def find_databases(self):
         try:
             sql = text("SHOW DATABASES")
-            return self.connection.execute(sql)
+            return self.connection.execute(sql).fetchall()
         except Exception as e:
             raise ValueError(f"Error searching databases: {e}")
         
@@ -48,7 +96,7 @@ class Database:
     def show_tables(self):
         try:
             sql = text("SHOW TABLES")
-            return self.connection.execute(sql)
+            return self.connection.execute(sql).fetchall()
         except Exception as e:
             raise ValueError(f"Error searching databases: {e}")
         
@@ -85,6 +133,22 @@ class Database:
             raise ValueError(f"Error creating databases: {e}")
         
     
+    def alter_table(self, statement):
+        try:
+            sql = text(statement)
+            return self.connection.execute(sql)
+        except Exception as e:
+            raise ValueError(f"Error altering table: {e}")
+
+
+    def execute_ddl(self, statement):
+        try:
+            sql = text(statement)
+            return self.connection.execute(sql)
+        except Exception as e:
+            raise ValueError(f"Error executing statement: {e}")
+
+
     def drop_column(self, table, column):
         try:
             sql = text(f"ALTER TABLE {table} DROP COLUMN {column}")
@@ -150,4 +214,481 @@ class Database:
             
             return resultado.fetchall()
         except Exception as e:
-            raise ValueError(f"Error searching table: {e}")
\ No newline at end of file
+            raise ValueError(f"Error searching table: {e}")
+
+
+    def find_schema_tables(self, databases):
+        try:
+            sql = text("""
+                SELECT
+                    TABLE_SCHEMA, TABLE_NAME, TABLE_TYPE, ENGINE, TABLE_ROWS,
+                    DATA_LENGTH, INDEX_LENGTH, CREATE_TIME, UPDATE_TIME
+                FROM
+                    INFORMATION_SCHEMA.TABLES
+                WHERE
+                    TABLE_SCHEMA IN :databases
+                ORDER BY
+                    TABLE_SCHEMA, TABLE_NAME
+            """).bindparams(bindparam("databases", expanding=True))
+            return self.connection.execute(sql, {"databases": list(databases)}).fetchall()
+        except Exception as e:
+            raise ValueError(f"Error searching schema: {e}")
+
+
+    def find_table_activity(self, databases):
+        '''
+        Rows of find_schema_tables read past the statistics cache of MySQL 8,
+        which keeps TABLE_ROWS, DATA_LENGTH and UPDATE_TIME for
+        information_schema_stats_expiry seconds (a day by default). Servers
+        without the variable do not cache them.
+        '''
+        try:
+            self.connection.execute(text("SET SESSION information_schema_stats_expiry = 0"))
+        except Exception:
+            return self.find_schema_tables(databases)
+
+        try:
+            return self.find_schema_tables(databases)
+        finally:
+            self.connection.execute(text("SET SESSION information_schema_stats_expiry = DEFAULT"))
+
+
+    def find_schema_columns(self, databases):
+        try:
+            sql = text("""
+                SELECT
+                    TABLE_SCHEMA, TABLE_NAME, COLUMN_NAME, COLUMN_TYPE, IS_NULLABLE,
+                    COLUMN_KEY, COLUMN_DEFAULT, EXTRA, ORDINAL_POSITION
+                FROM
+                    INFORMATION_SCHEMA.COLUMNS
+                WHERE
+                    TABLE_SCHEMA IN :databases
+                ORDER BY
+                    TABLE_SCHEMA, TABLE_NAME, ORDINAL_POSITION
+            """).bindparams(bindparam("databases", expanding=True))
+            return self.connection.execute(sql, {"databases": list(databases)}).fetchall()
+        except Exception as e:
+            raise ValueError(f"Error searching schema: {e}")
+
+
+    def find_schema_constraints(self, databases):
+        try:
+            sql = text("""
+                SELECT
+                    kcu.TABLE_SCHEMA,
+                    kcu.TABLE_NAME,
+                    kcu.CONSTRAINT_NAME,
+                    tc.CONSTRAINT_TYPE,
+                    kcu.COLUMN_NAME,
+                    kcu.REFERENCED_TABLE_NAME,
+                    kcu.REFERENCED_COLUMN_NAME,
+                    rc.UPDATE_RULE,
+                    rc.DELETE_RULE
+                FROM
+                    INFORMATION_SCHEMA.KEY_COLUMN_USAGE kcu
+                JOIN
+                    INFORMATION_SCHEMA.TABLE_CONSTRAINTS tc
+                ON
+                    kcu.CONSTRAINT_SCHEMA = tc.CONSTRAINT_SCHEMA
+                    AND kcu.CONSTRAINT_NAME = tc.CONSTRAINT_NAME
+                    AND kcu.TABLE_NAME = tc.TABLE_NAME
+                LEFT JOIN
+                    INFORMATION_SCHEMA.REFERENTIAL_CONSTRAINTS rc
+                ON
+                    kcu.CONSTRAINT_SCHEMA = rc.CONSTRAINT_SCHEMA
+                    AND kcu.CONSTRAINT_NAME = rc.CONSTRAINT_NAME
+                    AND kcu.TABLE_NAME = rc.TABLE_NAME
+                WHERE
+                    kcu.TABLE_SCHEMA IN :databases
+                ORDER BY
+                    kcu.TABLE_SCHEMA,
+                    kcu.TABLE_NAME,
+                    kcu.CONSTRAINT_NAME,
+                    kcu.ORDINAL_POSITION
+            """).bindparams(bindparam("databases", expanding=True))
+            return self.connection.execute(sql, {"databases": list(databases)}).fetchall()
+        except Exception as e:
+            raise ValueError(f"Error searching schema: {e}")
+
+
+    def find_schema_statistics(self, databases):
+        try:
+            sql = text("""
+                SELECT
+                    TABLE_SCHEMA, TABLE_NAME, INDEX_NAME, NON_UNIQUE, COLUMN_NAME, INDEX_TYPE
+                FROM
+                    INFORMATION_SCHEMA.STATISTICS
+                WHERE
+                    TABLE_SCHEMA IN :databases
+                ORDER BY
+                    TABLE_SCHEMA, TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX
+            """).bindparams(bindparam("databases", expanding=True))
+            return self.connection.execute(sql, {"databases": list(databases)}).fetchall()
+        except Exception as e:
+            raise ValueError(f"Error searching schema: {e}")
+
+
+    def find_schema_probe(self, databases):
+        '''
+        One row per table with its creation time and checksums of its columns,
+        indexes and constraints, cheap enough to run on every execution.
+        '''
+        try:
+            sql = text("""
+                SELECT
+                    t.TABLE_SCHEMA,
+                    t.TABLE_NAME,
+                    t.CREATE_TIME,
+                    c.COLUMN_COUNT,
+                    c.COLUMN_CHECKSUM,
+                    s.INDEX_CHECKSUM,
+                    k.CONSTRAINT_CHECKSUM
+                FROM
+                    INFORMATION_SCHEMA.TABLES t
+                LEFT JOIN (
+                    SELECT
+                        TABLE_SCHEMA, TABLE_NAME, COUNT(*) AS COLUMN_COUNT,
+                        SUM(CRC32(CONCAT_WS('|', COLUMN_NAME, ORDINAL_POSITION, COLUMN_TYPE, IS_NULLABLE,
+                            COLUMN_KEY, COALESCE(COLUMN_DEFAULT, 'NULL'), EXTRA))) AS COLUMN_CHECKSUM
+                    FROM INFORMATION_SCHEMA.COLUMNS
+                    WHERE TABLE_SCHEMA IN :column_databases
+                    GROUP BY TABLE_SCHEMA, TABLE_NAME
+                ) c
+                ON
+                    t.TABLE_SCHEMA = c.TABLE_SCHEMA AND t.TABLE_NAME = c.TABLE_NAME
+                LEFT JOIN (
+                    SELECT
+                        TABLE_SCHEMA, TABLE_NAME,
+                        SUM(CRC32(CONCAT_WS('|', INDEX_NAME, NON_UNIQUE, SEQ_IN_INDEX, COLUMN_NAME))) AS INDEX_CHECKSUM
+                    FROM INFORMATION_SCHEMA.STATISTICS
+                    WHERE TABLE_SCHEMA IN :index_databases
+                    GROUP BY TABLE_SCHEMA, TABLE_NAME
+                ) s
+                ON
+                    t.TABLE_SCHEMA = s.TABLE_SCHEMA AND t.TABLE_NAME = s.TABLE_NAME
+                LEFT JOIN (
+                    SELECT
+                        TABLE_SCHEMA, TABLE_NAME,
+                        SUM(CRC32(CONCAT_WS('|', CONSTRAINT_NAME, COLUMN_NAME, ORDINAL_POSITION,
+                            REFERENCED_TABLE_NAME, REFERENCED_COLUMN_NAME))) AS CONSTRAINT_CHECKSUM
+                    FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE
+                    WHERE TABLE_SCHEMA IN :constraint_databases
+                    GROUP BY TABLE_SCHEMA, TABLE_NAME
+                ) k
+                ON
+                    t.TABLE_SCHEMA = k.TABLE_SCHEMA AND t.TABLE_NAME = k.TABLE_NAME
+                WHERE
+                    t.TABLE_SCHEMA IN :databases
+            """).bindparams(
+                bindparam("databases", expanding=True),
+                bindparam("column_databases", expanding=True),
+                bindparam("index_databases", expanding=True),
+                bindparam("constraint_databases", expanding=True),
+            )
+            databases = list(databases)
+            return self.connection.execute(sql, {
+                "databases": databases,
+                "column_databases": databases,
+                "index_databases": databases,
+                "constraint_databases": databases,
+            }).fetchall()
+        except Exception as e:
+            raise ValueError(f"Error searching schema: {e}")
+
+
+    def stream_rows(self, table, columns, batch_size):
+        '''
+        Read a table through a server-side cursor, yielding batches of rows.
+        batch_size may be a callable, read again before every batch.
+        '''
+        try:
+            select_columns = ", ".join(f"`{column}`" for column in columns)
+            sql = text(f"SELECT {select_columns} FROM `{table}`")
+            result = self.connection.execution_options(
+                stream_results=True, max_row_buffer=self.__batch_size(batch_size)
+            ).execute(sql)
+
+            yield from self.__fetch_batches(result, batch_size)
+        except Exception as e:
+            raise ValueError(f"Error reading rows: {e}")
+
+
+    def __batch_size(self, batch_size):
+        return batch_size() if callable(batch_size) else batch_size
+
+
+    def __fetch_batches(self, result, batch_size):
+        while True:
+            rows = result.fetchmany(self.__batch_size(batch_size))
+            if not rows:
+                return
+            yield rows
+
+
+    def stream_range(self, table, columns, key_columns, key_range, batch_size):
+        '''
+        Read a primary key range through a server-side cursor, in key order.
+        '''
+        try:
+            condition, parameters = key_range.predicate(key_columns)
+            select_columns = ", ".join(f"`{column}`" for column in columns)
+            sql = text(f"""
+                SELECT {select_columns} FROM `{table}`
+                WHERE {condition}
+                ORDER BY {order_by(key_columns)}
+            """)
+            result = self.connection.execution_options(
+                stream_results=True, max_row_buffer=self.__batch_size(batch_size)
+            ).execute(sql, parameters)
+
+            yield from self.__fetch_batches(result, batch_size)
+        except Exception as e:
+            raise ValueError(f"Error reading rows: {e}")
+
+
+    def copy_range_into(self, table, source_table, columns, key_columns, key_range):
+        '''
+        Copy a primary key range of another table of the database with INSERT
+        IGNORE ... SELECT, rows already written by triggers are kept.
+        '''
+        try:
+            condition, parameters = key_range.predicate(key_columns)
+            select_columns = ", ".join(f"`{column}`" for column in columns)
+            sql = text(f"""
+                INSERT IGNORE INTO `{table}` ({select_columns})
+                SELECT {select_columns} FROM `{source_table}`
+                WHERE {condition}
+                LOCK IN SHARE MODE
+            """)
+            return self.connection.execute(sql, parameters)
+        except Exception as e:
+            raise ValueError(f"Error copying rows: {e}")
+
+
+    def create_table_like(self, table, source_table):
+        try:
+            return self.connection.execute(text(f"CREATE TABLE `{table}` LIKE `{source_table}`"))
+        except Exception as e:
+            raise ValueError(f"Error creating table: {e}")
+
+
+    def create_replay_triggers(self, table, shadow_table, triggers, columns, key_columns):
+        '''
+        Triggers replaying on shadow_table the writes made to table, triggers
+        naming the one of each of INSERT, UPDATE and DELETE.
+        '''
+        column_list = ", ".join(f"`{column}`" for column in columns)
+        new_values = ", ".join(f"NEW.`{column}`" for column in columns)
+        key_list = ", ".join(f"`{column}`" for column in key_columns)
+        old_key = ", ".join(f"OLD.`{column}`" for column in key_columns)
+        replace = f"REPLACE INTO `{shadow_table}` ({column_list}) VALUES ({new_values})"
+        delete = f"DELETE IGNORE FROM `{shadow_table}` WHERE ({key_list}) = ({old_key})"
+
+        try:
+            self.connection.execute(text(f"CREATE TRIGGER `{triggers['INSERT']}` AFTER INSERT ON `{table}` FOR EACH ROW {replace}"))
+            self.connection.execute(text(
+                f"CREATE TRIGGER `{triggers['UPDATE']}` AFTER UPDATE ON `{table}` FOR EACH ROW BEGIN {delete}; {replace}; END"
+            ))
+            self.connection.execute(text(f"CREATE TRIGGER `{triggers['DELETE']}` AFTER DELETE ON `{table}` FOR EACH ROW {delete}"))
+        except Exception as e:
+            raise ValueError(f"Error creating triggers: {e}")
+
+
+    def swap_tables(self, table, shadow_table, old_table):
+        '''
+        Put shadow_table in the place of table in one statement, table being
+        kept as old_table.
+        '''
+        try:
+            return self.connection.execute(text(
+                f"RENAME TABLE `{table}` TO `{old_table}`, `{shadow_table}` TO `{table}`"
+            ))
+        except Exception as e:
+            raise ValueError(f"Error renaming tables: {e}")
+
+
+    def insert_rows(self, table, columns, rows):
+        '''
+        Insert a batch of tuples with a single multi-row INSERT. The statement
+        goes straight to the driver with positional parameters, so no
+        parameter dictionary is built per row.
+        '''
+        try:
+            placeholder = "?" if self.connection.dialect.paramstyle == "qmark" else "%s"
+            if placeholder == "%s":
+                table, columns = table.replace("%", "%%"), [column.replace("%", "%%") for column in columns]
+            insert_columns = ", ".join(f"`{column}`" for column in columns)
+            values = ", ".join(placeholder for _ in columns)
+            sql = f"INSERT INTO `{table}` ({insert_columns}) VALUES ({values})"
+            return self.connection.exec_driver_sql(sql, rows)
+        except Exception as e:
+            raise ValueError(f"Error inserting rows: {e}")
+
+
+    def load_data_infile(self, table, columns, path, binary_columns = ()):
+        '''
+        Load a tab separated file written by the client. Binary columns are
+        sent as hex and decoded with UNHEX.
+        '''
+        try:
+            targets = []
+            assignments = []
+            for position, column in enumerate(columns):
+                if column in binary_columns:
+                    targets.append(f"@c{position}")
+                    assignments.append(f"`{column}` = UNHEX(@c{position})")
+                else:
+                    targets.append(f"`{column}`")
+
+            sql = f"""
+                LOAD DATA LOCAL INFILE :path INTO TABLE `{table}`
+                CHARACTER SET utf8mb4
+                FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\'
+                LINES TERMINATED BY '\\n'
+                ({', '.join(targets)})
+            """
+            if assignments:
+                sql = f"{sql} SET {', '.join(assignments)}"
+            return self.connection.execute(text(sql), {"path": path})
+        except Exception as e:
+            raise ValueError(f"Error loading rows: {e}")
+
+
+    def find_global_variable(self, variable):
+        try:
+            sql = text(f"SELECT @@GLOBAL.{variable}")
+            return self.connection.execute(sql).scalar()
+        except Exception as e:
+            raise ValueError(f"Error reading variable: {e}")
+
+
+    def find_status_variable(self, variable):
+        try:
+            sql = text("SHOW GLOBAL STATUS LIKE :variable")
+            row = self.connection.execute(sql, {"variable": variable}).fetchone()
+            return row[1] if row is not None else None
+        except Exception as e:
+            raise ValueError(f"Error reading status: {e}")
+
+
+    def find_replica_lag(self):
+        '''
+        Seconds behind the source, None when the server is not a replica or
+        its SQL thread is stopped.
+        '''
+        for statement, column in (("SHOW REPLICA STATUS", "Seconds_Behind_Source"), ("SHOW SLAVE STATUS", "Seconds_Behind_Master")):
+            try:
+                row = self.connection.execute(text(statement)).mappings().fetchone()
+            except Exception:
+                continue
+            return row.get(column) if row is not None else None
+
+        raise ValueError("Error reading replica status")
+
+
+    def delete_rows(self, table):
+        try:
+            sql = text(f"DELETE FROM `{table}`")
+            return self.connection.execute(sql)
+        except Exception as e:
+            raise ValueError(f"Error deleting rows: {e}")
+
+
+    def delete_range(self, table, key_columns, key_range):
+        try:
+            condition, parameters = key_range.predicate(key_columns)
+            sql = text(f"DELETE FROM `{table}` WHERE {condition}")
+            return self.connection.execute(sql, parameters)
+        except Exception as e:
+            raise ValueError(f"Error deleting rows: {e}")
+
+
+    def set_session_variable(self, variable, value):
+        try:
+            sql = text(f"SET SESSION {variable} = {int(value)}")
+            return self.connection.execute(sql)
+        except Exception as e:
+            raise ValueError(f"Error setting session variable: {e}")
+
+
+    def find_key_at_offset(self, table, key_columns, key_range, offset):
+        '''
+        Primary key of the row at the given offset inside a key range.
+        '''
+        try:
+            condition, parameters = key_range.predicate(key_columns)
+            sql = text(f"""
+                SELECT {order_by(key_columns)} FROM `{table}`
+                WHERE {condition}
+                ORDER BY {order_by(key_columns)}
+                LIMIT 1 OFFSET {int(offset)}
+            """)
+            row = self.connection.execute(sql, parameters).fetchone()
+            return tuple(row) if row is not None else None
+        except Exception as e:
+            raise ValueError(f"Error searching keys: {e}")
+
+
+    def checksum_range(self, table, columns, key_columns, key_range):
+        '''
+        Row count and XOR of the CRC32 of every row of a key range.
+        '''
+        try:
+            condition, parameters = key_range.predicate(key_columns)
+            quoted_columns = [f"`{column}`" for column in columns]
+            null_flags = ", ".join(f"ISNULL({column})" for column in quoted_columns)
+            sql = text(f"""
+                SELECT
+                    COUNT(*),
+                    COALESCE(BIT_XOR(CRC32(CONCAT_WS('#', {', '.join(quoted_columns)}, CONCAT({null_flags})))), 0)
+                FROM `{table}`
+                WHERE {condition}
+            """)
+            count, checksum = self.connection.execute(sql, parameters).fetchone()
+            return int(count), int(checksum)
+        except Exception as e:
+            raise ValueError(f"Error checksumming rows: {e}")
+
+
+    def fetch_range(self, table, columns, key_columns, key_range):
+        try:
+            condition, parameters = key_range.predicate(key_columns)
+            select_columns = ", ".join(f"`{column}`" for column in columns)
+            sql = text(f"""
+                SELECT {select_columns} FROM `{table}`
+                WHERE {condition}
+                ORDER BY {order_by(key_columns)}
+            """)
+            return self.connection.execute(sql, parameters).fetchall()
+        except Exception as e:
+            raise ValueError(f"Error reading rows: {e}")
+
+
+    def upsert_rows(self, table, columns, rows):
+        try:
+            insert_columns = ", ".join(f"`{column}`" for column in columns)
+            values = ", ".join(f":c{position}" for position in range(len(columns)))
+            updates = ", ".join(f"`{column}` = VALUES(`{column}`)" for column in columns)
+            sql = text(f"INSERT INTO `{table}` ({insert_columns}) VALUES ({values}) ON DUPLICATE KEY UPDATE {updates}")
+            parameters = [
+                {f"c{position}": value for position, value in enumerate(row)} for row in rows
+            ]
+            return self.connection.execute(sql, parameters)
+        except Exception as e:
+            raise ValueError(f"Error upserting rows: {e}")
+
+
+    def delete_keys(self, table, key_columns, keys):
+        try:
+            condition = " AND ".join(f"`{column}` = :k{position}" for position, column in enumerate(key_columns))
+            sql = text(f"DELETE FROM `{table}` WHERE {condition}")
+            parameters = [
+                {f"k{position}": value for position, value in enumerate(key)} for key in keys
+            ]
+            return self.connection.execute(sql, parameters)
+        except Exception as e:
+            raise ValueError(f"Error deleting rows: {e}")
+
+
+    def commit(self):
+        self.connection.commit()
\ No newline at end of file
@@ -0,0 +1,139 @@
+from app.schema import Constraint
+
+def quote_columns(columns):
+    return ", ".join(f"`{column}`" for column in columns)
+
+
+def foreign_key_clause(constraint:Constraint):
+    return (
+        f"ADD CONSTRAINT `{constraint.name}` FOREIGN KEY ({quote_columns(constraint.columns)}) "
+        f"REFERENCES `{constraint.referenced_table}` ({quote_columns(constraint.referenced_columns)}) "
+        f"ON DELETE {constraint.on_delete or 'RESTRICT'} ON UPDATE {constraint.on_update or 'RESTRICT'}"
+    )
+
+
+def split_definitions(script_creation):
+    '''
+    Split a CREATE TABLE script into the text before its definitions, the
+    definitions, and the text after them. Definitions are separated by the
+    commas outside parentheses and quotes, whether the script puts one per
+    line, as SHOW CREATE TABLE does, or all on one line.
+    '''
+    start = script_creation.index("(")
+    definitions = []
+    depth, quote, begin = 0, None, start + 1
+
+    for position in range(start + 1, len(script_creation)):
+        character = script_creation[position]
+        if quote:
+            if character == quote:
+                quote = None
+        elif character in "`'\"":
+            quote = character
+        elif character == "(":
+            depth += 1
+        elif character == ")" and depth:
+            depth -= 1
+        elif character in ",)":
+            definitions.append(script_creation[begin:position])
+            begin = position + 1
+            if character == ")":
+                return script_creation[:start + 1], definitions, script_creation[position:]
+
+    raise ValueError("Unbalanced parentheses in CREATE TABLE script")
+
+
+def remove_definitions(script_creation, should_remove):
+    '''
+    Remove definitions of a CREATE TABLE script, keeping the commas between
+    the remaining definitions valid and the layout of the script.
+    '''
+    header, definitions, footer = split_definitions(script_creation)
+    kept = [definition for definition in definitions if not should_remove(definition.strip())]
+    if not kept:
+        raise ValueError("Removing every definition of a CREATE TABLE script")
+
+    body = [definition.rstrip() for definition in kept]
+    body[0] = definitions[0][:len(definitions[0]) - len(definitions[0].lstrip())] + body[0].lstrip()
+    trailing = definitions[-1][len(definitions[-1].rstrip()):]
+    return header + ",".join(body) + trailing + footer
+
+
+def remove_foreign_keys(script_creation, constraint_names):
+    names = {f"CONSTRAINT `{name}` FOREIGN KEY" for name in constraint_names}
+    return remove_definitions(
+        script_creation, lambda line: any(line.startswith(name) for name in names)
+    )
+
+
+def column_definition(column):
+    '''
+    Column definition for ALTER TABLE from a DESCRIBE-like row.
+    '''
+    name, column_type, nullable, _, default, extra = column
+    extra = extra or ""
+    definition = [f"`{name}`", column_type]
+
+    if nullable != "YES":
+        definition.append("NOT NULL")
+
+    if default is not None:
+        if "DEFAULT_GENERATED" in extra.upper():
+            definition.append(f"DEFAULT {default}")
+        else:
+            escaped_default = str(default).replace("\\", "\\\\").replace("'", "''")
+            definition.append(f"DEFAULT '{escaped_default}'")
+
+    extra = " ".join(word for word in extra.split() if word.upper() != "DEFAULT_GENERATED")
+    if extra:
+        definition.append(extra)
+
+    return " ".join(definition)
+
+
+def constraint_change(constraint:Constraint):
+    '''
+    Kind and clause adding a constraint, as expected by MigrationPlan.add.
+    '''
+    if constraint.constraint_type == "FOREIGN KEY":
+        return "ADD FOREIGN KEY", foreign_key_clause(constraint)
+    if constraint.constraint_type == "PRIMARY KEY":
+        return "ADD PRIMARY KEY", f"ADD PRIMARY KEY ({quote_columns(constraint.columns)})"
+    if constraint.constraint_type == "UNIQUE":
+        return "ADD INDEX", f"ADD CONSTRAINT `{constraint.name}` UNIQUE ({quote_columns(constraint.columns)})"
+
+    return None
+
+
+def drop_constraint_change(constraint:Constraint):
+    if constraint.constraint_type == "FOREIGN KEY":
+        return "DROP FOREIGN KEY", f"DROP FOREIGN KEY `{constraint.name}`"
+    if constraint.constraint_type == "PRIMARY KEY":
+        return "DROP PRIMARY KEY", "DROP PRIMARY KEY"
+    if constraint.constraint_type == "UNIQUE":
+        return "DROP INDEX", f"DROP INDEX `{constraint.name}`"
+
+    return None
+
+
+def split_secondary_definitions(script_creation, keep_columns = ()):
+    '''
+    Separate secondary indexes and foreign keys from a SHOW CREATE TABLE
+    script. Returns the script keeping only the primary key, and the
+    (kind, clause) changes adding the removed definitions back. Indexes
+    covering one of keep_columns, such as AUTO_INCREMENT columns, are kept.
+    '''
+    index_prefixes = ("KEY ", "UNIQUE KEY ", "FULLTEXT KEY ", "SPATIAL KEY ")
+    quoted_keep_columns = [f"`{column}`" for column in keep_columns]
+    changes = []
+
+    def is_secondary(line):
+        if line.startswith("CONSTRAINT ") and " FOREIGN KEY " in line:
+            changes.append(("ADD FOREIGN KEY", f"ADD {line.rstrip(',')}"))
+            return True
+        if line.startswith(index_prefixes) and not any(column in line for column in quoted_keep_columns):
+            changes.append(("ADD INDEX", f"ADD {line.rstrip(',')}"))
+            return True
+        return False
+
+    return remove_definitions(script_creation, is_secondary), changes
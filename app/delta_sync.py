@@ -0,0 +1,149 @@
+import logging
+import time
+
+from app.connection_db import Connection
+from app.data_copy import DataCopier
+from app.instrumentation import instrumentation
+from app.key_ranges import find_key_ranges
+from app.schema import Table
+
+logger = logging.getLogger(__name__)
+
+class TableDriftReport:
+    def __init__(self, database, table, check_only) -> None:
+        self.database = database
+        self.table = table
+        self.check_only = check_only
+        self.chunks = 0
+        self.mismatched_chunks = 0
+        self.rows_inserted = 0
+        self.rows_updated = 0
+        self.rows_deleted = 0
+        self.seconds = 0.0
+        self.skipped_reason = None
+
+
+    @property
+    def in_sync(self) -> bool:
+        return self.mismatched_chunks == 0 and self.skipped_reason is None
+
+
+    def to_dict(self):
+        return {
+            "database": self.database,
+            "table": self.table,
+            "check_only": self.check_only,
+            "chunks": self.chunks,
+            "mismatched_chunks": self.mismatched_chunks,
+            "rows_inserted": self.rows_inserted,
+            "rows_updated": self.rows_updated,
+            "rows_deleted": self.rows_deleted,
+            "seconds": round(self.seconds, 3),
+            "skipped_reason": self.skipped_reason,
+        }
+
+
+class DeltaSynchronizer:
+    '''
+    Bring a target table in line with the source by comparing checksums of
+    primary key ranges, narrowing the ranges that differ until they are small
+    enough to compare row by row, and writing only the differing rows.
+    '''
+    def __init__(self, source:Connection, target:Connection, check_only = False) -> None:
+        self.source = source
+        self.target = target
+        self.check_only = check_only
+        self.chunk_size = target.chunk_size
+        self.min_chunk_size = target.min_chunk_size
+        self.batch_size = target.batch_size
+
+
+    def sync_table(self, table:Table):
+        report = TableDriftReport(table.database, table.name, self.check_only)
+        key_columns = table.primary_key()
+        started_at = time.perf_counter()
+
+        if not key_columns:
+            report.skipped_reason = "no primary key"
+            logger.warning("Skipping delta sync of %s.%s: no primary key", table.database, table.name)
+            return report
+
+        columns = DataCopier.copy_columns(table)
+
+        with self.source.checkout(table.database) as source_connection, \
+                self.target.checkout(table.database) as target_connection:
+            target_connection.set_session_variable("FOREIGN_KEY_CHECKS", 0)
+            try:
+                key_ranges = find_key_ranges(source_connection, table.name, key_columns, self.chunk_size)
+                report.chunks = len(key_ranges)
+
+                for key_range in key_ranges:
+                    if self.__compare_range(source_connection, target_connection, table.name, columns, key_columns, key_range, report):
+                        report.mismatched_chunks += 1
+            finally:
+                target_connection.set_session_variable("FOREIGN_KEY_CHECKS", 1)
+
+        report.seconds = time.perf_counter() - started_at
+        logger.info(
+            "Delta %s.%s: %s/%s chunks differ, %s inserted, %s updated, %s deleted%s",
+            table.database, table.name, report.mismatched_chunks, report.chunks, report.rows_inserted,
+            report.rows_updated, report.rows_deleted, " (check only)" if self.check_only else ""
+        )
+
+        return report
+
+
+    def __compare_range(self, source_connection, target_connection, table, columns, key_columns, key_range, report):
+        '''
+        Returns True when the range differed between source and target.
+        '''
+        source_count, source_checksum = source_connection.checksum_range(table, columns, key_columns, key_range)
+        target_count, target_checksum = target_connection.checksum_range(table, columns, key_columns, key_range)
+
+        if (source_count, source_checksum) == (target_count, target_checksum):
+            return False
+
+        largest_count = max(source_count, target_count)
+        if largest_count <= self.min_chunk_size:
+            self.__repair_range(source_connection, target_connection, table, columns, key_columns, key_range, report)
+            return True
+
+        splitter = source_connection if source_count >= target_count else target_connection
+        middle = splitter.find_key_at_offset(table, key_columns, key_range, largest_count // 2)
+        if middle is None or middle == key_range.lower:
+            self.__repair_range(source_connection, target_connection, table, columns, key_columns, key_range, report)
+            return True
+
+        for half in key_range.split(middle):
+            self.__compare_range(source_connection, target_connection, table, columns, key_columns, half, report)
+
+        return True
+
+
+    def __repair_range(self, source_connection, target_connection, table, columns, key_columns, key_range, report):
+        key_positions = [columns.index(column) for column in key_columns]
+
+        def by_key(rows):
+            return {tuple(row[position] for position in key_positions): tuple(row) for row in rows}
+
+        source_rows = by_key(source_connection.fetch_range(table, columns, key_columns, key_range))
+        target_rows = by_key(target_connection.fetch_range(table, columns, key_columns, key_range))
+
+        inserted = [row for key, row in source_rows.items() if key not in target_rows]
+        updated = [row for key, row in source_rows.items() if key in target_rows and target_rows[key] != row]
+        deleted = [key for key in target_rows if key not in source_rows]
+
+        report.rows_inserted += len(inserted)
+        report.rows_updated += len(updated)
+        report.rows_deleted += len(deleted)
+
+        if self.check_only:
+            return
+
+        changed_rows = inserted + updated
+        instrumentation.add_rows(len(changed_rows) + len(deleted))
+        for position in range(0, len(changed_rows), self.batch_size):
+            target_connection.upsert_rows(table, columns, changed_rows[position:position + self.batch_size])
+        if deleted:
+            target_connection.delete_keys(table, key_columns, deleted)
+        target_connection.commit()
@@ -0,0 +1,126 @@
+class DependencyGraph:
+    '''
+    Foreign key graph of the tables of one database, sorted with Kahn's
+    algorithm into levels of tables that don't depend on each other.
+    '''
+    def __init__(self) -> None:
+        self.dependencies = {}
+        self.foreign_keys = {}
+        self.deferred_foreign_keys = {}
+
+
+    def add_table(self, table):
+        self.dependencies.setdefault(table, set())
+        self.foreign_keys.setdefault(table, [])
+
+
+    def add_foreign_key(self, table, referenced_table, constraint):
+        '''
+        Self references and references to tables outside the graph don't
+        constrain the creation order.
+        '''
+        self.add_table(table)
+        if referenced_table == table or referenced_table not in self.dependencies:
+            return
+
+        self.dependencies[table].add(referenced_table)
+        self.foreign_keys[table].append((referenced_table, constraint))
+
+
+    def levels(self):
+        '''
+        Tables grouped by level: every table only references tables of previous
+        levels. Foreign keys closing a cycle are moved to deferred_foreign_keys.
+        '''
+        self.deferred_foreign_keys = {}
+        pending = {table: set(references) for table, references in self.dependencies.items()}
+        levels = []
+
+        while pending:
+            level = sorted(table for table, references in pending.items() if not references)
+
+            if not level:
+                self.__break_cycle(pending)
+                continue
+
+            levels.append(level)
+            for table in level:
+                del pending[table]
+            for references in pending.values():
+                references.difference_update(level)
+
+        return levels
+
+
+    def sorted_tables(self):
+        return [table for level in self.levels() for table in level]
+
+
+    def __break_cycle(self, pending:dict):
+        '''
+        Defer the foreign keys of a table of a cycle, so it can be created first
+        and constrained afterwards. The table is taken from a strongly connected
+        component referencing no other pending table, the one with the fewest
+        references, so only foreign keys inside the cycle are deferred.
+        '''
+        candidates = [
+            table
+            for component in self.__strongly_connected_components(pending)
+            if all(pending[table] <= component for table in component)
+            for table in component
+        ]
+        table = min(sorted(candidates), key=lambda table: len(pending[table]))
+
+        for referenced_table, constraint in self.foreign_keys[table]:
+            if referenced_table in pending[table]:
+                self.deferred_foreign_keys.setdefault(table, []).append(constraint)
+
+        pending[table] = set()
+
+
+    def __strongly_connected_components(self, pending:dict):
+        '''
+        Tarjan's algorithm over the pending references, without recursion.
+        '''
+        index = {}
+        lowlink = {}
+        stack = []
+        on_stack = set()
+        components = []
+
+        for root in sorted(pending):
+            if root in index:
+                continue
+
+            index[root] = lowlink[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(sorted(pending[root])))]
+
+            while work:
+                table, references = work[-1]
+                for reference in references:
+                    if reference not in index:
+                        index[reference] = lowlink[reference] = len(index)
+                        stack.append(reference)
+                        on_stack.add(reference)
+                        work.append((reference, iter(sorted(pending[reference]))))
+                        break
+                    if reference in on_stack:
+                        lowlink[table] = min(lowlink[table], index[reference])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[table])
+                    if lowlink[table] == index[table]:
+                        component = set()
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.add(member)
+                            if member == table:
+                                break
+                        components.append(component)
+
+        return components
@@ -0,0 +1,100 @@
+import json
+import threading
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.instrumentation import instrumentation
+
+class EngineRegistry:
+    '''
+    Keep one pooled engine per server, user and pool options, shared by
+    every Database asking for the same ones.
+    '''
+    default_pool_options = {
+        "pool_size": 5,
+        "max_overflow": 5,
+        "pool_timeout": 30,
+        "pool_recycle": 3600,
+        "pool_pre_ping": True,
+    }
+
+    def __init__(self) -> None:
+        self.engines = {}
+        self.async_engines = {}
+        self.lock = threading.Lock()
+
+
+    def get_engine(self, server_url, pool_options = None):
+        options = dict(self.default_pool_options)
+        options.update(pool_options or {})
+        key = self.__engine_key(server_url, options)
+        with self.lock:
+            engine = self.engines.get(key)
+            if engine is None:
+                engine = create_engine(server_url, **options)
+                instrumentation.attach(engine)
+                self.engines[key] = engine
+
+            return engine
+
+
+    def get_async_engine(self, server_url, pool_options = None):
+        '''
+        Async engines belong to the event loop they were created in, they are
+        disposed with dispose_async_engines before the loop closes.
+        '''
+        options = dict(self.default_pool_options)
+        options.update(pool_options or {})
+        key = self.__engine_key(server_url, options)
+        with self.lock:
+            engine = self.async_engines.get(key)
+            if engine is None:
+                engine = create_async_engine(server_url, **options)
+                instrumentation.attach(engine.sync_engine)
+                self.async_engines[key] = engine
+
+            return engine
+
+
+    async def dispose_async_engines(self):
+        with self.lock:
+            engines = list(self.async_engines.values())
+            self.async_engines = {}
+
+        for engine in engines:
+            await engine.dispose()
+
+
+    def dispose(self, server_url):
+        '''
+        Dispose the engines of a server, whatever their pool options.
+        '''
+        with self.lock:
+            keys = [key for key in self.engines if key[0] == server_url]
+            engines = [self.engines.pop(key) for key in keys]
+        for engine in engines:
+            engine.dispose()
+
+
+    def dispose_all(self):
+        '''
+        Close every pooled connection, used when the replicator shuts down.
+        '''
+        with self.lock:
+            engines = list(self.engines.values())
+            self.engines = {}
+
+        for engine in engines:
+            engine.dispose()
+
+
+    def __engine_key(self, server_url, options):
+        '''
+        Callers asking for other options, such as local_infile in connect_args,
+        get their own engine rather than the one created first.
+        '''
+        return server_url, json.dumps(options, sort_keys=True, default=str)
+
+
+engine_registry = EngineRegistry()
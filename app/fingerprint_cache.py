@@ -0,0 +1,65 @@
+import json
+import os
+import threading
+
+class FingerprintCache:
+    '''
+    Persist, per server, the change probe and the definition fingerprint of
+    every table, so tables unchanged since the last run can be skipped.
+    '''
+    def __init__(self, path) -> None:
+        self.path = path
+        self.servers = {}
+        self.lock = threading.Lock()
+
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path, encoding="utf-8") as file_open:
+                self.servers = json.load(file_open)
+        except Exception:
+            self.servers = {}
+
+
+    def save(self):
+        with self.lock:
+            temporary_path = f"{self.path}.tmp"
+            with open(temporary_path, "w", encoding="utf-8") as file_open:
+                json.dump(self.servers, file_open, indent=2, sort_keys=True)
+            os.replace(temporary_path, self.path)
+
+
+    def is_unchanged(self, source_server, target_server, table, source_probe, target_probe) -> bool:
+        '''
+        Both probes still match the last run and the last run left the two
+        definitions identical.
+        '''
+        source_entry = self.servers.get(source_server, {}).get(table)
+        target_entry = self.servers.get(target_server, {}).get(table)
+
+        if source_entry is None or target_entry is None:
+            return False
+
+        return (
+            source_probe is not None
+            and source_entry["probe"] == source_probe
+            and target_entry["probe"] == target_probe
+            and source_entry["fingerprint"] == target_entry["fingerprint"]
+        )
+
+
+    def update(self, server, probes:dict, snapshot):
+        with self.lock:
+            entries = self.servers.setdefault(server, {})
+
+            for table, probe in probes.items():
+                database, table_name = table.split(".", 1)
+                table_structure = snapshot.get_table(database, table_name)
+                if table_structure is None:
+                    entries.pop(table, None)
+                    continue
+
+                entries[table] = {"probe": probe, "fingerprint": table_structure.fingerprint()}
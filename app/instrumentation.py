@@ -0,0 +1,215 @@
+import heapq
+import json
+import re
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+class Instrumentation:
+    '''
+    Collect statement timings from SQLAlchemy cursor events and spans of the
+    replicator phases, exported as a JSON run report.
+    '''
+    slowest_limit = 20
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.reset()
+
+
+    def reset(self):
+        with self.lock:
+            self.started_at = time.time()
+            self.started_counter = time.perf_counter()
+            self.round_trips = 0
+            self.rows_transferred = 0
+            self.statement_seconds = 0.0
+            self.statements = {}
+            self.slowest_statements = []
+            self.spans = []
+
+
+    def attach(self, engine):
+        event.listen(engine, "before_cursor_execute", self.before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self.after_cursor_execute)
+        event.listen(engine, "handle_error", self.handle_error)
+
+
+    def before_cursor_execute(self, connection, cursor, statement, parameters, context, executemany):
+        connection.info.setdefault("statement_started_at", []).append(time.perf_counter())
+
+
+    def handle_error(self, exception_context):
+        '''
+        after_cursor_execute does not run for a failing statement, drop its
+        start time so the next statement of the connection is timed from its own.
+        '''
+        connection = exception_context.connection
+        if connection is None or connection.invalidated:
+            return
+        started_at = connection.info.get("statement_started_at")
+        if started_at:
+            started_at.pop()
+
+
+    def after_cursor_execute(self, connection, cursor, statement, parameters, context, executemany):
+        started_at = connection.info["statement_started_at"].pop()
+        seconds = time.perf_counter() - started_at
+        normalized = self.__normalize(statement)
+
+        with self.lock:
+            self.round_trips += 1
+            self.statement_seconds += seconds
+            for entry in self.__span_stack():
+                entry["round_trips"] += 1
+
+            summary = self.statements.setdefault(normalized, {"count": 0, "seconds": 0.0, "max_seconds": 0.0})
+            summary["count"] += 1
+            summary["seconds"] += seconds
+            summary["max_seconds"] = max(summary["max_seconds"], seconds)
+
+            entry = (seconds, normalized, self.__current_span_name())
+            if len(self.slowest_statements) < self.slowest_limit:
+                heapq.heappush(self.slowest_statements, entry)
+            elif seconds > self.slowest_statements[0][0]:
+                heapq.heapreplace(self.slowest_statements, entry)
+
+
+    def add_rows(self, rows):
+        with self.lock:
+            self.rows_transferred += rows
+
+
+    @contextmanager
+    def span(self, name, **attributes):
+        '''
+        Time a phase of the run. Spans opened inside it are recorded as children.
+        Its round trips are the statements run by its thread, and by the
+        threads bound to it, while it is open. While tracemalloc is tracing,
+        the peak of traced memory is recorded too.
+        '''
+        stack = self.__span_stack()
+        parent = self.__current_span_name()
+        entry = {"name": name, "round_trips": 0}
+        stack.append(entry)
+        peaks = self.__peak_stack()
+        self.__fold_peak(peaks)
+        peaks.append(0)
+        started_at = time.perf_counter()
+        error = None
+
+        try:
+            yield
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            stack.pop()
+            self.__fold_peak(peaks)
+            peak_bytes = peaks.pop()
+            if peaks:
+                peaks[-1] = max(peaks[-1], peak_bytes)
+
+            with self.lock:
+                self.spans.append({
+                    "name": name,
+                    "parent": parent,
+                    "start": round(started_at - self.started_counter, 6),
+                    "seconds": round(time.perf_counter() - started_at, 6),
+                    "round_trips": entry["round_trips"],
+                    "peak_bytes": peak_bytes if tracemalloc.is_tracing() else None,
+                    "attributes": attributes,
+                    "error": error,
+                })
+
+
+    def bind(self, function):
+        '''
+        Wrap function to run in another thread under the spans open here, so
+        the spans it opens there keep the innermost one as their parent and
+        its statements count for every one of them.
+        '''
+        parents = list(self.__span_stack())
+
+        def run(*args, **kwargs):
+            if not parents:
+                return function(*args, **kwargs)
+
+            stack = self.__span_stack()
+            depth = len(stack)
+            stack.extend(parents)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                del stack[depth:]
+
+        return run
+
+
+    def report(self):
+        with self.lock:
+            statements = sorted(self.statements.items(), key=lambda item: item[1]["seconds"], reverse=True)
+            return {
+                "started_at": self.started_at,
+                "seconds": round(time.perf_counter() - self.started_counter, 6),
+                "round_trips": self.round_trips,
+                "statement_seconds": round(self.statement_seconds, 6),
+                "rows_transferred": self.rows_transferred,
+                "phases": sorted(self.spans, key=lambda span: span["start"]),
+                "slowest_statements": [
+                    {"seconds": round(seconds, 6), "statement": statement, "phase": phase}
+                    for seconds, statement, phase in sorted(self.slowest_statements, reverse=True)
+                ],
+                "statements": [
+                    {
+                        "statement": statement, "count": summary["count"], "seconds": round(summary["seconds"], 6),
+                        "max_seconds": round(summary["max_seconds"], 6)
+                    }
+                    for statement, summary in statements[:self.slowest_limit]
+                ],
+            }
+
+
+    def write_report(self, path):
+        with open(path, "w", encoding="utf-8") as file_open:
+            json.dump(self.report(), file_open, indent=2, default=str)
+
+
+    def __span_stack(self):
+        if not hasattr(self.local, "spans"):
+            self.local.spans = []
+        return self.local.spans
+
+
+    def __peak_stack(self):
+        if not hasattr(self.local, "peaks"):
+            self.local.peaks = []
+        return self.local.peaks
+
+
+    def __fold_peak(self, peaks):
+        '''
+        Move the traced peak since the last fold into the innermost open span,
+        so a child span resetting it does not hide it from its parent.
+        '''
+        if not tracemalloc.is_tracing():
+            return
+        if peaks:
+            peaks[-1] = max(peaks[-1], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+
+
+    def __current_span_name(self):
+        stack = self.__span_stack()
+        return stack[-1]["name"] if stack else None
+
+
+    def __normalize(self, statement):
+        return re.sub(r"\s+", " ", statement).strip()[:500]
+
+
+instrumentation = Instrumentation()
@@ -0,0 +1,80 @@
+from app.tagged_values import decode_tagged, encode_tagged
+
+class KeyRange:
+    '''
+    Range of primary key values, lower bound included and upper bound
+    excluded. A missing bound leaves that side of the range open.
+    '''
+    def __init__(self, lower = None, upper = None) -> None:
+        self.lower = tuple(lower) if lower is not None else None
+        self.upper = tuple(upper) if upper is not None else None
+
+
+    def __repr__(self) -> str:
+        return f"KeyRange({self.lower}, {self.upper})"
+
+
+    def predicate(self, key_columns, prefix = "k"):
+        '''
+        WHERE fragment and parameters selecting the rows of the range.
+        '''
+        columns = f"({', '.join(f'`{column}`' for column in key_columns)})"
+        conditions = []
+        parameters = {}
+
+        if self.lower is not None:
+            names = [f"{prefix}l{position}" for position in range(len(key_columns))]
+            conditions.append(f"{columns} >= ({', '.join(f':{name}' for name in names)})")
+            parameters.update(zip(names, self.lower))
+
+        if self.upper is not None:
+            names = [f"{prefix}u{position}" for position in range(len(key_columns))]
+            conditions.append(f"{columns} < ({', '.join(f':{name}' for name in names)})")
+            parameters.update(zip(names, self.upper))
+
+        return " AND ".join(conditions) or "1 = 1", parameters
+
+
+    def to_json(self):
+        '''
+        [lower, upper] with every key value tagged with its type, so binary and
+        temporal bounds compare like the keys they were read from once decoded.
+        '''
+        return [
+            None if bound is None else [encode_tagged(value) for value in bound]
+            for bound in (self.lower, self.upper)
+        ]
+
+
+    @classmethod
+    def from_json(cls, data):
+        lower, upper = (
+            None if bound is None else [decode_tagged(value) for value in bound] for bound in data
+        )
+        return cls(lower, upper)
+
+
+    def split(self, middle):
+        return KeyRange(self.lower, middle), KeyRange(middle, self.upper)
+
+
+def order_by(key_columns):
+    return ", ".join(f"`{column}`" for column in key_columns)
+
+
+def find_key_ranges(database_connection, table, key_columns, chunk_size):
+    '''
+    Walk the primary key index of a table, cutting it into ranges of about
+    chunk_size rows.
+    '''
+    ranges = []
+    lower = None
+
+    while True:
+        boundary = database_connection.find_key_at_offset(table, key_columns, KeyRange(lower), chunk_size)
+        if boundary is None:
+            ranges.append(KeyRange(lower))
+            return ranges
+
+        ranges.append(KeyRange(lower, boundary))
+        lower = boundary
@@ -0,0 +1,74 @@
+ALGORITHMS = ["INSTANT", "INPLACE", "COPY"]
+
+class MigrationPlan:
+    '''
+    Every change of one table, applied with a single ALTER TABLE so InnoDB
+    rebuilds the table at most once.
+    '''
+    best_algorithm = {
+        "ADD COLUMN": "INSTANT",
+        "DROP COLUMN": "INSTANT",
+        "MODIFY COLUMN": "INPLACE",
+        "ADD INDEX": "INPLACE",
+        "DROP INDEX": "INPLACE",
+        "ADD PRIMARY KEY": "INPLACE",
+        "DROP PRIMARY KEY": "INPLACE",
+        "ADD FOREIGN KEY": "INPLACE",
+        "DROP FOREIGN KEY": "INPLACE",
+    }
+
+    def __init__(self, database, table) -> None:
+        self.database = database
+        self.table = table
+        self.changes = []
+
+
+    def add(self, kind, clause, algorithm = None):
+        if kind not in self.best_algorithm:
+            raise ValueError(f"Unknown change {kind}")
+        self.changes.append((kind, clause, algorithm or self.best_algorithm[kind]))
+
+
+    def is_empty(self) -> bool:
+        return len(self.changes) == 0
+
+
+    def clauses(self):
+        '''
+        Drops come first so a constraint can be replaced in the same statement.
+        '''
+        drops = [clause for kind, clause, _ in self.changes if kind.startswith("DROP")]
+        others = [clause for kind, clause, _ in self.changes if not kind.startswith("DROP")]
+        return drops + others
+
+
+    def algorithm(self):
+        '''
+        Least disruptive algorithm every change of the plan may use.
+        '''
+        if self.is_empty():
+            return "INSTANT"
+        return max((algorithm for _, _, algorithm in self.changes), key=ALGORITHMS.index)
+
+
+    def algorithm_candidates(self):
+        '''
+        Algorithms to try in order, ending with None to let the server choose.
+        '''
+        algorithm = self.algorithm()
+        candidates = [candidate for candidate in ALGORITHMS[ALGORITHMS.index(algorithm):] if candidate != "COPY"]
+        return candidates + [None]
+
+
+    def statement(self, algorithm = None):
+        sql = f"ALTER TABLE `{self.table}` {', '.join(self.clauses())}"
+        if algorithm:
+            sql = f"{sql}, ALGORITHM={algorithm}"
+        return sql
+
+
+    def clause_statements(self):
+        '''
+        One ALTER TABLE per change, for servers accepting a single change per statement.
+        '''
+        return [f"ALTER TABLE `{self.table}` {clause}" for clause in self.clauses()]
@@ -0,0 +1,164 @@
+import hashlib
+import logging
+import time
+
+from app.key_ranges import find_key_ranges
+
+logger = logging.getLogger(__name__)
+
+def change_name(table, suffix, prefix = ""):
+    '''
+    Name of a table or trigger of the online change of table. Long table
+    names are cut to fit in the 64 characters of an identifier, the hash of
+    the whole name keeping apart tables sharing a long prefix.
+    '''
+    digest = hashlib.sha1(table.encode("utf-8")).hexdigest()[:8]
+    return f"_{prefix}{table[:40]}_{digest}_{suffix}"
+
+
+class OnlineSchemaChange:
+    '''
+    Apply a migration plan to a large table without blocking its readers and
+    writers: the new structure is built on an empty shadow table, rows are
+    copied in primary key chunks while triggers replay the concurrent writes,
+    and RENAME TABLE swaps both tables atomically.
+    '''
+    def __init__(self, connection, migration_plan, pause_seconds = 0.0) -> None:
+        self.connection = connection
+        self.migration_plan = migration_plan
+        self.database = migration_plan.database
+        self.table = migration_plan.table
+        self.pause_seconds = pause_seconds
+        self.shadow_table = change_name(self.table, "new")
+        self.old_table = change_name(self.table, "old")
+        self.triggers = {
+            event: change_name(self.table, event[:3].lower(), "osc_") for event in ("INSERT", "UPDATE", "DELETE")
+        }
+
+
+    def is_possible(self, snapshot):
+        '''
+        Returns the reason the change must run as a plain ALTER TABLE, or None.
+        Triggers need a primary key kept by the plan, and foreign keys would
+        not follow the swap. snapshot holds the database of the table.
+        '''
+        table = snapshot.get_table(self.database, self.table)
+        if table is None:
+            return "table not found"
+
+        key_columns = table.primary_key()
+        if not key_columns:
+            return "no primary key"
+        if any(kind in ("DROP PRIMARY KEY", "ADD PRIMARY KEY") for kind, _, _ in self.migration_plan.changes):
+            return "primary key changed"
+        if any(f"DROP COLUMN `{column}`" in self.migration_plan.clauses() for column in key_columns):
+            return "primary key column dropped"
+        if table.foreign_keys() or any(
+            self.table in other.referenced_tables() for other in snapshot.tables(self.database).values() if other.name != self.table
+        ):
+            return "foreign keys"
+        if any(kind == "ADD FOREIGN KEY" for kind, _, _ in self.migration_plan.changes):
+            return "foreign keys"
+
+        return None
+
+
+    def run(self, snapshot = None):
+        '''
+        snapshot is the target schema the caller already holds, the database
+        is introspected without it.
+        '''
+        if snapshot is None:
+            snapshot = self.connection.load_schema_snapshot([self.database])
+
+        reason = self.is_possible(snapshot)
+        if reason is not None:
+            logger.info("Online change of %s.%s not possible (%s)", self.database, self.table, reason)
+            return False
+
+        started_at = time.perf_counter()
+        try:
+            self.__create_shadow_table()
+            columns, key_columns = self.__shared_columns(snapshot.get_table(self.database, self.table))
+            self.__create_triggers(columns, key_columns)
+            self.__copy_rows(columns, key_columns)
+            self.__swap_tables()
+        except Exception as e:
+            logger.error("Online change of %s.%s on %s failed: %s", self.database, self.table, self.connection.name, e)
+            self.__clean_up()
+            raise
+
+        logger.info(
+            "Online change of %s.%s on %s done in %.2fs",
+            self.database, self.table, self.connection.name, time.perf_counter() - started_at
+        )
+        return True
+
+
+    def __execute(self, statement):
+        with self.connection.checkout(self.database) as database_connection:
+            database_connection.execute_ddl(statement)
+
+
+    def __create_shadow_table(self):
+        with self.connection.checkout(self.database) as database_connection:
+            database_connection.execute_ddl(f"DROP TABLE IF EXISTS `{self.shadow_table}`")
+            database_connection.create_table_like(self.shadow_table, self.table)
+            if database_connection.combined_alter:
+                database_connection.alter_table(f"ALTER TABLE `{self.shadow_table}` {', '.join(self.migration_plan.clauses())}")
+            else:
+                for clause in self.migration_plan.clauses():
+                    database_connection.alter_table(f"ALTER TABLE `{self.shadow_table}` {clause}")
+
+
+    def __shared_columns(self, table):
+        '''
+        Columns of the original table kept by the new structure, and its primary key.
+        '''
+        with self.connection.checkout(self.database) as database_connection:
+            shadow_columns = {row[0] for row in database_connection.find_table(self.shadow_table)}
+
+        columns = [
+            column.name for column in sorted(table.columns.values(), key=lambda column: column.position)
+            if column.name in shadow_columns and "GENERATED" not in (column.extra or "").upper()
+        ]
+        return columns, table.primary_key()
+
+
+    def __create_triggers(self, columns, key_columns):
+        with self.connection.checkout(self.database) as database_connection:
+            database_connection.create_replay_triggers(self.table, self.shadow_table, self.triggers, columns, key_columns)
+
+
+    def __copy_rows(self, columns, key_columns):
+        with self.connection.checkout(self.database) as database_connection:
+            key_ranges = find_key_ranges(database_connection, self.table, key_columns, self.connection.chunk_size)
+
+            for key_range in key_ranges:
+                copied_at = time.perf_counter()
+                database_connection.copy_range_into(self.shadow_table, self.table, columns, key_columns, key_range)
+                database_connection.commit()
+                if self.connection.throttle is not None:
+                    self.connection.throttle.wait(time.perf_counter() - copied_at, database_connection)
+                if self.pause_seconds:
+                    time.sleep(self.pause_seconds)
+
+
+    def __swap_tables(self):
+        with self.connection.checkout(self.database) as database_connection:
+            database_connection.swap_tables(self.table, self.shadow_table, self.old_table)
+        self.__drop_triggers()
+        self.__execute(f"DROP TABLE IF EXISTS `{self.old_table}`")
+
+
+    def __drop_triggers(self):
+        for trigger in self.triggers.values():
+            self.__execute(f"DROP TRIGGER IF EXISTS `{trigger}`")
+
+
+    def __clean_up(self):
+        try:
+            self.__drop_triggers()
+            self.__execute(f"DROP TABLE IF EXISTS `{self.shadow_table}`")
+        except Exception as e:
+            logger.error("Could not clean up the online change of %s.%s: %s", self.database, self.table, e)
@@ -0,0 +1,154 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from app.connection_db import Connection
+from app.ddl import foreign_key_clause, remove_foreign_keys
+from app.engine_registry import engine_registry
+from app.instrumentation import instrumentation
+from app.migration_plan import MigrationPlan
+from app.replicator import Replicator
+from app.schema_plan import COPY_BYTES_PER_SECOND, SchemaPlan
+
+logger = logging.getLogger(__name__)
+
+class PlanReplicator(Replicator):
+    '''
+    Replicator saving the DDL of a run to a plan file (plan) and executing a
+    saved plan later (apply).
+    '''
+    def __init__(self, config_file = "connections.json") -> None:
+        super().__init__(config_file)
+
+        self.plan_copy_rate = float(self.config_file.get("PLAN_COPY_RATE", COPY_BYTES_PER_SECOND))
+        if self.plan_copy_rate <= 0:
+            raise ValueError("PLAN_COPY_RATE must be positive")
+
+
+    def plan(self, path = None):
+        '''
+        Diff every target against the source without changing anything and
+        save the DDL it needs, with cost estimates, as JSON and SQL.
+        '''
+        path = path or os.path.join(self.state_dir, "plan.json")
+
+        try:
+            instrumentation.reset()
+            with instrumentation.span("plan"):
+                with instrumentation.span("discover"):
+                    self.find_databases_to_replicate()
+                with instrumentation.span("introspect"):
+                    self.source_schema = self.replicated_connection.load_schema_snapshot(self.replicated_connection.database)
+                    self.associate_tables_to_databases()
+                with instrumentation.span("sort"):
+                    self.sort_tables_by_dependencies()
+
+                schema_plan = SchemaPlan(self.replicated_connection.name, self.plan_copy_rate)
+                create_statements = {}
+                for connection in self.other_connections:
+                    with instrumentation.span("plan target", target=connection.name):
+                        self.__plan_connection(connection, schema_plan, create_statements)
+
+            schema_plan.save(path)
+            for target, summary in schema_plan.summary().items():
+                logger.info(
+                    "Plan for %s: %s statements, %s COPY alters, about %.1fs with %.1fs of locked writes",
+                    target, summary["statements"], summary["copy_alters"], summary["estimated_seconds"],
+                    summary["estimated_lock_seconds"]
+                )
+            return schema_plan
+
+        finally:
+            self.write_run_report()
+            engine_registry.dispose_all()
+
+
+    def apply(self, path = None):
+        '''
+        Execute a saved plan as it is, without introspecting the servers again.
+        Each target stops at its first failing statement.
+        '''
+        schema_plan = SchemaPlan.load(path or os.path.join(self.state_dir, "plan.json"))
+        connections = {connection.name: connection for connection in self.other_connections}
+
+        unknown_targets = [target for target in schema_plan.targets() if target not in connections]
+        if unknown_targets:
+            raise ValueError(f"Plan targets not configured: {', '.join(unknown_targets)}")
+
+        def apply_to_connection(target):
+            with instrumentation.span("apply target", target=target):
+                for planned_statement in schema_plan.statements_for(target):
+                    if not self.__apply_planned_statement(connections[target], planned_statement):
+                        raise ValueError(f"Could not apply {planned_statement.statement}")
+
+        try:
+            instrumentation.reset()
+            self.target_errors = {}
+            with instrumentation.span("apply"):
+                with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                    futures = [(target, executor.submit(instrumentation.bind(apply_to_connection), target)) for target in schema_plan.targets()]
+
+            for target, future in futures:
+                error = future.exception()
+                if error is not None:
+                    self.record_target_error(connections[target], error)
+
+            if self.target_errors:
+                raise ValueError(f"Replication failed for {', '.join(self.target_errors)}")
+
+        finally:
+            self.write_run_report()
+            engine_registry.dispose_all()
+
+
+    def __plan_connection(self, connection:Connection, schema_plan:SchemaPlan, create_statements:dict):
+        '''
+        Same decisions as a run, recorded in the plan instead of executed.
+        '''
+        databases = list(self.replicated_connection.table_associated_to_database.keys())
+        target_schema = connection.load_schema_snapshot(databases)
+
+        for database in databases:
+            if not target_schema.has_database(database):
+                schema_plan.add_statement(connection.name, database, None, "CREATE DATABASE", f"CREATE DATABASE `{database}`")
+
+            deferred_foreign_keys = self.deferred_foreign_keys.get(database, {}) if connection.alter_definitions else {}
+            created_tables = []
+            for level in self.table_levels[database]:
+                for table in level:
+                    target_table = target_schema.get_table(database, table)
+                    if target_table is not None:
+                        migration_plan = self.build_migration_plan(self.source_schema.get_table(database, table), target_table)
+                        if not migration_plan.is_empty():
+                            schema_plan.add_migration_plan(
+                                connection.name, migration_plan, target_table, connection.online_change_threshold
+                            )
+                        continue
+
+                    if (database, table) not in create_statements:
+                        create_statements[(database, table)] = self.show_create_table(database, table)
+                    script_creation = create_statements[(database, table)]
+                    if not script_creation:
+                        raise ValueError(f"Could not read the structure of {database}.{table}")
+                    if deferred_foreign_keys.get(table):
+                        script_creation = remove_foreign_keys(
+                            script_creation, [constraint.name for constraint in deferred_foreign_keys[table]]
+                        )
+                    schema_plan.add_statement(connection.name, database, table, "CREATE TABLE", script_creation)
+                    created_tables.append(table)
+
+            for table in created_tables:
+                if not deferred_foreign_keys.get(table):
+                    continue
+                migration_plan = MigrationPlan(database, table)
+                for constraint in deferred_foreign_keys[table]:
+                    migration_plan.add("ADD FOREIGN KEY", foreign_key_clause(constraint))
+                schema_plan.add_migration_plan(connection.name, migration_plan)
+
+
+    def __apply_planned_statement(self, connection:Connection, planned_statement):
+        if planned_statement.kind == "CREATE DATABASE":
+            return connection.create_database(planned_statement.database)
+        if planned_statement.kind == "CREATE TABLE":
+            return connection.create_table(planned_statement.database, planned_statement.statement)
+        return connection.apply_migration_plan(planned_statement.migration_plan(), table_bytes=planned_statement.table_bytes)
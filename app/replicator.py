@@ -1,7 +1,24 @@
 import json
+import logging
 import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 
+from app.checkpoint_journal import CheckpointJournal
 from app.connection_db import Connection
+from app.data_copy import DataCopier, TableCopyReport
+from app.ddl import column_definition, constraint_change, drop_constraint_change, foreign_key_clause, remove_foreign_keys, split_secondary_definitions
+from app.delta_sync import DeltaSynchronizer
+from app.dependency_graph import DependencyGraph
+from app.migration_plan import MigrationPlan
+from app.engine_registry import engine_registry
+from app.fingerprint_cache import FingerprintCache
+from app.instrumentation import instrumentation
+from app.schema import SchemaSnapshot, Table
+from app.tee_copy import TeeCopier
+
+logger = logging.getLogger(__name__)
 
 class Replicator:
     def __init__(self, config_file = "connections.json") -> None:
@@ -9,6 +26,23 @@ class Replicator:
         self.file_path = None
         self.replicated_connection = None
         self.other_connections = []
+        self.source_schema = None
+        self.data_reports = []
+        self.drift_reports = {}
+        self.concurrency = 1
+        self.table_concurrency = 1
+        self.table_levels = {}
+        self.deferred_foreign_keys = {}
+        self.deferred_index_builds = {}
+        self.target_errors = {}
+        self.state_dir = None
+        self.fingerprint_cache = None
+        self.journal = None
+        self.tee_copy = True
+        self.snapshot_reader = None
+        self.tee_buffer_batches = 4
+        self.source_probes = {}
+        self.tables_to_replicate = {}
 
         self.__validate_config_file(config_file)
 
@@ -32,8 +66,7 @@ class Replicator:
         
     
     def __verify_if_config_file_exists(self, config_file):
-        current_directory = os.getcwd()
-        self.file_path = f"{current_directory}\config\{config_file}"
+        self.file_path = os.path.join(os.getcwd(), "config", config_file)
 
         if not os.path.exists(self.file_path):
             raise ValueError("Configuration file not found")
@@ -48,54 +81,178 @@ class Replicator:
         
     
     def __check_json_fields(self):
-        self.replicated_connection = Connection(self.config_file.get("replicated_connection"))
+        self.replicated_connection = Connection(self.config_file.get("replicated_connection"), replicated_connection=True)
         others_connections = self.config_file.get("other_connections")
 
         if not isinstance(others_connections, list):
             raise ValueError("The other connections weren't sent correctly")
         
         for connection in others_connections:
-            self.other_connections.append(Connection(connection))
+            connection = Connection(connection)
+            connection.dbms = self.replicated_connection.dbms
+            if connection.defer_indexes and not connection.alter_definitions:
+                logger.warning("Indexes are not deferred on %s, its backend cannot add them back", connection.name)
+                connection.defer_indexes = False
+            self.other_connections.append(connection)
+
+        self.concurrency = int(self.config_file.get("CONCURRENCY", 1))
+        if self.concurrency < 1:
+            raise ValueError("CONCURRENCY must be at least 1")
+
+        self.table_concurrency = int(self.config_file.get("TABLE_CONCURRENCY", 1))
+        if self.table_concurrency < 1:
+            raise ValueError("TABLE_CONCURRENCY must be at least 1")
+
+        self.tee_copy = bool(self.config_file.get("TEE_COPY", True))
+        self.tee_buffer_batches = int(self.config_file.get("TEE_BUFFER_BATCHES", 4))
+        if self.tee_buffer_batches < 1:
+            raise ValueError("TEE_BUFFER_BATCHES must be at least 1")
+
+        self.state_dir = self.config_file.get("STATE_DIR", "logs")
+        if self.config_file.get("FINGERPRINT_CACHE", True):
+            os.makedirs(self.state_dir, exist_ok=True)
+            self.fingerprint_cache = FingerprintCache(os.path.join(self.state_dir, "schema_fingerprints.json"))
+        if self.config_file.get("CHECKPOINT_JOURNAL", True):
+            os.makedirs(self.state_dir, exist_ok=True)
+            self.journal = CheckpointJournal(os.path.join(self.state_dir, "checkpoints.sqlite"))
 
 
     def run(self):
         try:
-            self.__find_databases_to_replicate()
-            self.__associate_tables_to_databases()
-            self.__sort_tables_by_dependencies()
-            self.__replicate_databases_and_tables_to_others_connections()
+            self.run_pass()
+        finally:
+            engine_registry.dispose_all()
+
+
+    def run_pass(self):
+        try:
+            instrumentation.reset()
+            with instrumentation.span("run"):
+                with instrumentation.span("discover"):
+                    self.find_databases_to_replicate()
+                with instrumentation.span("probe"):
+                    self.probe_schemas()
+                if self.nothing_to_replicate():
+                    logger.info("No table changed since the last run")
+                    return
+
+                with instrumentation.span("introspect"):
+                    self.load_source_schema()
+                    self.associate_tables_to_databases()
+                with instrumentation.span("sort"):
+                    self.sort_tables_by_dependencies()
+                with instrumentation.span("replicate"):
+                    self.replicate_databases_and_tables_to_others_connections()
 
         except Exception as e:
             raise ValueError(f"Error creating connection: {e}")
-    
 
-    def __find_databases_to_replicate(self):
+        finally:
+            if self.fingerprint_cache is not None:
+                self.fingerprint_cache.save()
+            self.write_run_report()
+
+
+    def show_create_table(self, database, table):
+        if self.snapshot_reader is not None:
+            return self.snapshot_reader.create_statement(database, table)
+        return self.replicated_connection.show_create_table(database, table)
+
+
+    def write_run_report(self, file_name = "run_report.json"):
+        try:
+            os.makedirs(self.state_dir, exist_ok=True)
+            instrumentation.write_report(os.path.join(self.state_dir, file_name))
+        except Exception as e:
+            logger.warning("Could not write the run report: %s", e)
+
+
+    def find_databases_to_replicate(self):
         self.replicated_connection.find_existing_databases()
 
     
-    def __associate_tables_to_databases(self):
+    def probe_schemas(self):
+        '''
+        Compare the cheap change probes of every server with the fingerprint
+        cache to find the tables each target has to diff.
+        '''
+        self.tables_to_replicate = {}
+        if self.fingerprint_cache is None:
+            return
+
+        self.fingerprint_cache.load()
+        databases = self.replicated_connection.database
+        self.source_probes = self.replicated_connection.probe_schema(databases)
+
+        for connection in self.other_connections:
+            try:
+                target_probes = connection.probe_schema(databases)
+            except Exception as e:
+                logger.warning("Could not probe %s, every table will be compared: %s", connection.name, e)
+                target_probes = {}
+
+            self.tables_to_replicate[connection.name] = {
+                table for table, probe in self.source_probes.items()
+                if not self.fingerprint_cache.is_unchanged(
+                    self.replicated_connection.name, connection.name, table, probe, target_probes.get(table)
+                )
+            }
+
+
+    def nothing_to_replicate(self):
+        if self.fingerprint_cache is None or any(connection.data for connection in self.other_connections):
+            return False
+
+        return all(len(self.tables_to_replicate[connection.name]) == 0 for connection in self.other_connections)
+
+
+    def should_replicate(self, connection:Connection, database, table):
+        tables = self.tables_to_replicate.get(connection.name)
+        return tables is None or f"{database}.{table}" in tables
+
+
+    def load_source_schema(self):
+        self.use_source_schema(self.replicated_connection.load_schema_snapshot(self.replicated_connection.database))
+
+
+    def use_source_schema(self, source_schema:SchemaSnapshot):
+        self.source_schema = source_schema
+        if self.fingerprint_cache is not None:
+            self.fingerprint_cache.update(self.replicated_connection.name, self.source_probes, self.source_schema)
+
+
+    def associate_tables_to_databases(self):
         '''
         Verify which tables are in database and associate it in a dict.
         '''
         for database in self.replicated_connection.database:
-            self.replicated_connection.find_tables_from_database(database)
+            tables = self.source_schema.table_names(database)
+            if len(tables) == 0:
+                raise ValueError("Not found tables")
 
+            self.replicated_connection.table_associated_to_database[database] = tables
 
-    def __sort_tables_by_dependencies(self):
+
+    def sort_tables_by_dependencies(self):
         '''
-        Sort tables by your foreign keys.
+        Sort tables by your foreign keys, in levels of independent tables.
         '''
         foreign_keys = self.__get_foreign_keys()
 
         for database in foreign_keys:
-            sorted_tables = []
-            for table, fks in list(foreign_keys[database].items()):
-                if not fks:
-                    sorted_tables.insert(0, table)
-                else:
-                    sorted_tables.append(table)
-            
-            self.replicated_connection.table_associated_to_database[database] = sorted_tables
+            dependency_graph = DependencyGraph()
+            for table in foreign_keys[database]:
+                dependency_graph.add_table(table)
+
+            for table, fks in foreign_keys[database].items():
+                for constraint in fks:
+                    dependency_graph.add_foreign_key(table, constraint.referenced_table, constraint)
+
+            self.table_levels[database] = dependency_graph.levels()
+            self.deferred_foreign_keys[database] = dependency_graph.deferred_foreign_keys
+            self.replicated_connection.table_associated_to_database[database] = [
+                table for level in self.table_levels[database] for table in level
+            ]
 
     
     def __get_foreign_keys(self):
@@ -104,132 +261,458 @@ class Replicator:
         for database in self.replicated_connection.table_associated_to_database:
             foreign_keys[database] = {}
             for table in self.replicated_connection.table_associated_to_database[database]:
-                table_structure = self.replicated_connection.show_create_table(database, table)
-                table_foreign_keys = []
-
-                for line in table_structure.split('\n'):
-                    if 'FOREIGN KEY' in line:
-                        fk_table = line.split('REFERENCES ')[1].split(' ')[0].strip('`')
-                        table_foreign_keys.append(fk_table)
-                
-                foreign_keys[database][table] = table_foreign_keys
+                table_structure = self.source_schema.get_table(database, table)
+                foreign_keys[database][table] = table_structure.foreign_keys()
         
         return foreign_keys
 
 
-    def __replicate_databases_and_tables_to_others_connections(self):
-        for connection in self.other_connections:
-            connection.dbms = self.replicated_connection.dbms
+    def __run_concurrently(self, function, items):
+        if self.table_concurrency == 1 or len(items) < 2:
+            for item in items:
+                function(item)
+            return
+
+        with ThreadPoolExecutor(max_workers=self.table_concurrency) as executor:
+            list(executor.map(instrumentation.bind(function), items))
+
+
+    def replicate_databases_and_tables_to_others_connections(self):
+        '''
+        Replicate to every target, up to CONCURRENCY targets at a time. A failing
+        target is recorded and does not stop the others.
+        '''
+        self.target_errors = {}
+        shared_targets = self.shared_copy_targets()
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = [
+                (connection, executor.submit(
+                    instrumentation.bind(self.__replicate_to_connection), connection, connection not in shared_targets
+                ))
+                for connection in self.other_connections
+            ]
+
+        for connection, future in futures:
+            error = future.exception()
+            if error is not None:
+                self.record_target_error(connection, error)
+
+        shared_targets = [connection for connection in shared_targets if connection.name not in self.target_errors]
+        if shared_targets:
+            self.replicate_shared_data(shared_targets)
+
+        if self.target_errors:
+            raise ValueError(f"Replication failed for {', '.join(self.target_errors)}")
+
+
+    def record_target_error(self, connection:Connection, error):
+        logger.error("Replication to %s failed: %s", connection.name, error)
+        self.target_errors[connection.name] = error
+
+
+    def shared_copy_targets(self):
+        '''
+        Full copy targets fed from a single read of the source when there are
+        several of them.
+        '''
+        if not self.tee_copy or self.snapshot_reader is not None:
+            return []
 
-            for database in self.replicated_connection.table_associated_to_database.keys():
-                self.__replicate_databases(connection, database)
-                self.__replicate_tables(connection, database)
-                
+        targets = [connection for connection in self.other_connections if connection.data and connection.sync_mode == "full"]
+        return targets if len(targets) > 1 else []
+
+
+    def __replicate_to_connection(self, connection:Connection, copy_data = True):
+        '''
+        Structure and, unless the target takes part in the shared copy, data.
+        '''
+        with instrumentation.span("target", target=connection.name):
+            databases = list(self.replicated_connection.table_associated_to_database.keys())
+            with instrumentation.span("introspect target", target=connection.name):
+                target_schema = connection.load_schema_snapshot(databases)
+            self.restore_pending_index_builds(connection)
+
+            with instrumentation.span("structure", target=connection.name):
+                for database in databases:
+                    self.replicate_databases(connection, database, target_schema)
+                    self.replicate_tables(connection, database, target_schema)
+
+            if copy_data:
+                self.replicate_connection_data(connection, databases)
+
+
+    def replicate_connection_data(self, connection:Connection, databases:list):
+        '''
+        Rows of a target, then its deferred index builds even when the copy
+        failed, and the target is complete.
+        '''
+        if connection.data:
+            try:
+                with instrumentation.span("data", target=connection.name):
+                    self.__replicate_data(connection, databases)
+            finally:
+                with instrumentation.span("build indexes", target=connection.name):
+                    self.build_deferred_indexes(connection)
+
+        self.complete_connection(connection, databases)
+
+
+    def complete_connection(self, connection:Connection, databases:list):
+        self.__refresh_fingerprints(connection, databases)
+        if self.journal is not None:
+            self.journal.clear(connection.name)
+
+
+    def replicate_shared_data(self, connections:list):
+        '''
+        Copy the rows to every full copy target at once, following the
+        dependency levels, then finish each target on its own.
+        '''
+        databases = list(self.replicated_connection.table_associated_to_database.keys())
+        tee_copier = TeeCopier(
+            self.replicated_connection, connections, buffer_batches=self.tee_buffer_batches, journal=self.journal,
+            deferred_tables={connection.name: self.deferred_tables(connection) for connection in connections}
+        )
 
-    def __replicate_databases(self, connection:Connection, database:str):
-        if not connection.verify_if_database_exists(database):
+        def replicate_table_data(table_structure):
+            with instrumentation.span("table data", table=f"{table_structure.database}.{table_structure.name}"):
+                self.data_reports.extend(tee_copier.copy_table(table_structure).values())
+
+        try:
+            with instrumentation.span("shared data", targets=[connection.name for connection in connections]):
+                for database in databases:
+                    for level in self.table_levels[database]:
+                        tables = [self.source_schema.get_table(database, table) for table in level]
+                        tables = [table for table in tables if table.table_type == "BASE TABLE"]
+                        self.__run_concurrently(replicate_table_data, tables)
+        except Exception as e:
+            for connection in connections:
+                tee_copier.failures.setdefault(connection.name, e)
+
+        def finish_connection(connection):
+            try:
+                with instrumentation.span("build indexes", target=connection.name):
+                    self.build_deferred_indexes(connection)
+                if connection.name in tee_copier.failures:
+                    self.record_target_error(connection, tee_copier.failures[connection.name])
+                    return
+                self.complete_connection(connection, databases)
+            except Exception as e:
+                self.record_target_error(connection, e)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            list(executor.map(instrumentation.bind(finish_connection), connections))
+
+
+    def restore_pending_index_builds(self, connection:Connection):
+        '''
+        Index builds deferred by an interrupted run are still missing on the
+        target, they are built after the data copy instead of being diffed.
+        '''
+        if self.journal is None:
+            return
+
+        for database, table, statement in self.journal.pending_ddl(connection.name, "index_build"):
+            migration_plan = MigrationPlan(database, table)
+            for kind, clause in json.loads(statement):
+                migration_plan.add(kind, clause)
+            self.deferred_index_builds.setdefault(connection.name, {})[(database, table)] = migration_plan
+            logger.info("Resuming the deferred index build of %s.%s on %s", database, table, connection.name)
+
+
+    def __refresh_fingerprints(self, connection:Connection, databases:list):
+        '''
+        Record the definitions left on the target, only after it succeeded.
+        '''
+        if self.fingerprint_cache is None or not self.tables_to_replicate.get(connection.name):
+            return
+
+        self.fingerprint_cache.update(
+            connection.name, connection.probe_schema(databases), connection.load_schema_snapshot(databases)
+        )
+
+
+    def __replicate_data(self, connection:Connection, databases:list):
+        '''
+        Copy rows following the dependency levels of the tables, as a full copy
+        or a checksum based delta sync depending on SYNC_MODE. Rows restored
+        from a snapshot always replace the target tables.
+        '''
+        if self.snapshot_reader is not None:
+            data_copier = DataCopier(
+                self.replicated_connection, connection, deferred_tables=self.deferred_tables(connection)
+            )
+
+            def replicate_table_data(table_structure):
+                with instrumentation.span("table data", target=connection.name, table=f"{table_structure.database}.{table_structure.name}"):
+                    self.data_reports.append(self.__import_table_data(data_copier, table_structure))
+        elif connection.sync_mode == "full":
+            data_copier = DataCopier(
+                self.replicated_connection, connection, journal=self.journal,
+                deferred_tables=self.deferred_tables(connection)
+            )
+
+            def replicate_table_data(table_structure):
+                with instrumentation.span("table data", target=connection.name, table=f"{table_structure.database}.{table_structure.name}"):
+                    self.data_reports.append(data_copier.copy_table(table_structure))
+        else:
+            synchronizer = DeltaSynchronizer(
+                self.replicated_connection, connection, check_only=connection.sync_mode == "check"
+            )
+            drift_reports = self.drift_reports.setdefault(connection.name, [])
+
+            def replicate_table_data(table_structure):
+                with instrumentation.span("table data", target=connection.name, table=f"{table_structure.database}.{table_structure.name}"):
+                    drift_reports.append(synchronizer.sync_table(table_structure))
+
+        for database in databases:
+            for level in self.table_levels[database]:
+                tables = [self.source_schema.get_table(database, table) for table in level]
+                tables = [table for table in tables if table.table_type == "BASE TABLE"]
+                self.__run_concurrently(replicate_table_data, tables)
+
+        if connection.sync_mode != "full" and self.snapshot_reader is None:
+            self.write_drift_report(connection, [report.to_dict() for report in self.drift_reports[connection.name]])
+
+
+    def __import_table_data(self, data_copier:DataCopier, table_structure:Table):
+        report = TableCopyReport(table_structure.database, table_structure.name)
+        if not self.snapshot_reader.has_table(table_structure.database, table_structure.name):
+            return report
+
+        started_at = time.perf_counter()
+        data_copier.clear_table(table_structure)
+        data_copier.write_batches(
+            table_structure, self.snapshot_reader.columns(table_structure.database, table_structure.name),
+            self.snapshot_reader.read_table(table_structure.database, table_structure.name), report
+        )
+        report.seconds = time.perf_counter() - started_at
+        return report
+
+
+    def write_drift_report(self, connection:Connection, reports:list):
+        os.makedirs(self.state_dir, exist_ok=True)
+        file_name = re.sub(r"[^\w.-]", "_", f"drift_report_{connection.host}_{connection.port}.json")
+
+        with open(os.path.join(self.state_dir, file_name), "w", encoding="utf-8") as file_open:
+            json.dump(reports, file_open, indent=2)
+
+
+    def replicate_databases(self, connection:Connection, database:str, target_schema:SchemaSnapshot):
+        if not target_schema.has_database(database) and not connection.verify_if_database_exists(database):
             connection.create_database(database)
 
 
-    def __replicate_tables(self, connection:Connection, database:str):
-        for table in self.replicated_connection.table_associated_to_database.get(database):
-            base_structure_table = self.replicated_connection.find_structure_table(database, table)
-            structure_table = connection.find_structure_table(database, table)
+    def replicate_tables(self, connection:Connection, database:str, target_schema:SchemaSnapshot):
+        created_tables = []
+
+        def replicate_table(table):
+            if not self.should_replicate(connection, database, table):
+                return
+            with instrumentation.span("table structure", target=connection.name, table=f"{database}.{table}"):
+                if self.__replicate_table_structure(connection, database, table, target_schema):
+                    created_tables.append(table)
+
+        for level in self.table_levels[database]:
+            self.__run_concurrently(replicate_table, level)
+
+        self.__add_deferred_foreign_keys(connection, database, created_tables)
+
+
+    def __replicate_table_structure(self, connection:Connection, database:str, table:str, target_schema:SchemaSnapshot):
+        '''
+        Create the table or align its columns, returns True when it was created.
+        '''
+        target_table = target_schema.get_table(database, table)
+
+        if target_table is None:
+            self.__replicate_table(connection, database, table)
+            return True
+
+        migration_plan = self.table_migration_plan(connection, database, table, target_table)
+        if migration_plan is not None:
+            table_bytes = (target_table.data_length or 0) + (target_table.index_length or 0)
+            connection.apply_migration_plan(migration_plan, table_bytes=table_bytes, target_schema=target_schema)
+        return False
+
+
+    def table_migration_plan(self, connection:Connection, database:str, table:str, target_table:Table):
+        '''
+        Changes aligning a target table with the source, None when there are
+        none or when the table still waits for its deferred indexes.
+        '''
+        if (database, table) in self.deferred_index_builds.get(connection.name, {}):
+            return None
+
+        migration_plan = self.build_migration_plan(self.source_schema.get_table(database, table), target_table)
+        return None if migration_plan.is_empty() else migration_plan
+
+
+    def __add_deferred_foreign_keys(self, connection:Connection, database:str, created_tables:list):
+        for migration_plan in self.deferred_foreign_key_plans(connection, database, created_tables):
+            connection.apply_migration_plan(migration_plan)
 
-            if structure_table == False:
-                self.__replicate_table(connection, database, table)
+
+    def deferred_foreign_key_plans(self, connection:Connection, database:str, created_tables:list):
+        '''
+        Foreign keys closing a dependency cycle are added once every table
+        exists, on backends which left them out of the CREATE TABLE.
+        '''
+        if not connection.alter_definitions:
+            return []
+
+        deferred_foreign_keys = self.deferred_foreign_keys.get(database, {})
+        deferred_index_builds = self.deferred_index_builds.get(connection.name, {})
+        migration_plans = []
+
+        for table in created_tables:
+            if not deferred_foreign_keys.get(table) or (database, table) in deferred_index_builds:
                 continue
 
-            base_structure_table = {column[0:]: column for column in base_structure_table}
-            structure_table = {column[0:]: column for column in structure_table}
+            migration_plan = MigrationPlan(database, table)
+            for constraint in deferred_foreign_keys[table]:
+                migration_plan.add("ADD FOREIGN KEY", foreign_key_clause(constraint))
+            migration_plans.append(migration_plan)
+
+        return migration_plans
+
+
+    def __defers_indexes(self, connection:Connection):
+        return connection.data and connection.defer_indexes and connection.sync_mode == "full"
+
+
+    def deferred_tables(self, connection:Connection):
+        '''
+        (database, table) keys of the tables of a target waiting for their
+        secondary indexes, filled as tables are created.
+        '''
+        return self.deferred_index_builds.setdefault(connection.name, {})
 
-            self.__add_missing_columns(database, table, base_structure_table, structure_table, connection)
-            self.__remove_remaining_columns(database, table, base_structure_table, structure_table, connection)
+
+    def build_deferred_indexes(self, connection:Connection):
+        '''
+        Add the secondary indexes and foreign keys left out while seeding, one
+        ALTER TABLE per table, without revalidating the copied rows.
+        '''
+        migration_plans = list(self.deferred_index_builds.pop(connection.name, {}).values())
+
+        def build_indexes(migration_plan):
+            if not connection.apply_migration_plan(migration_plan, foreign_key_checks=False):
+                logger.error(
+                    "Could not build indexes of %s.%s on %s", migration_plan.database, migration_plan.table, connection.name
+                )
+                return
+            if self.journal is not None:
+                self.journal.complete_ddl(connection.name, migration_plan.database, migration_plan.table, "index_build")
+
+        self.__run_concurrently(build_indexes, migration_plans)
 
 
     def __replicate_table(self, connection:Connection, database:str, table:str):
-        original_table_structure = self.replicated_connection.show_create_table(database, table)
-        if not connection.create_table(database, original_table_structure):
-            print("ERRO")
+        script_creation = self.creation_script(connection, database, table, self.show_create_table(database, table))
+        if not connection.create_table(database, script_creation):
+            logger.error("Could not create table %s.%s on %s", database, table, connection.name)
 
 
-    def __add_missing_columns(self, database, table, base_structure_table:dict, structure_table:dict, connection:Connection):
-        missing_columns = set(base_structure_table.keys()) - set(structure_table.keys())
-        columns_to_add_constraints = []
+    def creation_script(self, connection:Connection, database:str, table:str, original_table_structure):
+        '''
+        CREATE TABLE of a table missing on a target, without its secondary
+        indexes and foreign keys when they are built after the data load, or
+        without the foreign keys closing a dependency cycle.
+        '''
+        deferred_foreign_keys = self.deferred_foreign_keys.get(database, {}).get(table)
+
+        if self.__defers_indexes(connection):
+            auto_increment_columns = [
+                column.name for column in self.source_schema.get_table(database, table).columns.values()
+                if "auto_increment" in (column.extra or "").lower()
+            ]
+            original_table_structure, changes = split_secondary_definitions(original_table_structure, auto_increment_columns)
+            if changes:
+                migration_plan = MigrationPlan(database, table)
+                for kind, clause in changes:
+                    migration_plan.add(kind, clause)
+                self.deferred_index_builds.setdefault(connection.name, {})[(database, table)] = migration_plan
+                if self.journal is not None:
+                    self.journal.add_pending_ddl(connection.name, database, table, "index_build", json.dumps(changes))
+        elif deferred_foreign_keys and connection.alter_definitions:
+            original_table_structure = remove_foreign_keys(
+                original_table_structure, [constraint.name for constraint in deferred_foreign_keys]
+            )
+
+        return original_table_structure
+
+
+    def build_migration_plan(self, source_table:Table, target_table:Table):
+        '''
+        Accumulate every change of a table into a single migration plan.
+        '''
+        migration_plan = MigrationPlan(source_table.database, source_table.name)
+        base_structure_table = {column[0]: column for column in source_table.describe()}
+        structure_table = {column[0]: column for column in target_table.describe()}
+
+        self.__remove_remaining_columns(migration_plan, base_structure_table, structure_table, target_table)
+        self.__modify_changed_columns(migration_plan, base_structure_table, structure_table)
+        self.__add_missing_columns(migration_plan, base_structure_table, structure_table, source_table, target_table)
 
-        for column in missing_columns:
-            null_column = "" if column[2] == "YES" else "NOT NULL"
-            default = "" if column[4] == None else f"DEFAULT '{column[4]}'"
-            extra = "" if not column[5] else f"{column[5]}"
+        return migration_plan
 
-            describe_column = f"{column[0]} {column[1]} {default} {null_column} {extra}"
-            connection.add_column(database, table, describe_column)
+
+    def __add_missing_columns(self, migration_plan:MigrationPlan, base_structure_table:dict, structure_table:dict, source_table:Table, target_table:Table):
+        missing_columns = [name for name in base_structure_table if name not in structure_table]
+        columns_to_add_constraints = []
+
+        for name in missing_columns:
+            column = base_structure_table[name]
+            algorithm = "COPY" if "auto_increment" in (column[5] or "").lower() else None
+            migration_plan.add("ADD COLUMN", f"ADD COLUMN {column_definition(column)}", algorithm)
 
             if column[3]:
-                columns_to_add_constraints.append(column[0])
+                columns_to_add_constraints.append(name)
         
-        self.__replicate_constraints(database, table, connection, columns_to_add_constraints)
+        self.__replicate_constraints(migration_plan, source_table, target_table, columns_to_add_constraints)
+
+
+    def __modify_changed_columns(self, migration_plan:MigrationPlan, base_structure_table:dict, structure_table:dict):
+        for name, column in base_structure_table.items():
+            target_column = structure_table.get(name)
+            if target_column is None:
+                continue
+
+            if (column[1], column[2], column[4], column[5]) != (target_column[1], target_column[2], target_column[4], target_column[5]):
+                migration_plan.add("MODIFY COLUMN", f"MODIFY COLUMN {column_definition(column)}")
         
 
-    def __replicate_constraints(self, database, table, connection:Connection, columns_to_add_constraints):
-        for column in columns_to_add_constraints:
-            describe_constraint = self.replicated_connection.find_constraint_for_table(database, table, column)
-            syntax_constraint = self.__generate_syntax_constraint(describe_constraint)
-            self.__add_constraint(connection, database, table, syntax_constraint)
-
-
-    def __generate_syntax_constraint(self, constraint_description:list):
-        constraint_type = constraint_description[0][7]
-        syntax_constraint = False
-
-        if constraint_type == "FOREIGN KEY":
-            syntax_constraint = f"""
-                ADD CONSTRAINT {constraint_description[0][0]}
-                FOREIGN KEY ({constraint_description[0][2]}) REFERENCES {constraint_description[0][3]}({constraint_description[0][4]})
-                ON DELETE {constraint_description[0][6]}
-                ON UPDATE {constraint_description[0][5]}
-            """
-        elif constraint_type == "PRIMARY KEY":
-            keys = []
-            for pk in constraint_description:
-                keys.append(pk[2])
-            syntax_constraint = f"ADD PRIMARY KEY ( {', '.join(keys)})"
-        elif constraint_type == "UNIQUE":
-            keys = []
-            for unique in constraint_description:
-                keys.append(unique[2])
-            syntax_constraint = f"ADD CONSTRAINT {constraint_description[0][2]} UNIQUE ({', '.join(keys)})"
-
-        return syntax_constraint
-    
+    def __replicate_constraints(self, migration_plan:MigrationPlan, source_table:Table, target_table:Table, columns_to_add_constraints):
+        for constraint in source_table.constraints.values():
+            if not set(constraint.columns) & set(columns_to_add_constraints):
+                continue
 
-    def __add_constraint(self, connection:Connection, database, table, column):
-        connection.modify_constraint(database, table, column)
+            target_constraint = target_table.constraints.get(constraint.name)
+            if target_constraint is not None:
+                if target_constraint.columns == constraint.columns:
+                    continue
+                self.__drop_constraint(migration_plan, target_constraint)
 
+            change = constraint_change(constraint)
+            if change:
+                migration_plan.add(*change)
 
-    def __remove_remaining_columns(self, database, table, base_structure_table:dict, structure_table:dict, connection:Connection):
-        remaining_columns = set(structure_table.keys()) - set(base_structure_table.keys())
 
-        for column in remaining_columns:
-            connection.drop_column(database, table, column[0])
-            if column[3]:
-                describe_constraint = self.replicated_connection.find_constraint_for_table(database, table, column)
-                self.__drop_constraint(connection, database, table, describe_constraint)
+    def __remove_remaining_columns(self, migration_plan:MigrationPlan, base_structure_table:dict, structure_table:dict, target_table:Table):
+        remaining_columns = [name for name in structure_table if name not in base_structure_table]
+
+        for name in remaining_columns:
+            if structure_table[name][3]:
+                for constraint in target_table.foreign_keys():
+                    if name in constraint.columns:
+                        self.__drop_constraint(migration_plan, constraint)
+            migration_plan.add("DROP COLUMN", f"DROP COLUMN `{name}`")
     
 
-    def __drop_constraint(self, connection:Connection, database, table, constraint_description):
-        constraint_type = constraint_description[7]
-        syntax_constraint = False
-
-        if constraint_type == "FOREIGN KEY":
-            syntax_constraint = f"""
-                DROP FOREIGN KEY {constraint_description[0]}
-            """
-        elif constraint_type == "PRIMARY KEY":
-            syntax_constraint = """DROP PRIMARY KEY"""
-        elif constraint_type == "UNIQUE":
-            syntax_constraint = f"""
-                DROP INDEX {constraint_description[0]}
-            """
-
-        connection.modify_constraint(database, table, syntax_constraint)
\ No newline at end of file
+    def __drop_constraint(self, migration_plan:MigrationPlan, constraint):
+        change = drop_constraint_change(constraint)
+        if change and change[1] not in migration_plan.clauses():
+            migration_plan.add(*change)
+
@@ -0,0 +1,167 @@
+import datetime
+import decimal
+
+from app.bulk_loader import BINARY_TYPES, encode_value, escape_bytes, format_timedelta
+
+INTEGER_TYPES = ("tinyint", "smallint", "mediumint", "int", "integer", "bigint", "year")
+NUMBER_TYPES = ("decimal", "numeric", "float", "double", "real")
+DATETIME_TYPES = ("datetime", "timestamp")
+NUMBER_VALUE_TYPES = (int, float, decimal.Decimal)
+NULL_FIELD = b"\\N"
+
+def column_kind(column_type):
+    '''
+    Conversion family of a column from its DESCRIBE / INFORMATION_SCHEMA type,
+    None when its values have to be inspected one by one.
+    '''
+    if not column_type:
+        return None
+
+    base_type = column_type.split("(")[0].split()[0].lower()
+    if base_type in BINARY_TYPES:
+        return "binary"
+    if base_type in INTEGER_TYPES or base_type in NUMBER_TYPES:
+        return "number"
+    if base_type in DATETIME_TYPES:
+        return "datetime"
+    if base_type == "date":
+        return "date"
+    if base_type == "time":
+        return "time"
+    if base_type in ("char", "varchar", "text", "tinytext", "mediumtext", "longtext", "enum", "set", "json"):
+        return "text"
+    return None
+
+
+def encode_number_field(value):
+    if value is None:
+        return NULL_FIELD
+    if type(value) in NUMBER_VALUE_TYPES:
+        return str(value).encode("ascii")
+    return encode_value(value)
+
+
+def encode_datetime_field(value):
+    if value is None:
+        return NULL_FIELD
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=" ").encode("ascii")
+    return encode_value(value)
+
+
+def encode_date_field(value):
+    if value is None:
+        return NULL_FIELD
+    if isinstance(value, datetime.date):
+        return value.isoformat().encode("ascii")
+    return encode_value(value)
+
+
+def encode_time_field(value):
+    if value is None:
+        return NULL_FIELD
+    if isinstance(value, datetime.timedelta):
+        return format_timedelta(value).encode("ascii")
+    return encode_value(value)
+
+
+def encode_binary_field(value):
+    '''
+    Hex of the value's buffer, read in place whether it is bytes or a memoryview.
+    '''
+    if value is None:
+        return NULL_FIELD
+    if isinstance(value, str):
+        return encode_value(value, True)
+    return value.hex().encode("ascii")
+
+
+def encode_text_field(value):
+    if value is None:
+        return NULL_FIELD
+    if isinstance(value, str):
+        return escape_bytes(value.encode("utf-8"))
+    return encode_value(value)
+
+
+def as_bytes(value):
+    '''
+    Binary values the MySQL driver can send, bytes are kept as they are.
+    '''
+    if value is None or type(value) is bytes:
+        return value
+    if isinstance(value, (bytearray, memoryview)):
+        return bytes(value)
+    return value
+
+
+FIELD_ENCODERS = {
+    "number": encode_number_field,
+    "datetime": encode_datetime_field,
+    "date": encode_date_field,
+    "time": encode_time_field,
+    "binary": encode_binary_field,
+    "text": encode_text_field,
+    None: encode_value,
+}
+
+class RowConverter:
+    '''
+    Conversions of the rows of one table, chosen once from the column types
+    instead of inspecting every value. Rows are handed to the driver as plain
+    tuples and only binary columns are touched on the way; LOAD DATA fields
+    are encoded by one function per column.
+    '''
+    def __init__(self, columns, column_types) -> None:
+        self.columns = list(columns)
+        self.kinds = [column_kind(column_type) for column_type in column_types]
+        self.binary_columns = [column for column, kind in zip(self.columns, self.kinds) if kind == "binary"]
+        self.field_encoders = [FIELD_ENCODERS[kind] for kind in self.kinds]
+        self.binary_positions = [position for position, kind in enumerate(self.kinds) if kind == "binary"]
+
+
+    @classmethod
+    def for_table(cls, table, columns):
+        '''
+        Converter of the given columns of a schema Table, columns unknown to
+        it are converted value by value.
+        '''
+        column_types = [
+            table.columns[column].column_type if column in table.columns else None for column in columns
+        ]
+        return cls(columns, column_types)
+
+
+    def tuples(self, rows):
+        '''
+        Rows as plain tuples for executemany. A list of tuples is passed
+        through untouched, and so are rows whose binary values are bytes.
+        '''
+        if not (rows and type(rows[0]) is tuple):
+            rows = list(map(tuple, rows))
+        if not self.binary_positions:
+            return rows
+        return [self.__bytes_row(row) for row in rows]
+
+
+    def __bytes_row(self, row):
+        for position in self.binary_positions:
+            value = row[position]
+            if value is not None and type(value) is not bytes:
+                break
+        else:
+            return row
+
+        row = list(row)
+        for position in self.binary_positions:
+            row[position] = as_bytes(row[position])
+        return tuple(row)
+
+
+    def encode_rows(self, rows):
+        '''
+        Yield the tab separated LOAD DATA line of every row.
+        '''
+        field_encoders = self.field_encoders
+        for row in rows:
+            yield b"\t".join([encode(value) for encode, value in zip(field_encoders, row)])
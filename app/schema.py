@@ -0,0 +1,175 @@
+import hashlib
+import json
+
+class Column:
+    def __init__(self, name, column_type, nullable, key, default, extra, position = 0) -> None:
+        self.name = name
+        self.column_type = column_type
+        self.nullable = nullable
+        self.key = key
+        self.default = default
+        self.extra = extra
+        self.position = position
+
+
+    def describe(self):
+        '''
+        Same layout as a DESCRIBE row: Field, Type, Null, Key, Default, Extra.
+        '''
+        return (self.name, self.column_type, self.nullable, self.key, self.default, self.extra)
+
+
+class Index:
+    def __init__(self, name, unique, index_type = "BTREE") -> None:
+        self.name = name
+        self.unique = unique
+        self.index_type = index_type
+        self.columns = []
+
+
+class Constraint:
+    def __init__(self, name, constraint_type, on_update = None, on_delete = None) -> None:
+        self.name = name
+        self.constraint_type = constraint_type
+        self.on_update = on_update
+        self.on_delete = on_delete
+        self.columns = []
+        self.referenced_table = None
+        self.referenced_columns = []
+
+
+class Table:
+    def __init__(self, database, name, table_type = "BASE TABLE", engine = None, rows = 0, data_length = 0, index_length = 0, create_time = None, update_time = None) -> None:
+        self.database = database
+        self.name = name
+        self.table_type = table_type
+        self.engine = engine
+        self.rows = rows or 0
+        self.data_length = data_length or 0
+        self.index_length = index_length or 0
+        self.create_time = create_time
+        self.update_time = update_time
+        self.columns = {}
+        self.indexes = {}
+        self.constraints = {}
+
+
+    def describe(self):
+        return [column.describe() for column in sorted(self.columns.values(), key=lambda column: column.position)]
+
+
+    def foreign_keys(self):
+        return [constraint for constraint in self.constraints.values() if constraint.constraint_type == "FOREIGN KEY"]
+
+
+    def primary_key(self):
+        constraint = self.constraints.get("PRIMARY")
+        return list(constraint.columns) if constraint else []
+
+
+    def referenced_tables(self):
+        return [constraint.referenced_table for constraint in self.foreign_keys()]
+
+
+    def fingerprint(self):
+        '''
+        Hash of the normalized definition, equal on two servers when the
+        tables have the same columns, indexes and constraints.
+        '''
+        definition = {
+            "columns": [list(column) for column in self.describe()],
+            "indexes": sorted(
+                [index.name, index.unique, index.index_type, index.columns] for index in self.indexes.values()
+            ),
+            "constraints": sorted(
+                [
+                    constraint.name, constraint.constraint_type, constraint.columns, constraint.referenced_table,
+                    constraint.referenced_columns, constraint.on_update, constraint.on_delete
+                ]
+                for constraint in self.constraints.values()
+            ),
+        }
+        normalized = json.dumps(definition, sort_keys=True, default=str)
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class SchemaSnapshot:
+    '''
+    In-memory model of every selected database of a server, loaded from
+    INFORMATION_SCHEMA with a handful of set-based queries.
+    '''
+    def __init__(self) -> None:
+        self.databases = {}
+
+
+    def add_table(self, table:Table):
+        self.databases.setdefault(table.database, {})[table.name] = table
+
+
+    def get_table(self, database, table):
+        return self.databases.get(database, {}).get(table)
+
+
+    def tables(self, database):
+        return self.databases.get(database, {})
+
+
+    def table_names(self, database):
+        return list(self.tables(database).keys())
+
+
+    def has_database(self, database):
+        return database in self.databases
+
+
+    def replace_databases(self, snapshot, databases):
+        '''
+        Take the tables of the given databases from a newer snapshot.
+        '''
+        for database in databases:
+            self.databases[database] = dict(snapshot.tables(database))
+
+
+    @classmethod
+    def build(cls, tables, columns, constraints, statistics):
+        snapshot = cls()
+
+        for database, name, table_type, engine, rows, data_length, index_length, create_time, update_time in tables:
+            snapshot.add_table(Table(
+                database, name, table_type, engine, rows, data_length, index_length, create_time, update_time
+            ))
+
+        for database, table_name, name, column_type, nullable, key, default, extra, position in columns:
+            table = snapshot.get_table(database, table_name)
+            if table is None:
+                continue
+            table.columns[name] = Column(name, column_type, nullable, key, default, extra, position)
+
+        for row in constraints:
+            database, table_name, name, constraint_type, column, referenced_table, referenced_column, on_update, on_delete = row
+            table = snapshot.get_table(database, table_name)
+            if table is None:
+                continue
+
+            constraint = table.constraints.get(name)
+            if constraint is None:
+                constraint = Constraint(name, constraint_type, on_update, on_delete)
+                table.constraints[name] = constraint
+
+            constraint.columns.append(column)
+            if referenced_table:
+                constraint.referenced_table = referenced_table
+                constraint.referenced_columns.append(referenced_column)
+
+        for database, table_name, name, non_unique, column, index_type in statistics:
+            table = snapshot.get_table(database, table_name)
+            if table is None:
+                continue
+
+            index = table.indexes.get(name)
+            if index is None:
+                index = Index(name, not int(non_unique), index_type)
+                table.indexes[name] = index
+            index.columns.append(column)
+
+        return snapshot
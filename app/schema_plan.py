@@ -0,0 +1,182 @@
+import json
+import os
+import time
+
+from app.migration_plan import MigrationPlan
+
+COPY_BYTES_PER_SECOND = 50 * 1024 * 1024
+
+def estimate_seconds(algorithm, table_bytes, copy_rate = COPY_BYTES_PER_SECOND, online_change = False):
+    '''
+    Expected duration and lock time of an ALTER TABLE. INSTANT only changes
+    metadata, INPLACE rebuilds the table while writes go on and COPY blocks
+    writes for the whole rebuild, unless it runs as an online schema change.
+    '''
+    if algorithm == "INSTANT":
+        return 0.0, 0.0
+
+    rebuild_seconds = table_bytes / copy_rate
+    if algorithm == "INPLACE" or online_change:
+        return rebuild_seconds, 0.0
+    return rebuild_seconds, rebuild_seconds
+
+
+class PlannedStatement:
+    def __init__(self, target, database, table, kind, statement, changes = None, algorithm = None,
+                 table_rows = 0, table_bytes = 0, estimated_seconds = 0.0, estimated_lock_seconds = 0.0, online_change = False) -> None:
+        self.target = target
+        self.database = database
+        self.table = table
+        self.kind = kind
+        self.statement = statement
+        self.changes = changes or []
+        self.algorithm = algorithm
+        self.table_rows = table_rows
+        self.table_bytes = table_bytes
+        self.estimated_seconds = estimated_seconds
+        self.estimated_lock_seconds = estimated_lock_seconds
+        self.online_change = online_change
+
+
+    def migration_plan(self):
+        migration_plan = MigrationPlan(self.database, self.table)
+        for kind, clause, algorithm in self.changes:
+            migration_plan.add(kind, clause, algorithm)
+        return migration_plan
+
+
+    def to_dict(self):
+        return {
+            "target": self.target,
+            "database": self.database,
+            "table": self.table,
+            "kind": self.kind,
+            "statement": self.statement,
+            "changes": [list(change) for change in self.changes],
+            "algorithm": self.algorithm,
+            "table_rows": self.table_rows,
+            "table_bytes": self.table_bytes,
+            "estimated_seconds": round(self.estimated_seconds, 3),
+            "estimated_lock_seconds": round(self.estimated_lock_seconds, 3),
+            "online_change": self.online_change,
+        }
+
+
+class SchemaPlan:
+    '''
+    DDL a run would execute on every target, with the size of each altered
+    table and the expected duration and lock time of its ALTER TABLE. Saved
+    as JSON, applied later without introspecting the servers again, and as a
+    SQL script for review.
+    '''
+    def __init__(self, source, copy_rate = COPY_BYTES_PER_SECOND, created_at = None) -> None:
+        self.source = source
+        self.copy_rate = copy_rate
+        self.created_at = created_at or time.time()
+        self.statements = []
+
+
+    def add_statement(self, target, database, table, kind, statement):
+        self.statements.append(PlannedStatement(target, database, table, kind, statement))
+
+
+    def add_migration_plan(self, target, migration_plan:MigrationPlan, target_table = None, online_change_threshold = 0):
+        algorithm = migration_plan.algorithm()
+        table_rows, table_bytes = 0, 0
+        if target_table is not None:
+            table_rows = target_table.rows or 0
+            table_bytes = (target_table.data_length or 0) + (target_table.index_length or 0)
+        online_change = algorithm == "COPY" and 0 < online_change_threshold <= table_bytes
+        estimated_seconds, estimated_lock_seconds = estimate_seconds(algorithm, table_bytes, self.copy_rate, online_change)
+
+        self.statements.append(PlannedStatement(
+            target, migration_plan.database, migration_plan.table, "ALTER TABLE",
+            migration_plan.statement(algorithm), migration_plan.changes, algorithm,
+            table_rows, table_bytes, estimated_seconds, estimated_lock_seconds, online_change
+        ))
+
+
+    def targets(self):
+        return list(dict.fromkeys(statement.target for statement in self.statements))
+
+
+    def statements_for(self, target):
+        return [statement for statement in self.statements if statement.target == target]
+
+
+    def summary(self):
+        return {
+            target: {
+                "statements": len(statements),
+                "copy_alters": sum(1 for statement in statements if statement.algorithm == "COPY"),
+                "estimated_seconds": round(sum(statement.estimated_seconds for statement in statements), 3),
+                "estimated_lock_seconds": round(sum(statement.estimated_lock_seconds for statement in statements), 3),
+            }
+            for target in self.targets()
+            for statements in [self.statements_for(target)]
+        }
+
+
+    def to_dict(self):
+        return {
+            "source": self.source,
+            "created_at": self.created_at,
+            "copy_rate": self.copy_rate,
+            "summary": self.summary(),
+            "statements": [statement.to_dict() for statement in self.statements],
+        }
+
+
+    def to_sql(self):
+        lines = [f"-- Plan of {self.source}, {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.created_at))}"]
+
+        for target in self.targets():
+            lines.append("")
+            lines.append(f"-- Target {target}")
+            database = None
+            for statement in self.statements_for(target):
+                if statement.kind != "CREATE DATABASE" and statement.database != database:
+                    database = statement.database
+                    lines.append(f"USE `{database}`;")
+                if statement.kind == "ALTER TABLE":
+                    lines.append(
+                        f"-- {statement.algorithm}{' (online change)' if statement.online_change else ''}, "
+                        f"{statement.table_rows} rows, {statement.table_bytes} bytes, "
+                        f"about {statement.estimated_seconds:.1f}s with {statement.estimated_lock_seconds:.1f}s of locked writes"
+                    )
+                lines.append(f"{statement.statement};")
+
+        return "\n".join(lines) + "\n"
+
+
+    def save(self, path):
+        '''
+        Write the plan to path and its SQL script next to it.
+        '''
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with open(path, "w", encoding="utf-8") as file_open:
+            json.dump(self.to_dict(), file_open, indent=2, default=str)
+
+        with open(f"{os.path.splitext(path)[0]}.sql", "w", encoding="utf-8") as file_open:
+            file_open.write(self.to_sql())
+
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as file_open:
+            content = json.load(file_open)
+
+        schema_plan = cls(content["source"], content.get("copy_rate", COPY_BYTES_PER_SECOND), content.get("created_at"))
+        for statement in content.get("statements", []):
+            schema_plan.statements.append(PlannedStatement(
+                statement["target"], statement["database"], statement["table"], statement["kind"],
+                statement["statement"], [tuple(change) for change in statement.get("changes", [])],
+                statement.get("algorithm"), statement.get("table_rows", 0), statement.get("table_bytes", 0),
+                statement.get("estimated_seconds", 0.0), statement.get("estimated_lock_seconds", 0.0),
+                statement.get("online_change", False)
+            ))
+
+        return schema_plan
@@ -0,0 +1,246 @@
+import logging
+import multiprocessing
+import os
+import socket
+import time
+
+from app.connection_db import Connection
+from app.data_copy import DataCopier
+from app.delta_sync import DeltaSynchronizer
+from app.engine_registry import engine_registry
+from app.instrumentation import instrumentation
+from app.key_ranges import find_key_ranges
+from app.replicator import Replicator
+from app.work_queue import LeaseKeeper, WorkQueue, WorkUnit
+
+logger = logging.getLogger(__name__)
+
+class ShardedReplicator(Replicator):
+    '''
+    Replicator splitting a run into work units (coordinate) shared by any
+    number of worker processes (work).
+    '''
+    def __init__(self, config_file = "connections.json") -> None:
+        super().__init__(config_file)
+
+        sharding = self.config_file.get("SHARDING", {})
+        self.lease_seconds = float(sharding.get("LEASE_SECONDS", 60))
+        self.shard_poll_interval = float(sharding.get("POLL_INTERVAL", 2))
+        self.shard_range_rows = int(sharding.get("RANGE_ROWS", 100000))
+        self.shard_max_attempts = int(sharding.get("MAX_ATTEMPTS", 3))
+        if self.lease_seconds <= 0 or self.shard_poll_interval <= 0:
+            raise ValueError("SHARDING LEASE_SECONDS and POLL_INTERVAL must be positive")
+        if self.shard_range_rows < 1 or self.shard_max_attempts < 1:
+            raise ValueError("SHARDING RANGE_ROWS and MAX_ATTEMPTS must be at least 1")
+
+
+    def coordinate(self, path = None, local_workers = 0):
+        '''
+        Split the replication into work units run by `work` processes: the
+        structure of each database on each target, then the rows of each of
+        its tables, in primary key ranges of about RANGE_ROWS rows for full
+        copies of larger tables. Waits until no unit is left; a store left
+        unfinished by a previous coordinator is resumed as it is.
+        '''
+        path = path or os.path.join(self.state_dir, "work_units.sqlite")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        work_queue = WorkQueue(path, self.lease_seconds, self.shard_max_attempts)
+        workers = []
+
+        try:
+            instrumentation.reset()
+            with instrumentation.span("coordinate"):
+                if work_queue.is_finished() or not work_queue.counts():
+                    with instrumentation.span("discover"):
+                        self.find_databases_to_replicate()
+                    with instrumentation.span("introspect"):
+                        self.__load_sharded_schema()
+                    with instrumentation.span("partition"):
+                        units = self.__partition_work()
+                        work_queue.clear()
+                        work_queue.add_units(units)
+                    logger.info("Split the replication into %s work units in %s", len(units), path)
+                else:
+                    logger.info("Resuming the work units left in %s", path)
+
+                for _ in range(local_workers):
+                    worker = multiprocessing.get_context("spawn").Process(target=run_worker, args=(self.file_path, path))
+                    worker.start()
+                    workers.append(worker)
+
+                with instrumentation.span("wait"):
+                    self.__wait_for_work(work_queue)
+
+            self.__collect_work_results(work_queue)
+
+        finally:
+            for worker in workers:
+                worker.join()
+            work_queue.close()
+            self.write_run_report()
+            engine_registry.dispose_all()
+
+
+    def work(self, path = None, worker_id = None):
+        '''
+        Claim and run the units of a coordinated run until none is left. Any
+        number of workers, on this host or others sharing the store, may run
+        at once; the units of a worker which stopped are run again by the
+        others once their lease expired.
+        '''
+        path = path or os.path.join(self.state_dir, "work_units.sqlite")
+        worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        work_queue = WorkQueue(path, self.lease_seconds, self.shard_max_attempts)
+        connections = {connection.name: connection for connection in self.other_connections}
+
+        for connection in self.other_connections:
+            if connection.defer_indexes:
+                logger.warning("Indexes are not deferred on %s, its tables are copied by several workers", connection.name)
+                connection.defer_indexes = False
+
+        try:
+            instrumentation.reset()
+            with instrumentation.span("work", worker=worker_id):
+                with instrumentation.span("discover"):
+                    self.find_databases_to_replicate()
+                with instrumentation.span("introspect"):
+                    self.__load_sharded_schema()
+
+                while True:
+                    unit = work_queue.claim(worker_id)
+                    if unit is None:
+                        if work_queue.is_finished():
+                            return
+                        time.sleep(self.shard_poll_interval)
+                        continue
+
+                    self.__run_work_unit(work_queue, unit, worker_id, connections)
+
+        finally:
+            work_queue.close()
+            self.write_run_report(f"run_report_{worker_id.replace(':', '_')}.json")
+            engine_registry.dispose_all()
+
+
+    def __load_sharded_schema(self):
+        self.source_schema = self.replicated_connection.load_schema_snapshot(self.replicated_connection.database)
+        self.associate_tables_to_databases()
+        self.sort_tables_by_dependencies()
+
+
+    def __partition_work(self):
+        '''
+        Data units of a target's database depend on its structure unit, the
+        key ranges of a table are found once for every target.
+        '''
+        units = []
+        key_ranges = {}
+
+        for connection in self.other_connections:
+            for database, tables in self.replicated_connection.table_associated_to_database.items():
+                structure_unit = f"{connection.name}/{database}"
+                units.append(WorkUnit(structure_unit, "structure", connection.name, database))
+                if not connection.data:
+                    continue
+
+                for table in tables:
+                    table_structure = self.source_schema.get_table(database, table)
+                    if table_structure.table_type != "BASE TABLE":
+                        continue
+
+                    key_columns = table_structure.primary_key()
+                    if connection.sync_mode != "full" or not key_columns or table_structure.rows < self.shard_range_rows:
+                        units.append(WorkUnit(f"{structure_unit}/{table}", "data", connection.name, database, table, depends_on=structure_unit))
+                        continue
+
+                    if (database, table) not in key_ranges:
+                        with self.replicated_connection.checkout(database) as source_connection:
+                            key_ranges[(database, table)] = find_key_ranges(
+                                source_connection, table, key_columns, self.shard_range_rows
+                            )
+                    for position, key_range in enumerate(key_ranges[(database, table)]):
+                        units.append(WorkUnit(
+                            f"{structure_unit}/{table}/{position:06d}", "data_range", connection.name, database, table,
+                            key_range, structure_unit
+                        ))
+
+        return units
+
+
+    def __wait_for_work(self, work_queue:WorkQueue):
+        counts = None
+        while not work_queue.is_finished():
+            time.sleep(self.shard_poll_interval)
+            if work_queue.counts() != counts:
+                counts = work_queue.counts()
+                logger.info("Work units: %s", ", ".join(f"{count} {status}" for status, count in sorted(counts.items())))
+
+
+    def __run_work_unit(self, work_queue:WorkQueue, unit:WorkUnit, worker_id, connections:dict):
+        connection = connections.get(unit.target)
+        if connection is None:
+            work_queue.fail(unit, worker_id, f"Target {unit.target} is not configured on {worker_id}")
+            return
+
+        try:
+            with LeaseKeeper(work_queue, unit, worker_id) as lease_keeper:
+                with instrumentation.span("work unit", unit=unit.unit_id, attempt=unit.attempts):
+                    result = self.__execute_work_unit(connection, unit)
+
+            if lease_keeper.lost:
+                logger.warning("The lease of %s expired while it ran, another worker runs it", unit.unit_id)
+                return
+            work_queue.complete(unit, worker_id, result)
+        except Exception as e:
+            logger.error("Work unit %s failed on %s: %s", unit.unit_id, worker_id, e)
+            work_queue.fail(unit, worker_id, e)
+
+
+    def __execute_work_unit(self, connection:Connection, unit:WorkUnit):
+        if unit.kind == "structure":
+            target_schema = connection.load_schema_snapshot([unit.database])
+            self.replicate_databases(connection, unit.database, target_schema)
+            self.replicate_tables(connection, unit.database, target_schema)
+            return None
+
+        table_structure = self.source_schema.get_table(unit.database, unit.table)
+        if table_structure is None:
+            raise ValueError(f"Table {unit.database}.{unit.table} not found on the source")
+
+        if unit.kind == "data_range":
+            return DataCopier(self.replicated_connection, connection).copy_range(table_structure, unit.key_range).to_dict()
+        if connection.sync_mode == "full":
+            return DataCopier(self.replicated_connection, connection).copy_table(table_structure).to_dict()
+
+        synchronizer = DeltaSynchronizer(self.replicated_connection, connection, check_only=connection.sync_mode == "check")
+        return synchronizer.sync_table(table_structure).to_dict()
+
+
+    def __collect_work_results(self, work_queue:WorkQueue):
+        '''
+        Write the drift reports of the units done and fail the run when any
+        unit failed.
+        '''
+        connections = {connection.name: connection for connection in self.other_connections}
+        drift_reports = {}
+        for _, target, result in work_queue.results("data"):
+            if target in connections and connections[target].sync_mode != "full":
+                drift_reports.setdefault(target, []).append(result)
+
+        for target, reports in drift_reports.items():
+            self.write_drift_report(connections[target], reports)
+
+        self.target_errors = {}
+        for unit_id, target, error in work_queue.failures():
+            logger.error("Work unit %s failed: %s", unit_id, error)
+            self.target_errors.setdefault(target, error)
+
+        if self.target_errors:
+            raise ValueError(f"Replication failed for {', '.join(self.target_errors)}")
+
+
+def run_worker(config_file, path):
+    '''
+    Entry point of the worker processes started by ShardedReplicator.coordinate.
+    '''
+    ShardedReplicator(config_file).work(path)
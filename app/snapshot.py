@@ -0,0 +1,305 @@
+import datetime
+import decimal
+import json
+import mmap
+import struct
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+MAGIC = b"DRSNAP02"
+FORMAT_VERSION = 2
+FOOTER = struct.Struct("<QQ8s")
+SEGMENT_HEADER = struct.Struct("<II")
+
+# Every value of a segment is a type code followed by its payload, the same
+# on every platform and Python version: fixed size little-endian numbers, or
+# a 32 bit length and the bytes (UTF-8 for text) of variable size values.
+NONE, FALSE, TRUE, INTEGER, BIG_INTEGER, FLOAT, TEXT, BYTES, DECIMAL, DATETIME, DATE, TIME, TIMEDELTA = range(13)
+CODE = struct.Struct("<B")
+INTEGER_VALUE = struct.Struct("<Bq")
+FLOAT_VALUE = struct.Struct("<Bd")
+TIMEDELTA_VALUE = struct.Struct("<Biii")
+SIZED_VALUE = struct.Struct("<BI")
+INT64 = struct.Struct("<q")
+DOUBLE = struct.Struct("<d")
+DAYS_SECONDS_MICROSECONDS = struct.Struct("<iii")
+LENGTH = struct.Struct("<I")
+
+TEXT_DECODERS = {
+    TEXT: str,
+    BIG_INTEGER: int,
+    DECIMAL: decimal.Decimal,
+    DATETIME: datetime.datetime.fromisoformat,
+    DATE: datetime.date.fromisoformat,
+    TIME: datetime.time.fromisoformat,
+}
+
+def pack_text(code, text, parts):
+    data = text.encode("utf-8")
+    parts.append(SIZED_VALUE.pack(code, len(data)))
+    parts.append(data)
+
+
+def pack_value(value, parts):
+    '''
+    Append the encoding of one value to parts. Each value carries its own
+    type, so a column mixing types decodes value by value. Types without a
+    code of their own (SET values aside) are stored as their text.
+    '''
+    if value is None:
+        parts.append(CODE.pack(NONE))
+    elif isinstance(value, bool):
+        parts.append(CODE.pack(TRUE if value else FALSE))
+    elif isinstance(value, int):
+        if -2 ** 63 <= value < 2 ** 63:
+            parts.append(INTEGER_VALUE.pack(INTEGER, value))
+        else:
+            pack_text(BIG_INTEGER, str(value), parts)
+    elif isinstance(value, float):
+        parts.append(FLOAT_VALUE.pack(FLOAT, value))
+    elif isinstance(value, str):
+        pack_text(TEXT, value, parts)
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        data = value if type(value) is bytes else bytes(value)
+        parts.append(SIZED_VALUE.pack(BYTES, len(data)))
+        parts.append(data)
+    elif isinstance(value, decimal.Decimal):
+        pack_text(DECIMAL, str(value), parts)
+    elif isinstance(value, datetime.datetime):
+        pack_text(DATETIME, value.isoformat(), parts)
+    elif isinstance(value, datetime.date):
+        pack_text(DATE, value.isoformat(), parts)
+    elif isinstance(value, datetime.time):
+        pack_text(TIME, value.isoformat(), parts)
+    elif isinstance(value, datetime.timedelta):
+        parts.append(TIMEDELTA_VALUE.pack(TIMEDELTA, value.days, value.seconds, value.microseconds))
+    elif isinstance(value, (set, frozenset)):
+        pack_text(TEXT, ",".join(sorted(value)), parts)
+    else:
+        pack_text(TEXT, str(value), parts)
+
+
+def unpack_value(data, offset):
+    '''
+    Value starting at offset in data, and the offset following it.
+    '''
+    code = data[offset]
+    offset += 1
+    if code == NONE:
+        return None, offset
+    if code == INTEGER:
+        return INT64.unpack_from(data, offset)[0], offset + INT64.size
+    if code == FLOAT:
+        return DOUBLE.unpack_from(data, offset)[0], offset + DOUBLE.size
+    if code == FALSE or code == TRUE:
+        return code == TRUE, offset
+    if code == TIMEDELTA:
+        return datetime.timedelta(*DAYS_SECONDS_MICROSECONDS.unpack_from(data, offset)), offset + DAYS_SECONDS_MICROSECONDS.size
+
+    length = LENGTH.unpack_from(data, offset)[0]
+    offset += LENGTH.size
+    raw = data[offset:offset + length]
+    if code == BYTES:
+        return bytes(raw), offset + length
+    if code not in TEXT_DECODERS:
+        raise ValueError(f"Unknown value code {code} in snapshot segment")
+    return TEXT_DECODERS[code](str(raw, "utf-8")), offset + length
+
+
+def encode_segment(rows, level = 6):
+    '''
+    Compressed column-wise batch: the row and column counts, then the values
+    of each column in turn.
+    '''
+    column_count = len(rows[0]) if rows else 0
+    parts = [SEGMENT_HEADER.pack(len(rows), column_count)]
+    for values in zip(*rows):
+        for value in values:
+            pack_value(value, parts)
+
+    return zlib.compress(b"".join(parts), level)
+
+
+def decode_segment(data):
+    data = zlib.decompress(data)
+    row_count, column_count = SEGMENT_HEADER.unpack_from(data)
+    offset = SEGMENT_HEADER.size
+
+    columns = []
+    for _ in range(column_count):
+        values = []
+        for _ in range(row_count):
+            value, offset = unpack_value(data, offset)
+            values.append(value)
+        columns.append(values)
+
+    if not columns:
+        return [() for _ in range(row_count)]
+    return list(zip(*columns))
+
+
+class SnapshotWriter:
+    '''
+    Write a portable snapshot: the source schema followed by the rows of every
+    table in compressed segments, with an index in the footer so each segment
+    can be located and read on its own.
+    '''
+    def __init__(self, path, source, compression_level = 6) -> None:
+        self.path = path
+        self.compression_level = compression_level
+        self.file = open(path, "wb")
+        self.file.write(MAGIC)
+        self.index = {
+            "format_version": FORMAT_VERSION,
+            "source": source,
+            "created_at": time.time(),
+            "databases": [],
+            "schema_rows": [[], [], [], []],
+            "create_statements": {},
+            "tables": {},
+        }
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def set_schema(self, databases, schema_rows, create_statements:dict):
+        '''
+        schema_rows as returned by Connection.find_schema_rows, create_statements
+        keyed by (database, table).
+        '''
+        self.index["databases"] = list(databases)
+        self.index["schema_rows"] = [[list(row) for row in rows] for rows in schema_rows]
+        self.index["create_statements"] = {
+            f"{database}.{table}": statement for (database, table), statement in create_statements.items()
+        }
+
+
+    def write_table(self, database, table, columns, batches):
+        entry = {"columns": list(columns), "rows": 0, "segments": []}
+        self.index["tables"][f"{database}.{table}"] = entry
+
+        for rows in batches:
+            if not rows:
+                continue
+            data = encode_segment(rows, self.compression_level)
+            entry["segments"].append([self.file.tell(), len(data), len(rows)])
+            entry["rows"] += len(rows)
+            self.file.write(data)
+
+        return entry["rows"]
+
+
+    def close(self):
+        if self.file.closed:
+            return
+
+        index = zlib.compress(json.dumps(self.index, default=str).encode("utf-8"), self.compression_level)
+        index_offset = self.file.tell()
+        self.file.write(index)
+        self.file.write(FOOTER.pack(index_offset, len(index), MAGIC))
+        self.file.close()
+
+
+class SnapshotReader:
+    '''
+    Read a snapshot through a memory map. Segments are decompressed straight
+    from the map, several at a time when read_workers > 1.
+    '''
+    def __init__(self, path, read_workers = 1) -> None:
+        self.path = path
+        self.read_workers = max(1, read_workers)
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.map[:len(MAGIC)] != MAGIC or len(self.map) < len(MAGIC) + FOOTER.size:
+            header = self.map[:len(MAGIC)]
+            self.close()
+            if header[:6] == MAGIC[:6]:
+                raise ValueError(f"{path} was written in snapshot format {header[6:].decode('ascii', 'replace')}, export it again")
+            raise ValueError(f"{path} is not a snapshot")
+
+        index_offset, index_length, magic = FOOTER.unpack(self.map[-FOOTER.size:])
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is truncated")
+
+        self.index = json.loads(zlib.decompress(self.map[index_offset:index_offset + index_length]))
+        if self.index.get("format_version") != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"{path} has an unsupported snapshot format version")
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    @property
+    def source(self):
+        return self.index["source"]
+
+
+    @property
+    def databases(self):
+        return self.index["databases"]
+
+
+    @property
+    def schema_rows(self):
+        return self.index["schema_rows"]
+
+
+    def create_statement(self, database, table):
+        return self.index["create_statements"].get(f"{database}.{table}")
+
+
+    def has_table(self, database, table):
+        return f"{database}.{table}" in self.index["tables"]
+
+
+    def columns(self, database, table):
+        return self.index["tables"][f"{database}.{table}"]["columns"]
+
+
+    def read_segment(self, database, table, position):
+        offset, length, _ = self.index["tables"][f"{database}.{table}"]["segments"][position]
+        with memoryview(self.map)[offset:offset + length] as data:
+            return decode_segment(data)
+
+
+    def read_table(self, database, table):
+        '''
+        Yield the row batches of a table in order, decoding up to read_workers
+        segments ahead.
+        '''
+        positions = range(len(self.index["tables"][f"{database}.{table}"]["segments"]))
+        if self.read_workers == 1:
+            for position in positions:
+                yield self.read_segment(database, table, position)
+            return
+
+        with ThreadPoolExecutor(max_workers=self.read_workers) as executor:
+            pending = deque()
+            for position in positions:
+                pending.append(executor.submit(self.read_segment, database, table, position))
+                if len(pending) >= self.read_workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+
+    def close(self):
+        if getattr(self, "map", None) is not None and not self.map.closed:
+            self.map.close()
+        self.file.close()
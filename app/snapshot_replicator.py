@@ -0,0 +1,107 @@
+import logging
+import os
+
+from app.data_copy import DataCopier
+from app.engine_registry import engine_registry
+from app.instrumentation import instrumentation
+from app.replicator import Replicator
+from app.schema import SchemaSnapshot, Table
+from app.snapshot import SnapshotReader, SnapshotWriter
+
+logger = logging.getLogger(__name__)
+
+class SnapshotReplicator(Replicator):
+    '''
+    Replicator writing the source to a snapshot file (export_snapshot) and
+    restoring a snapshot to the targets (import_snapshot), the snapshot
+    standing in for the source rows.
+    '''
+    def __init__(self, config_file = "connections.json") -> None:
+        super().__init__(config_file)
+
+        self.snapshot_segment_rows = int(self.config_file.get("SNAPSHOT_SEGMENT_ROWS", 10000))
+        self.snapshot_read_workers = int(self.config_file.get("SNAPSHOT_READ_WORKERS", 2))
+        if self.snapshot_segment_rows < 1 or self.snapshot_read_workers < 1:
+            raise ValueError("SNAPSHOT_SEGMENT_ROWS and SNAPSHOT_READ_WORKERS must be at least 1")
+
+
+    def export_snapshot(self, path = None):
+        '''
+        Dump the source schema and the rows of every table to a snapshot file,
+        for targets the source cannot reach.
+        '''
+        path = path or os.path.join(self.state_dir, "snapshot.drs")
+
+        try:
+            instrumentation.reset()
+            with instrumentation.span("export"):
+                with instrumentation.span("discover"):
+                    self.find_databases_to_replicate()
+                with instrumentation.span("introspect"):
+                    databases = self.replicated_connection.database
+                    schema_rows = self.replicated_connection.find_schema_rows(databases)
+                    self.source_schema = SchemaSnapshot.build(*schema_rows)
+                    self.associate_tables_to_databases()
+                with instrumentation.span("sort"):
+                    self.sort_tables_by_dependencies()
+
+                create_statements = {}
+                for database in databases:
+                    for table in self.replicated_connection.table_associated_to_database[database]:
+                        create_statements[(database, table)] = self.show_create_table(database, table)
+
+                with SnapshotWriter(path, self.replicated_connection.name) as snapshot_writer:
+                    snapshot_writer.set_schema(databases, schema_rows, create_statements)
+                    for database in databases:
+                        for level in self.table_levels[database]:
+                            for table in level:
+                                self.__export_table(snapshot_writer, self.source_schema.get_table(database, table))
+
+            logger.info("Snapshot of %s written to %s", self.replicated_connection.name, path)
+
+        finally:
+            self.write_run_report()
+            engine_registry.dispose_all()
+
+
+    def import_snapshot(self, path = None):
+        '''
+        Restore a snapshot to every target like a run from the source it was
+        taken from: structures are created or aligned and DATA targets receive
+        the rows, following the dependency levels.
+        '''
+        path = path or os.path.join(self.state_dir, "snapshot.drs")
+
+        try:
+            instrumentation.reset()
+            with instrumentation.span("import"):
+                self.snapshot_reader = SnapshotReader(path, self.snapshot_read_workers)
+                self.source_schema = SchemaSnapshot.build(*self.snapshot_reader.schema_rows)
+                self.replicated_connection.database = self.snapshot_reader.databases
+                self.tables_to_replicate = {}
+                self.associate_tables_to_databases()
+                self.sort_tables_by_dependencies()
+
+                with instrumentation.span("replicate"):
+                    self.replicate_databases_and_tables_to_others_connections()
+
+        finally:
+            if self.snapshot_reader is not None:
+                self.snapshot_reader.close()
+                self.snapshot_reader = None
+            self.write_run_report()
+            engine_registry.dispose_all()
+
+
+    def __export_table(self, snapshot_writer:SnapshotWriter, table_structure:Table):
+        if table_structure.table_type != "BASE TABLE":
+            return
+
+        columns = DataCopier.copy_columns(table_structure)
+        with instrumentation.span("table data", table=f"{table_structure.database}.{table_structure.name}"):
+            with self.replicated_connection.checkout(table_structure.database) as source_connection:
+                rows = snapshot_writer.write_table(
+                    table_structure.database, table_structure.name, columns,
+                    source_connection.stream_rows(table_structure.name, columns, self.snapshot_segment_rows)
+                )
+        instrumentation.add_rows(rows)
@@ -0,0 +1,489 @@
+import datetime
+import glob
+import os
+import re
+import sqlite3
+import zlib
+
+from sqlalchemy import text
+
+from app.database import Database
+from app.engine_registry import engine_registry
+
+GENERATED_COLUMNS = {2: "VIRTUAL GENERATED", 3: "STORED GENERATED"}
+
+def crc32(value):
+    if value is None:
+        return None
+    if not isinstance(value, bytes):
+        value = str(value).encode("utf-8")
+    return zlib.crc32(value)
+
+
+def concat(*values):
+    if any(value is None for value in values):
+        return None
+    return "".join(str(value) for value in values)
+
+
+def concat_ws(separator, *values):
+    return separator.join(str(value) for value in values if value is not None)
+
+
+class BitXor:
+    def __init__(self) -> None:
+        self.value = 0
+
+
+    def step(self, value):
+        if value is not None:
+            self.value ^= int(value)
+
+
+    def finalize(self):
+        return self.value
+
+
+class SQLiteDatabase(Database):
+    '''
+    Database backed by SQLite files, a stand-in for MySQL in benchmarks and
+    tests. HOST is a directory holding one <database>.sqlite file per
+    database. The MySQL functions used by the checksums are registered on
+    every connection, so the queries of Database are shared wherever the
+    SQL is portable. ALTER TABLE cannot add constraints there, so foreign
+    keys are kept in the CREATE TABLE, which may reference a table created
+    later, and indexes are never deferred.
+    '''
+    combined_alter = False
+    alter_definitions = False
+
+    def __init__(self, dbms, host, port, user, password, database = None, pool_options = None) -> None:
+        self.connection = None
+        self.database = database
+        self.directory = host
+        self.database_url = None
+        self.engine = None
+        self.pool_options = {
+            option: value for option, value in (pool_options or {}).items() if option != "connect_args"
+        }
+        self.pool_options["connect_args"] = {"timeout": 30}
+
+        self.create_connection()
+
+
+    def database_path(self, database):
+        return os.path.join(self.directory, f"{database}.sqlite")
+
+
+    def __engine(self, database):
+        return engine_registry.get_engine(f"sqlite:///{self.database_path(database)}", self.pool_options)
+
+
+    def __connect(self, database):
+        if not os.path.exists(self.database_path(database)):
+            raise ValueError(f"Database {database} not found")
+
+        connection = self.__engine(database).connect()
+        driver_connection = connection.connection.driver_connection
+        driver_connection.create_function("CRC32", 1, crc32, deterministic=True)
+        driver_connection.create_function("CONCAT", -1, concat, deterministic=True)
+        driver_connection.create_function("CONCAT_WS", -1, concat_ws, deterministic=True)
+        driver_connection.create_aggregate("BIT_XOR", 1, BitXor)
+        return connection
+
+
+    def create_connection(self):
+        '''
+        Without a database there is nothing to open, statements about the
+        databases themselves work on the directory.
+        '''
+        try:
+            if self.database:
+                self.connection = self.__connect(self.database)
+        except Exception as e:
+            self.close()
+            raise ValueError(f"Error creating connection: {e}")
+
+
+    def use_database(self, database):
+        self.close()
+        self.database = database
+        self.connection = self.__connect(database)
+
+
+    def __commit_ddl(self, statement):
+        result = self.connection.execute(text(statement))
+        self.connection.commit()
+        return result
+
+
+    def find_databases(self):
+        return [
+            (os.path.splitext(os.path.basename(path))[0],)
+            for path in sorted(glob.glob(os.path.join(self.directory, "*.sqlite")))
+        ]
+
+
+    def show_tables(self):
+        try:
+            sql = text("SELECT name FROM sqlite_master WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%' ORDER BY name")
+            return self.connection.execute(sql).fetchall()
+        except Exception as e:
+            raise ValueError(f"Error searching databases: {e}")
+
+
+    def create_database(self, database_name):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            sqlite3.connect(self.database_path(database_name)).close()
+        except Exception as e:
+            raise ValueError(f"Error creating database: {e}")
+
+
+    def create_table(self, script_creation):
+        try:
+            return self.__commit_ddl(script_creation)
+        except Exception as e:
+            raise ValueError(f"Error creating databases: {e}")
+
+
+    def add_column(self, table, column):
+        try:
+            return self.__commit_ddl(f"ALTER TABLE {table} ADD COLUMN {column}")
+        except Exception as e:
+            raise ValueError(f"Error creating databases: {e}")
+
+
+    def alter_table(self, statement):
+        try:
+            return self.__commit_ddl(statement)
+        except Exception as e:
+            raise ValueError(f"Error altering table: {e}")
+
+
+    def execute_ddl(self, statement):
+        try:
+            return self.__commit_ddl(statement)
+        except Exception as e:
+            raise ValueError(f"Error executing statement: {e}")
+
+
+    def drop_column(self, table, column):
+        try:
+            return self.__commit_ddl(f"ALTER TABLE {table} DROP COLUMN {column}")
+        except Exception as e:
+            raise ValueError(f"Error creating databases: {e}")
+
+
+    def find_table(self, table):
+        try:
+            return [row[:6] for row in self.__describe(self.connection, table)]
+        except Exception as e:
+            raise ValueError(f"Error searching table: {e}")
+
+
+    def show_create_table(self, table):
+        try:
+            sql = text("SELECT name, sql FROM sqlite_master WHERE name = :table AND type IN ('table', 'view')")
+            return self.connection.execute(sql, {"table": table}).fetchall()
+        except Exception as e:
+            raise ValueError(f"Error searching table: {e}")
+
+
+    def __tables(self, connection):
+        sql = text("""
+            SELECT name, type FROM sqlite_master
+            WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%'
+            ORDER BY name
+        """)
+        return connection.execute(sql).fetchall()
+
+
+    def __indexes(self, connection, table):
+        '''
+        (name, unique, origin, columns) of every index, the primary key first.
+        '''
+        indexes = []
+        for row in connection.execute(text(f"PRAGMA index_list(`{table}`)")).fetchall():
+            _, name, unique, origin = row[:4]
+            columns = [column[2] for column in connection.execute(text(f"PRAGMA index_info(`{name}`)")).fetchall()]
+            indexes.append((name, bool(unique), origin, columns))
+        return indexes
+
+
+    def __describe(self, connection, table):
+        '''
+        DESCRIBE like rows plus the ordinal position of each column. Generated
+        columns are reported with the EXTRA of MySQL.
+        '''
+        indexes = self.__indexes(connection, table)
+        foreign_key_columns = {row[3] for row in connection.execute(text(f"PRAGMA foreign_key_list(`{table}`)")).fetchall()}
+        unique_columns = {columns[0] for _, unique, origin, columns in indexes if unique and origin != "pk" and len(columns) == 1}
+        indexed_columns = {columns[0] for _, _, _, columns in indexes if columns}
+
+        rows = []
+        for position, name, column_type, not_null, default, primary_key, hidden in connection.execute(text(f"PRAGMA table_xinfo(`{table}`)")).fetchall():
+            if hidden == 1:
+                continue
+
+            key = ""
+            if primary_key:
+                key = "PRI"
+            elif name in unique_columns:
+                key = "UNI"
+            elif name in indexed_columns or name in foreign_key_columns:
+                key = "MUL"
+
+            extra = GENERATED_COLUMNS.get(hidden, "")
+            rows.append((name, column_type.lower(), "NO" if not_null or primary_key else "YES", key, default, extra, position + 1))
+        return rows
+
+
+    def __schema_rows(self, databases, collect):
+        '''
+        Rows of every table of the databases which exist, like a query on
+        INFORMATION_SCHEMA.
+        '''
+        rows = []
+        for database in databases:
+            if not os.path.exists(self.database_path(database)):
+                continue
+            with self.__connect(database) as connection:
+                for table, table_type in self.__tables(connection):
+                    rows.extend(collect(connection, database, table, table_type))
+        return rows
+
+
+    def find_schema_tables(self, databases):
+        '''
+        The update time of a table is the last write to its database file.
+        '''
+        def collect(connection, database, table, table_type):
+            table_rows = connection.execute(text(f"SELECT COUNT(*) FROM `{table}`")).scalar() if table_type == "table" else 0
+            update_time = datetime.datetime.fromtimestamp(os.path.getmtime(self.database_path(database)))
+            yield (
+                database, table, "BASE TABLE" if table_type == "table" else "VIEW", "SQLite", table_rows,
+                0, 0, None, update_time
+            )
+
+        try:
+            return self.__schema_rows(databases, collect)
+        except Exception as e:
+            raise ValueError(f"Error searching schema: {e}")
+
+
+    def find_table_activity(self, databases):
+        return self.find_schema_tables(databases)
+
+
+    def find_schema_columns(self, databases):
+        def collect(connection, database, table, table_type):
+            for name, column_type, nullable, key, default, extra, position in self.__describe(connection, table):
+                yield database, table, name, column_type, nullable, key, default, extra, position
+
+        try:
+            return self.__schema_rows(databases, collect)
+        except Exception as e:
+            raise ValueError(f"Error searching schema: {e}")
+
+
+    def find_schema_constraints(self, databases):
+        def collect(connection, database, table, table_type):
+            columns = connection.execute(text(f"PRAGMA table_info(`{table}`)")).fetchall()
+            for column in sorted((column for column in columns if column[5]), key=lambda column: column[5]):
+                yield database, table, "PRIMARY", "PRIMARY KEY", column[1], None, None, None, None
+
+            for name, unique, origin, index_columns in self.__indexes(connection, table):
+                if unique and origin == "u":
+                    for column in index_columns:
+                        yield database, table, name, "UNIQUE", column, None, None, None, None
+
+            for row in connection.execute(text(f"PRAGMA foreign_key_list(`{table}`)")).fetchall():
+                foreign_key_id, _, referenced_table, column, referenced_column, on_update, on_delete = row[:7]
+                yield (
+                    database, table, f"fk_{table}_{foreign_key_id}", "FOREIGN KEY", column, referenced_table,
+                    referenced_column, on_update, on_delete
+                )
+
+        try:
+            return self.__schema_rows(databases, collect)
+        except Exception as e:
+            raise ValueError(f"Error searching schema: {e}")
+
+
+    def find_schema_statistics(self, databases):
+        def collect(connection, database, table, table_type):
+            columns = connection.execute(text(f"PRAGMA table_info(`{table}`)")).fetchall()
+            for column in sorted((column for column in columns if column[5]), key=lambda column: column[5]):
+                yield database, table, "PRIMARY", 0, column[1], "BTREE"
+
+            for name, unique, origin, index_columns in self.__indexes(connection, table):
+                if origin == "pk":
+                    continue
+                for column in index_columns:
+                    yield database, table, name, 0 if unique else 1, column, "BTREE"
+
+        try:
+            return self.__schema_rows(databases, collect)
+        except Exception as e:
+            raise ValueError(f"Error searching schema: {e}")
+
+
+    def find_schema_probe(self, databases):
+        '''
+        The stored CREATE statements of a table and of its indexes change with
+        any of its definitions.
+        '''
+        def collect(connection, database, table, table_type):
+            column_count = len(connection.execute(text(f"PRAGMA table_info(`{table}`)")).fetchall())
+            statement = connection.execute(
+                text("SELECT sql FROM sqlite_master WHERE name = :table"), {"table": table}
+            ).scalar()
+            indexes = connection.execute(
+                text("SELECT group_concat(sql, ';') FROM sqlite_master WHERE type = 'index' AND tbl_name = :table"),
+                {"table": table}
+            ).scalar()
+            yield database, table, None, column_count, crc32(statement), crc32(indexes), None
+
+        try:
+            return self.__schema_rows(databases, collect)
+        except Exception as e:
+            raise ValueError(f"Error searching schema: {e}")
+
+
+    def find_global_variable(self, variable):
+        raise ValueError(f"Error reading variable: {variable} does not exist on SQLite")
+
+
+    def set_session_variable(self, variable, value):
+        '''
+        FOREIGN_KEY_CHECKS maps to PRAGMA foreign_keys, other variables have no
+        SQLite counterpart and are ignored.
+        '''
+        try:
+            if variable == "FOREIGN_KEY_CHECKS":
+                return self.connection.execute(text(f"PRAGMA foreign_keys = {int(value)}"))
+        except Exception as e:
+            raise ValueError(f"Error setting session variable: {e}")
+
+
+    def upsert_rows(self, table, columns, rows):
+        try:
+            insert_columns = ", ".join(f"`{column}`" for column in columns)
+            values = ", ".join(f":c{position}" for position in range(len(columns)))
+            sql = text(f"INSERT OR REPLACE INTO `{table}` ({insert_columns}) VALUES ({values})")
+            parameters = [
+                {f"c{position}": value for position, value in enumerate(row)} for row in rows
+            ]
+            return self.connection.execute(sql, parameters)
+        except Exception as e:
+            raise ValueError(f"Error upserting rows: {e}")
+
+
+    def checksum_range(self, table, columns, key_columns, key_range):
+        '''
+        Same checksum as Database.checksum_range, ISNULL is an operator in SQLite.
+        '''
+        try:
+            condition, parameters = key_range.predicate(key_columns)
+            quoted_columns = [f"`{column}`" for column in columns]
+            null_flags = ", ".join(f"({column} IS NULL)" for column in quoted_columns)
+            sql = text(f"""
+                SELECT
+                    COUNT(*),
+                    COALESCE(BIT_XOR(CRC32(CONCAT_WS('#', {', '.join(quoted_columns)}, CONCAT({null_flags})))), 0)
+                FROM `{table}`
+                WHERE {condition}
+            """)
+            count, checksum = self.connection.execute(sql, parameters).fetchone()
+            return int(count), int(checksum)
+        except Exception as e:
+            raise ValueError(f"Error checksumming rows: {e}")
+
+
+    def copy_range_into(self, table, source_table, columns, key_columns, key_range):
+        try:
+            condition, parameters = key_range.predicate(key_columns)
+            select_columns = ", ".join(f"`{column}`" for column in columns)
+            sql = text(f"""
+                INSERT OR IGNORE INTO `{table}` ({select_columns})
+                SELECT {select_columns} FROM `{source_table}`
+                WHERE {condition}
+            """)
+            return self.connection.execute(sql, parameters)
+        except Exception as e:
+            raise ValueError(f"Error copying rows: {e}")
+
+
+    def create_table_like(self, table, source_table):
+        '''
+        The stored CREATE TABLE of source_table under another name. Its
+        indexes are separate objects, swap_tables moves them.
+        '''
+        try:
+            statement = self.connection.execute(
+                text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :table"), {"table": source_table}
+            ).scalar()
+            if statement is None:
+                raise ValueError(f"Table {source_table} not found")
+
+            statement = re.sub(
+                r'^CREATE\s+TABLE\s+("[^"]*"|`[^`]*`|\[[^\]]*\]|[^\s(]+)', f"CREATE TABLE `{table}`", statement,
+                count=1, flags=re.IGNORECASE
+            )
+            return self.__commit_ddl(statement)
+        except Exception as e:
+            raise ValueError(f"Error creating table: {e}")
+
+
+    def create_replay_triggers(self, table, shadow_table, triggers, columns, key_columns):
+        column_list = ", ".join(f"`{column}`" for column in columns)
+        new_values = ", ".join(f"NEW.`{column}`" for column in columns)
+        key_list = ", ".join(f"`{column}`" for column in key_columns)
+        old_key = ", ".join(f"OLD.`{column}`" for column in key_columns)
+        replace = f"REPLACE INTO `{shadow_table}` ({column_list}) VALUES ({new_values})"
+        delete = f"DELETE FROM `{shadow_table}` WHERE ({key_list}) = ({old_key})"
+
+        try:
+            for event, body in (("INSERT", replace), ("UPDATE", f"{delete}; {replace}"), ("DELETE", delete)):
+                self.__commit_ddl(
+                    f"CREATE TRIGGER `{triggers[event]}` AFTER {event} ON `{table}` FOR EACH ROW BEGIN {body}; END"
+                )
+        except Exception as e:
+            raise ValueError(f"Error creating triggers: {e}")
+
+
+    def swap_tables(self, table, shadow_table, old_table):
+        '''
+        Both renames in one transaction. The indexes of table move to the new
+        table when their columns are still there.
+        '''
+        try:
+            indexes = self.connection.execute(
+                text("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = :table AND sql IS NOT NULL"),
+                {"table": table}
+            ).fetchall()
+            shadow_columns = {row[1] for row in self.connection.execute(text(f"PRAGMA table_info(`{shadow_table}`)")).fetchall()}
+            kept_indexes = [
+                statement for name, statement in indexes
+                if {row[2] for row in self.connection.execute(text(f"PRAGMA index_info(`{name}`)")).fetchall()} <= shadow_columns
+            ]
+
+            self.connection.execute(text(f"ALTER TABLE `{table}` RENAME TO `{old_table}`"))
+            for name, _ in indexes:
+                self.connection.execute(text(f"DROP INDEX `{name}`"))
+            self.connection.execute(text(f"ALTER TABLE `{shadow_table}` RENAME TO `{table}`"))
+            for statement in kept_indexes:
+                self.connection.execute(text(statement))
+            self.connection.commit()
+        except Exception as e:
+            self.connection.rollback()
+            raise ValueError(f"Error renaming tables: {e}")
+
+
+    def find_status_variable(self, variable):
+        return None
+
+
+    def find_replica_lag(self):
+        return None
@@ -0,0 +1,43 @@
+import os
+
+from app.change_data_capture import BinlogEventSource, ChangeApplier, PositionCheckpoint
+from app.engine_registry import engine_registry
+from app.replicator import Replicator
+
+class StreamReplicator(Replicator):
+    '''
+    Replicator applying the changes of the source binlog to the targets as
+    they happen (stream).
+    '''
+    def stream(self, event_source = None):
+        '''
+        Apply source changes to every target continuously, from the binlog or
+        from the given event source, resuming at the last saved position.
+        '''
+        try:
+            self.find_databases_to_replicate()
+            self.load_source_schema()
+
+            cdc_config = self.config_file.get("CDC", {})
+            if event_source is None:
+                event_source = BinlogEventSource(
+                    self.replicated_connection, self.replicated_connection.database,
+                    int(cdc_config.get("SERVER_ID", 1001)), float(cdc_config.get("FLUSH_INTERVAL", 1.0))
+                )
+
+            os.makedirs(self.state_dir, exist_ok=True)
+            checkpoint = PositionCheckpoint(os.path.join(self.state_dir, "binlog_position.json"))
+            change_applier = ChangeApplier(
+                self.replicated_connection, self.other_connections, self.source_schema, checkpoint,
+                int(cdc_config.get("BATCH_SIZE", 500)), float(cdc_config.get("FLUSH_INTERVAL", 1.0))
+            )
+
+            for event in event_source.events_from(checkpoint.load()):
+                change_applier.handle(event)
+            change_applier.flush()
+
+        except Exception as e:
+            raise ValueError(f"Error streaming changes: {e}")
+
+        finally:
+            engine_registry.dispose_all()
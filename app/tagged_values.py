@@ -0,0 +1,57 @@
+import datetime
+import decimal
+
+ENCODERS = {
+    "decimal": str,
+    "datetime": lambda value: value.isoformat(),
+    "date": lambda value: value.isoformat(),
+    "time": lambda value: value.isoformat(),
+    "timedelta": lambda value: [value.days, value.seconds, value.microseconds],
+    "bytes": lambda value: bytes(value).hex(),
+}
+
+DECODERS = {
+    "decimal": decimal.Decimal,
+    "datetime": datetime.datetime.fromisoformat,
+    "date": datetime.date.fromisoformat,
+    "time": datetime.time.fromisoformat,
+    "timedelta": lambda value: datetime.timedelta(*value),
+    "bytes": bytes.fromhex,
+}
+
+def value_type_tag(value):
+    '''
+    Tag of the types JSON cannot hold, None for the ones it stores as they are.
+    '''
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return None
+    if isinstance(value, decimal.Decimal):
+        return "decimal"
+    if isinstance(value, datetime.datetime):
+        return "datetime"
+    if isinstance(value, datetime.date):
+        return "date"
+    if isinstance(value, datetime.time):
+        return "time"
+    if isinstance(value, datetime.timedelta):
+        return "timedelta"
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return "bytes"
+    raise ValueError(f"Cannot encode a value of type {type(value).__name__}")
+
+
+def encode_tagged(value):
+    '''
+    JSON compatible form of a value keeping its type, {"t": tag, "v": encoded}
+    for the types JSON has no place for.
+    '''
+    tag = value_type_tag(value)
+    if tag is None:
+        return value
+    return {"t": tag, "v": ENCODERS[tag](value)}
+
+
+def decode_tagged(value):
+    if isinstance(value, dict):
+        return DECODERS[value["t"]](value["v"])
+    return value
@@ -0,0 +1,234 @@
+import logging
+import queue
+import threading
+import time
+
+from app.connection_db import Connection
+from app.data_copy import DataCopier, TableCopyReport
+from app.instrumentation import instrumentation
+from app.key_ranges import find_key_ranges
+from app.schema import Table
+
+logger = logging.getLogger(__name__)
+
+class TargetWriter:
+    '''
+    Writer thread of one target, fed through a bounded queue. A failing
+    target keeps draining its queue so the source reader is never blocked.
+    A throttled target only pauses, the batch size is the shared read's.
+    '''
+    def __init__(self, copier:DataCopier, table:Table, columns, key_columns, buffer_batches, journal = None) -> None:
+        self.copier = copier
+        self.target = copier.target
+        self.table = table
+        self.columns = columns
+        self.key_columns = key_columns
+        self.journal = journal
+        self.report = TableCopyReport(table.database, table.name)
+        self.queue = queue.Queue(maxsize=buffer_batches)
+        self.error = None
+        self.thread = threading.Thread(
+            target=instrumentation.bind(self.__run), name=f"tee-{self.target.name}-{table.name}", daemon=True
+        )
+
+
+    def start(self):
+        self.thread.start()
+
+
+    def put(self, message):
+        self.queue.put(message)
+
+
+    def join(self):
+        self.queue.put(None)
+        self.thread.join()
+
+
+    def __run(self):
+        try:
+            self.__write()
+        except Exception as e:
+            self.error = e
+            logger.error(
+                "Copy of %s.%s to %s failed: %s", self.table.database, self.table.name, self.target.name, e
+            )
+            while self.queue.get() is not None:
+                pass
+
+
+    def __write(self):
+        writer = self.copier.create_writer(self.table, self.columns)
+        relaxes_unique_checks = self.copier.relaxes_unique_checks(self.table)
+        key_range = None
+
+        with self.target.checkout(self.table.database) as target_connection:
+            target_connection.set_session_variable("FOREIGN_KEY_CHECKS", 0)
+            if relaxes_unique_checks:
+                target_connection.set_session_variable("UNIQUE_CHECKS", 0)
+            try:
+                while True:
+                    message = self.queue.get()
+                    if message is None:
+                        return
+
+                    kind, payload = message
+                    if kind == "begin":
+                        position, key_range, range_rows = payload[0], payload[1], 0
+                        if key_range is not None:
+                            target_connection.delete_range(self.table.name, self.key_columns, key_range)
+                    elif kind == "rows":
+                        written_at = time.perf_counter()
+                        writer = self.copier.write_rows(writer, target_connection, self.table, self.columns, payload)
+                        if key_range is None:
+                            target_connection.commit()
+                        range_rows += len(payload)
+                        self.report.add_rows(len(payload))
+                        instrumentation.add_rows(len(payload))
+                        if self.target.throttle is not None:
+                            self.target.throttle.wait(time.perf_counter() - written_at, target_connection)
+                    elif kind == "end":
+                        target_connection.commit()
+                        if self.journal is not None and key_range is not None:
+                            self.journal.complete_range(
+                                self.target.name, self.table.database, self.table.name, position, range_rows
+                            )
+            finally:
+                writer.close()
+                target_connection.set_session_variable("FOREIGN_KEY_CHECKS", 1)
+                if relaxes_unique_checks:
+                    target_connection.set_session_variable("UNIQUE_CHECKS", 1)
+
+
+class TeeCopier:
+    '''
+    Copy table rows to several targets reading the source once: every batch
+    is handed to one bounded queue per target, so the source load does not
+    grow with the number of targets and a slow target holds the reader back
+    only once its buffer is full.
+    '''
+    def __init__(self, source:Connection, targets:list, buffer_batches = 4, journal = None, deferred_tables = None) -> None:
+        self.source = source
+        self.targets = targets
+        self.buffer_batches = buffer_batches
+        self.journal = journal
+        self.batch_size = min(target.batch_size for target in targets)
+        self.chunk_size = min(target.chunk_size for target in targets)
+        self.copiers = {
+            target.name: DataCopier(source, target, self.batch_size, deferred_tables=(deferred_tables or {}).get(target.name, ()))
+            for target in targets
+        }
+        self.failures = {}
+
+
+    def copy_table(self, table:Table):
+        '''
+        Returns the copy report of every target still receiving the table.
+        '''
+        columns = DataCopier.copy_columns(table)
+        key_columns = table.primary_key()
+        started_at = time.perf_counter()
+
+        states = {}
+        for target in self.__active_targets():
+            states[target.name] = (None, None, set())
+            if self.journal is not None:
+                states[target.name] = self.journal.table_state(target.name, table.database, table.name)
+
+        targets = [target for target in self.__active_targets() if states[target.name][0] != "done"]
+        if not targets:
+            logger.info("Skipping %s.%s, copied before the previous run stopped", table.database, table.name)
+            return {}
+
+        key_ranges = [None]
+        if key_columns:
+            key_ranges = self.__shared_key_ranges(table, key_columns, targets, states)
+        for target in targets:
+            status, stored_ranges, _ = states[target.name]
+            if status is None or not key_columns or self.__bounds(stored_ranges) != self.__bounds(key_ranges):
+                self.copiers[target.name].clear_table(table)
+                states[target.name] = (None, key_ranges, set())
+                if self.journal is not None:
+                    self.journal.start_table(target.name, table.database, table.name, key_ranges if key_columns else [])
+
+        writers = [
+            TargetWriter(self.copiers[target.name], table, columns, key_columns, self.buffer_batches, self.journal)
+            for target in targets
+        ]
+        for writer in writers:
+            writer.start()
+
+        try:
+            with self.source.checkout(table.database) as source_connection:
+                for position, key_range in enumerate(key_ranges):
+                    receivers = [
+                        writer for writer in writers
+                        if writer.error is None and position not in states[writer.target.name][2]
+                    ]
+                    if not receivers:
+                        continue
+
+                    self.__read_range(source_connection, table, columns, key_columns, position, key_range, receivers)
+        finally:
+            for writer in writers:
+                writer.join()
+
+        reports = {}
+        for writer in writers:
+            if writer.error is not None:
+                self.failures[writer.target.name] = writer.error
+                continue
+
+            if self.journal is not None:
+                self.journal.finish_table(writer.target.name, table.database, table.name)
+            writer.report.seconds = time.perf_counter() - started_at
+            reports[writer.target.name] = writer.report
+
+        logger.info(
+            "Copied %s.%s once to %s targets in %.2fs",
+            table.database, table.name, len(reports), time.perf_counter() - started_at
+        )
+        return reports
+
+
+    def __active_targets(self):
+        return [target for target in self.targets if target.name not in self.failures]
+
+
+    def __shared_key_ranges(self, table:Table, key_columns, targets, states):
+        '''
+        Key ranges journaled by an interrupted run are reused, targets which
+        journaled other ranges start the table over.
+        '''
+        for target in targets:
+            status, stored_ranges, _ = states[target.name]
+            if status == "started" and stored_ranges:
+                return stored_ranges
+
+        with self.source.checkout(table.database) as source_connection:
+            return find_key_ranges(source_connection, table.name, key_columns, self.chunk_size)
+
+
+    def __bounds(self, key_ranges):
+        if key_ranges is None:
+            return None
+        return [(key_range.lower, key_range.upper) for key_range in key_ranges]
+
+
+    def __read_range(self, source_connection, table:Table, columns, key_columns, position, key_range, receivers):
+        for receiver in receivers:
+            receiver.put(("begin", (position, key_range)))
+
+        if key_range is None:
+            batches = source_connection.stream_rows(table.name, columns, self.batch_size)
+        else:
+            batches = source_connection.stream_range(table.name, columns, key_columns, key_range, self.batch_size)
+
+        for rows in batches:
+            rows = list(map(tuple, rows))
+            for receiver in receivers:
+                if receiver.error is None:
+                    receiver.put(("rows", rows))
+
+        for receiver in receivers:
+            receiver.put(("end", None))
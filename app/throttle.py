@@ -0,0 +1,106 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class Throttle:
+    '''
+    Pace the writes made to one target from its health: Threads_running,
+    replica lag and the latency of the last chunks. Over any ceiling the
+    batch size is halved and the pause between chunks doubled; once every
+    signal is below half of its ceiling, batches grow back and pauses shrink.
+    A ceiling of 0 is not checked; without any ceiling the pace is left as
+    configured.
+    '''
+    def __init__(self, connection, settings:dict, batch_size) -> None:
+        self.connection = connection
+        self.max_threads_running = int(settings.get("MAX_THREADS_RUNNING", 0))
+        self.max_replica_lag = float(settings.get("MAX_REPLICA_LAG", 0))
+        self.max_chunk_seconds = float(settings.get("MAX_CHUNK_SECONDS", 0))
+        self.min_batch_size = int(settings.get("MIN_BATCH_SIZE", max(1, batch_size // 10)))
+        self.max_batch_size = int(settings.get("MAX_BATCH_SIZE", batch_size * 10))
+        self.max_sleep_seconds = float(settings.get("MAX_SLEEP_SECONDS", 5))
+        self.sample_interval = float(settings.get("SAMPLE_INTERVAL", 1))
+        self.adapts = bool(self.max_threads_running or self.max_replica_lag or self.max_chunk_seconds)
+
+        if self.min_batch_size < 1 or self.min_batch_size > self.max_batch_size:
+            raise ValueError("THROTTLE batch sizes must satisfy 1 <= MIN_BATCH_SIZE <= MAX_BATCH_SIZE")
+
+        self.batch_size = min(max(batch_size, self.min_batch_size), self.max_batch_size)
+        self.sleep_seconds = 0.0
+        self.chunk_seconds = None
+        self.threads_running = None
+        self.replica_lag = None
+        self.sampled_at = 0.0
+        self.lock = threading.Lock()
+
+
+    def current_batch_size(self):
+        return self.batch_size
+
+
+    def wait(self, chunk_seconds, database_connection = None):
+        '''
+        Record how long the last chunk took to write, adjust the pace and
+        sleep before the next chunk. The server is sampled on
+        database_connection when the caller holds one.
+        '''
+        if not self.adapts:
+            return
+
+        self.__sample_health(database_connection)
+
+        with self.lock:
+            if self.chunk_seconds is None:
+                self.chunk_seconds = chunk_seconds
+            else:
+                self.chunk_seconds = 0.7 * self.chunk_seconds + 0.3 * chunk_seconds
+
+            load = self.__load()
+            if load > 1:
+                self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+                self.sleep_seconds = min(self.max_sleep_seconds, max(0.05, self.sleep_seconds * 2))
+                logger.debug(
+                    "Throttling %s: batch %s, sleep %.2fs (threads %s, lag %s, chunk %.3fs)",
+                    self.connection.name, self.batch_size, self.sleep_seconds, self.threads_running,
+                    self.replica_lag, self.chunk_seconds
+                )
+            elif load < 0.5:
+                self.batch_size = min(self.max_batch_size, self.batch_size + max(1, self.batch_size // 4))
+                self.sleep_seconds = self.sleep_seconds / 2 if self.sleep_seconds > 0.01 else 0.0
+
+            sleep_seconds = self.sleep_seconds
+
+        if sleep_seconds:
+            time.sleep(sleep_seconds)
+
+
+    def __load(self):
+        '''
+        Highest ratio of a signal to its ceiling.
+        '''
+        ratios = [0.0]
+        if self.max_threads_running and self.threads_running is not None:
+            ratios.append(self.threads_running / self.max_threads_running)
+        if self.max_replica_lag and self.replica_lag is not None:
+            ratios.append(self.replica_lag / self.max_replica_lag)
+        if self.max_chunk_seconds and self.chunk_seconds is not None:
+            ratios.append(self.chunk_seconds / self.max_chunk_seconds)
+        return max(ratios)
+
+
+    def __sample_health(self, database_connection):
+        if not (self.max_threads_running or self.max_replica_lag):
+            return
+
+        with self.lock:
+            now = time.monotonic()
+            if now - self.sampled_at < self.sample_interval:
+                return
+            self.sampled_at = now
+
+        threads_running, replica_lag = self.connection.sample_health(database_connection)
+        with self.lock:
+            self.threads_running = threads_running
+            self.replica_lag = replica_lag
@@ -0,0 +1,266 @@
+import json
+import sqlite3
+import threading
+import time
+
+from app.key_ranges import KeyRange
+
+KIND_PRIORITY = {"structure": 0, "data": 1, "data_range": 1}
+
+class WorkUnit:
+    def __init__(self, unit_id, kind, target, database, table = None, key_range = None, depends_on = None, attempts = 0) -> None:
+        self.unit_id = unit_id
+        self.kind = kind
+        self.target = target
+        self.database = database
+        self.table = table
+        self.key_range = key_range
+        self.depends_on = depends_on
+        self.attempts = attempts
+
+
+    def __repr__(self) -> str:
+        return f"WorkUnit({self.unit_id})"
+
+
+class WorkQueue:
+    '''
+    Work units of a sharded run in a SQLite file shared by the coordinator
+    and every worker, on one host or on a filesystem the hosts share with
+    working locks. A worker claims a unit with a lease it renews while the
+    unit runs; the unit of a worker which stopped renewing is claimed again
+    once its lease expired, up to max_attempts times.
+    '''
+    def __init__(self, path, lease_seconds = 60, max_attempts = 3) -> None:
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS work_units (
+                unit_id TEXT PRIMARY KEY, kind TEXT, priority INTEGER, target TEXT, database_name TEXT,
+                table_name TEXT, key_range TEXT, depends_on TEXT, status TEXT, worker TEXT, lease_until REAL,
+                attempts INTEGER, result TEXT, error TEXT, updated_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS work_units_status ON work_units (status, priority, unit_id);
+        """)
+
+
+    def __transaction(self, function):
+        '''
+        Run function(cursor) holding the write lock of the file, so concurrent
+        workers see each claim whole.
+        '''
+        with self.lock:
+            cursor = self.connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                result = function(cursor)
+                cursor.execute("COMMIT")
+                return result
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+
+
+    def add_units(self, units):
+        def add(cursor):
+            now = time.time()
+            cursor.executemany(
+                "INSERT OR IGNORE INTO work_units VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'pending', NULL, NULL, 0, NULL, NULL, ?)",
+                [
+                    (
+                        unit.unit_id, unit.kind, KIND_PRIORITY[unit.kind], unit.target, unit.database, unit.table,
+                        self.__serialize_range(unit.key_range), unit.depends_on, now
+                    )
+                    for unit in units
+                ]
+            )
+
+        self.__transaction(add)
+
+
+    def claim(self, worker):
+        '''
+        Lease the next runnable unit to worker: pending or with an expired
+        lease, and whose dependency is done. None when nothing is runnable now.
+        '''
+        def claim_unit(cursor):
+            now = time.time()
+            cursor.execute(
+                """
+                UPDATE work_units SET status = 'failed', error = 'Lease expired on every attempt', updated_at = ?
+                WHERE status = 'claimed' AND lease_until < ? AND attempts >= ?
+                """,
+                (now, now, self.max_attempts)
+            )
+            cursor.execute(
+                """
+                UPDATE work_units SET status = 'failed', error = 'Dependency failed', updated_at = ?
+                WHERE status = 'pending'
+                    AND depends_on IN (SELECT unit_id FROM work_units WHERE status = 'failed')
+                """,
+                (now,)
+            )
+            row = cursor.execute(
+                """
+                SELECT unit_id, kind, target, database_name, table_name, key_range, depends_on, attempts
+                FROM work_units unit
+                WHERE (status = 'pending' OR (status = 'claimed' AND lease_until < ?))
+                    AND (
+                        depends_on IS NULL
+                        OR EXISTS (SELECT 1 FROM work_units dependency WHERE dependency.unit_id = unit.depends_on AND dependency.status = 'done')
+                    )
+                ORDER BY priority, unit_id
+                LIMIT 1
+                """,
+                (now,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            unit_id, kind, target, database, table, key_range, depends_on, attempts = row
+            cursor.execute(
+                """
+                UPDATE work_units SET status = 'claimed', worker = ?, lease_until = ?, attempts = ?, updated_at = ?
+                WHERE unit_id = ?
+                """,
+                (worker, now + self.lease_seconds, attempts + 1, now, unit_id)
+            )
+            return WorkUnit(
+                unit_id, kind, target, database, table, self.__deserialize_range(key_range), depends_on, attempts + 1
+            )
+
+        return self.__transaction(claim_unit)
+
+
+    def renew(self, unit:WorkUnit, worker):
+        '''
+        Extend the lease of a unit, False when it was reclaimed by another worker.
+        '''
+        def renew_lease(cursor):
+            now = time.time()
+            cursor.execute(
+                "UPDATE work_units SET lease_until = ?, updated_at = ? WHERE unit_id = ? AND worker = ? AND status = 'claimed'",
+                (now + self.lease_seconds, now, unit.unit_id, worker)
+            )
+            return cursor.rowcount == 1
+
+        return self.__transaction(renew_lease)
+
+
+    def complete(self, unit:WorkUnit, worker, result = None):
+        def complete_unit(cursor):
+            cursor.execute(
+                "UPDATE work_units SET status = 'done', result = ?, error = NULL, updated_at = ? WHERE unit_id = ? AND worker = ?",
+                (json.dumps(result, default=str), time.time(), unit.unit_id, worker)
+            )
+
+        self.__transaction(complete_unit)
+
+
+    def fail(self, unit:WorkUnit, worker, error):
+        '''
+        Put the unit back for another attempt, or fail it for good after max_attempts.
+        '''
+        def fail_unit(cursor):
+            status = "failed" if unit.attempts >= self.max_attempts else "pending"
+            cursor.execute(
+                "UPDATE work_units SET status = ?, error = ?, updated_at = ? WHERE unit_id = ? AND worker = ?",
+                (status, str(error), time.time(), unit.unit_id, worker)
+            )
+
+        self.__transaction(fail_unit)
+
+
+    def counts(self):
+        with self.lock:
+            rows = self.connection.execute("SELECT status, COUNT(*) FROM work_units GROUP BY status").fetchall()
+        return dict(rows)
+
+
+    def is_finished(self):
+        '''
+        True when there are units and none of them is left to run.
+        '''
+        counts = self.counts()
+        return bool(counts) and not counts.get("pending") and not counts.get("claimed")
+
+
+    def results(self, kind = None):
+        '''
+        (unit_id, target, result) of every unit done.
+        '''
+        sql = "SELECT unit_id, target, result FROM work_units WHERE status = 'done'"
+        parameters = ()
+        if kind is not None:
+            sql = f"{sql} AND kind = ?"
+            parameters = (kind,)
+
+        with self.lock:
+            rows = self.connection.execute(f"{sql} ORDER BY unit_id", parameters).fetchall()
+        return [(unit_id, target, json.loads(result) if result else None) for unit_id, target, result in rows]
+
+
+    def failures(self):
+        with self.lock:
+            return self.connection.execute(
+                "SELECT unit_id, target, error FROM work_units WHERE status = 'failed' ORDER BY unit_id"
+            ).fetchall()
+
+
+    def clear(self):
+        self.__transaction(lambda cursor: cursor.execute("DELETE FROM work_units"))
+
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+    def __serialize_range(self, key_range):
+        '''
+        Bounds tagged with their type, so every worker decodes the same keys
+        and the leased ranges neither overlap nor leave gaps.
+        '''
+        if key_range is None:
+            return None
+        return json.dumps(key_range.to_json())
+
+
+    def __deserialize_range(self, serialized_range):
+        if serialized_range is None:
+            return None
+        return KeyRange.from_json(json.loads(serialized_range))
+
+
+class LeaseKeeper:
+    '''
+    Renew the lease of a unit in the background while it runs.
+    '''
+    def __init__(self, work_queue:WorkQueue, unit:WorkUnit, worker) -> None:
+        self.work_queue = work_queue
+        self.unit = unit
+        self.worker = worker
+        self.lost = False
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.__renew, name=f"lease-{unit.unit_id}", daemon=True)
+
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stopped.set()
+        self.thread.join()
+
+
+    def __renew(self):
+        while not self.stopped.wait(self.work_queue.lease_seconds / 3):
+            if not self.work_queue.renew(self.unit, self.worker):
+                self.lost = True
+                return
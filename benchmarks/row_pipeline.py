@@ -0,0 +1,162 @@
+import argparse
+import datetime
+import decimal
+import gc
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from sqlalchemy import create_engine, text
+
+from app.bulk_loader import encode_value, is_binary_type
+from app.row_converter import RowConverter
+
+COLUMNS = ("id", "amount", "ratio", "created_at", "birth_date", "code", "notes", "payload")
+COLUMN_TYPES = (
+    "bigint", "decimal(12,2)", "double", "datetime", "date", "varchar(32)", "text", "mediumblob"
+)
+
+def generate_rows(count, blob_size = 256):
+    random_values = random.Random(count)
+    started_at = datetime.datetime(2024, 1, 1)
+    return [
+        (
+            row,
+            decimal.Decimal(f"{random_values.uniform(0, 10000):.2f}"),
+            random_values.random(),
+            started_at + datetime.timedelta(seconds=row),
+            datetime.date(2000, 1, 1) + datetime.timedelta(days=row % 10000),
+            f"code-{row}",
+            None if row % 3 else f"line {row}\twith\\escapes\n" * 4,
+            random_values.randbytes(blob_size),
+        )
+        for row in range(1, count + 1)
+    ]
+
+
+def naive_parameters(rows):
+    '''
+    Parameters as built before the converter: one dictionary per row.
+    '''
+    return [{f"c{position}": value for position, value in enumerate(row)} for row in rows]
+
+
+def naive_lines(rows):
+    '''
+    LOAD DATA lines as built before the converter: every value inspected on its own.
+    '''
+    binary_flags = [is_binary_type(column_type) for column_type in COLUMN_TYPES]
+    return [b"\t".join(encode_value(value, binary) for value, binary in zip(row, binary_flags)) for row in rows]
+
+
+def measure(function, rows):
+    '''
+    Rows per second of function(rows), with the memory blocks still held by
+    its output and the peak of traced memory, both per row.
+    '''
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    tracemalloc.start()
+    try:
+        output = function(rows)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    held_blocks = sys.getallocatedblocks() - blocks
+    del output
+
+    started_at = time.perf_counter()
+    function(rows)
+    seconds = time.perf_counter() - started_at
+
+    return {
+        "rows_per_second": round(len(rows) / seconds) if seconds else None,
+        "blocks_per_row": round(held_blocks / len(rows), 2),
+        "peak_bytes_per_row": round(peak / len(rows), 1),
+    }
+
+
+def insert_sqlite(directory, rows, batch_size):
+    '''
+    Rows per second inserted into a SQLite file through SQLAlchemy with
+    dictionaries of named parameters, then through the driver with tuples.
+    '''
+    insert_columns = ", ".join(f"`{column}`" for column in COLUMNS)
+    create_columns = ", ".join(
+        f"`{column}` {column_type}" for column, column_type in zip(COLUMNS, COLUMN_TYPES)
+    )
+    named_values = ", ".join(f":c{position}" for position in range(len(COLUMNS)))
+    positional_values = ", ".join("?" for _ in COLUMNS)
+    converter = RowConverter(COLUMNS, COLUMN_TYPES)
+    # sqlite3 has no adapter for Decimal, the two paths get the same floats.
+    rows = [(row[0], float(row[1])) + row[2:] for row in rows]
+
+    def naive(connection):
+        statement = text(f"INSERT INTO `rows` ({insert_columns}) VALUES ({named_values})")
+        for start in range(0, len(rows), batch_size):
+            connection.execute(statement, naive_parameters(rows[start:start + batch_size]))
+
+    def pipeline(connection):
+        statement = f"INSERT INTO `rows` ({insert_columns}) VALUES ({positional_values})"
+        for start in range(0, len(rows), batch_size):
+            connection.exec_driver_sql(statement, converter.tuples(rows[start:start + batch_size]))
+
+    result = {}
+    for name, insert in (("naive", naive), ("pipeline", pipeline)):
+        engine = create_engine(f"sqlite:///{os.path.join(directory, f'{name}.sqlite')}")
+        try:
+            with engine.begin() as connection:
+                connection.exec_driver_sql(f"CREATE TABLE `rows` ({create_columns})")
+            started_at = time.perf_counter()
+            with engine.begin() as connection:
+                insert(connection)
+            seconds = time.perf_counter() - started_at
+        finally:
+            engine.dispose()
+        result[name] = {"rows_per_second": round(len(rows) / seconds) if seconds else None}
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Row conversion benchmark, naive path against the converter")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--blob-size", type=int, default=256)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--output", help="file the results are written to (default standard output)")
+    arguments = parser.parse_args()
+
+    rows = generate_rows(arguments.rows, arguments.blob_size)
+    converter = RowConverter(COLUMNS, COLUMN_TYPES)
+
+    directory = tempfile.mkdtemp(prefix="datarep-rows-")
+    try:
+        results = {
+            "rows": arguments.rows,
+            "insert_parameters": {
+                "naive": measure(naive_parameters, rows),
+                "pipeline": measure(converter.tuples, rows),
+            },
+            "load_data_lines": {
+                "naive": measure(naive_lines, rows),
+                "pipeline": measure(lambda rows: list(converter.encode_rows(rows)), rows),
+            },
+            "sqlite_insert": insert_sqlite(directory, rows, arguments.batch_size),
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    output = json.dumps(results, indent=2)
+    if arguments.output:
+        with open(arguments.output, "w", encoding="utf-8") as file_open:
+            file_open.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
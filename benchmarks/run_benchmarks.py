@@ -0,0 +1,150 @@
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from app.instrumentation import instrumentation
+from app.replicator import Replicator
+from benchmarks.schemas import SCENARIOS
+
+logger = logging.getLogger(__name__)
+
+MEASURES = ("seconds", "round_trips", "peak_bytes")
+MIN_SECONDS = 0.05
+
+def write_config(directory, source_directory, target_directory, batch_size):
+    config = {
+        "STATE_DIR": os.path.join(directory, "state"),
+        "replicated_connection": {
+            "HOST": source_directory,
+            "PORT": None,
+            "DATABASE": [],
+            "DBMS": "sqlite",
+        },
+        "other_connections": [
+            {
+                "HOST": target_directory,
+                "PORT": None,
+                "DATA": True,
+                "LOAD_METHOD": "insert",
+                "BATCH_SIZE": batch_size,
+            }
+        ],
+    }
+    path = os.path.join(directory, "connections.json")
+    with open(path, "w", encoding="utf-8") as file_open:
+        json.dump(config, file_open, indent=2)
+    return path
+
+
+def phases(report):
+    '''
+    Measures of the run and of each of its phases, keyed by phase name.
+    '''
+    return {
+        span["name"]: {measure: span.get(measure) for measure in MEASURES}
+        for span in report["phases"] if span["name"] == "run" or span["parent"] == "run"
+    }
+
+
+def run_scenario(name, scale, batch_size):
+    directory = tempfile.mkdtemp(prefix=f"datarep-{name}-")
+    try:
+        source_directory = os.path.join(directory, "source")
+        target_directory = os.path.join(directory, "target")
+        os.makedirs(target_directory)
+        SCENARIOS[name](source_directory, scale)
+        config_path = write_config(directory, source_directory, target_directory, batch_size)
+
+        result = {}
+        for run in ("first_run", "rerun"):
+            replicator = Replicator(config_path)
+            tracemalloc.start()
+            try:
+                replicator.run()
+            finally:
+                tracemalloc.stop()
+                if replicator.journal is not None:
+                    replicator.journal.close()
+
+            report = instrumentation.report()
+            result[run] = {
+                "seconds": report["seconds"],
+                "round_trips": report["round_trips"],
+                "rows_transferred": report["rows_transferred"],
+                "phases": phases(report),
+            }
+        return result
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def regressions(results, baseline, tolerance):
+    '''
+    Measures of each run and phase exceeding the baseline by more than
+    tolerance. Phases shorter than MIN_SECONDS are too noisy to compare times.
+    '''
+    found = []
+    for name, runs in results.items():
+        for run, result in runs.items():
+            base_run = baseline.get(name, {}).get(run)
+            if base_run is None:
+                continue
+
+            for phase, measures in result["phases"].items():
+                base_measures = base_run["phases"].get(phase, {})
+                for measure in MEASURES:
+                    value, base_value = measures.get(measure), base_measures.get(measure)
+                    if value is None or not base_value:
+                        continue
+                    if measure == "seconds" and base_value < MIN_SECONDS:
+                        continue
+                    if value > base_value * (1 + tolerance):
+                        found.append(f"{name} {run} {phase} {measure}: {value} > {base_value}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replication benchmarks on generated SQLite schemas")
+    parser.add_argument("scenarios", nargs="*", help=f"scenarios to run (default all of {', '.join(SCENARIOS)})")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplier of the generated row counts")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--output", help="file the results are written to (default standard output)")
+    parser.add_argument("--baseline", help="results of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed growth over the baseline")
+    arguments = parser.parse_args()
+    unknown = [name for name in arguments.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios {', '.join(unknown)}")
+
+    logging.basicConfig(level=logging.WARNING)
+
+    results = {}
+    for name in arguments.scenarios or SCENARIOS:
+        started_at = time.perf_counter()
+        results[name] = run_scenario(name, arguments.scale, arguments.batch_size)
+        logger.warning("%s done in %.2fs", name, time.perf_counter() - started_at)
+
+    output = json.dumps(results, indent=2)
+    if arguments.output:
+        with open(arguments.output, "w", encoding="utf-8") as file_open:
+            file_open.write(output)
+    else:
+        print(output)
+
+    if arguments.baseline:
+        with open(arguments.baseline, encoding="utf-8") as file_open:
+            found = regressions(results, json.load(file_open), arguments.tolerance)
+        for regression in found:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import os
+import random
+import sqlite3
+from contextlib import closing
+
+def create_source(directory, database):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{database}.sqlite")
+    if os.path.exists(path):
+        os.remove(path)
+    return sqlite3.connect(path)
+
+
+def many_tables(directory, scale = 1.0, tables = 300, rows = 50):
+    '''
+    Hundreds of small independent tables, dominated by per-table round trips.
+    '''
+    rows = max(1, int(rows * scale))
+    random_values = random.Random(tables)
+
+    with closing(create_source(directory, "many_tables")) as connection, connection:
+        for position in range(tables):
+            connection.execute(f"""
+                CREATE TABLE `table_{position:04d}` (
+                    `id` INTEGER NOT NULL PRIMARY KEY,
+                    `code` VARCHAR(32) NOT NULL UNIQUE,
+                    `amount` DECIMAL(12, 2),
+                    `created_at` DATETIME,
+                    `notes` TEXT
+                )
+            """)
+            connection.executemany(
+                f"INSERT INTO `table_{position:04d}` VALUES (?, ?, ?, ?, ?)",
+                [
+                    (row, f"code-{position}-{row}", round(random_values.uniform(0, 10000), 2),
+                        f"2024-01-{row % 28 + 1:02d} 12:00:00", None if row % 3 else "note " * 10)
+                    for row in range(1, rows + 1)
+                ]
+            )
+    return ["many_tables"]
+
+
+def foreign_key_chain(directory, scale = 1.0, depth = 50, rows = 200):
+    '''
+    Tables each referencing the previous one, sorted into as many levels.
+    '''
+    rows = max(1, int(rows * scale))
+
+    with closing(create_source(directory, "foreign_key_chain")) as connection, connection:
+        for position in range(depth):
+            reference = ""
+            if position:
+                reference = f", FOREIGN KEY (`parent_id`) REFERENCES `level_{position - 1:03d}` (`id`)"
+            connection.execute(f"""
+                CREATE TABLE `level_{position:03d}` (
+                    `id` INTEGER NOT NULL PRIMARY KEY,
+                    `parent_id` INTEGER,
+                    `name` VARCHAR(64) NOT NULL{reference}
+                )
+            """)
+            connection.execute(f"CREATE INDEX `idx_level_{position:03d}_name` ON `level_{position:03d}` (`name`)")
+            connection.executemany(
+                f"INSERT INTO `level_{position:03d}` VALUES (?, ?, ?)",
+                [(row, row if position else None, f"name {row}") for row in range(1, rows + 1)]
+            )
+    return ["foreign_key_chain"]
+
+
+def wide_tables(directory, scale = 1.0, tables = 10, columns = 200, rows = 500):
+    '''
+    Tables with hundreds of columns, dominated by per-cell work.
+    '''
+    rows = max(1, int(rows * scale))
+    column_types = ["INTEGER", "VARCHAR(32)", "DOUBLE", "BLOB"]
+
+    with closing(create_source(directory, "wide_tables")) as connection, connection:
+        for position in range(tables):
+            definitions = ", ".join(
+                f"`c{column:03d}` {column_types[column % len(column_types)]}" for column in range(columns)
+            )
+            connection.execute(f"CREATE TABLE `wide_{position:02d}` (`id` INTEGER NOT NULL PRIMARY KEY, {definitions})")
+
+            values = [
+                [column, f"value {column}", column / 7, bytes(16)][column % len(column_types)]
+                for column in range(columns)
+            ]
+            placeholders = ", ".join("?" for _ in range(columns + 1))
+            connection.executemany(
+                f"INSERT INTO `wide_{position:02d}` VALUES ({placeholders})",
+                [[row] + values for row in range(1, rows + 1)]
+            )
+    return ["wide_tables"]
+
+
+SCENARIOS = {
+    "many_tables": many_tables,
+    "foreign_key_chain": foreign_key_chain,
+    "wide_tables": wide_tables,
+}
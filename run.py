@@ -1,7 +1,63 @@
+import argparse
+
+from app.async_replicator import AsyncReplicator
+from app.change_data_capture import RecordedEventSource
+from app.daemon_replicator import DaemonReplicator
+from app.plan_replicator import PlanReplicator
 from app.replicator import Replicator
+from app.sharded_replicator import ShardedReplicator
+from app.snapshot_replicator import SnapshotReplicator
+from app.stream_replicator import StreamReplicator
 
-replicator = Replicator()
+REPLICATORS = {
+    "run": Replicator,
+    "stream": StreamReplicator,
+    "plan": PlanReplicator,
+    "apply": PlanReplicator,
+    "export": SnapshotReplicator,
+    "import": SnapshotReplicator,
+    "coordinate": ShardedReplicator,
+    "work": ShardedReplicator,
+    "serve": DaemonReplicator,
+}
 
-if __name__ == "__main__":
-    replicator.run()
+def main():
+    parser = argparse.ArgumentParser(description="A database replicator")
+    parser.add_argument("mode", nargs="?", default="run", choices=list(REPLICATORS))
+    parser.add_argument("--events", help="recorded event file replayed instead of the source binlog")
+    parser.add_argument("--plan", help="plan file written by plan and executed by apply (default STATE_DIR/plan.json)")
+    parser.add_argument("--snapshot", help="snapshot file written by export and restored by import (default STATE_DIR/snapshot.drs)")
+    parser.add_argument("--store", help="work unit store shared by coordinate and work (default STATE_DIR/work_units.sqlite)")
+    parser.add_argument("--workers", type=int, default=0, help="worker processes started on this host by coordinate")
+    parser.add_argument("--worker-id", help="name of this worker in the store (default host:pid)")
+    parser.add_argument("--cycles", type=int, help="polls made by serve before it stops (default until stopped)")
+    parser.add_argument("--async", dest="asynchronous", action="store_true", help="run with the structure steps on the async engine")
+    arguments = parser.parse_args()
+    if arguments.asynchronous and arguments.mode != "run":
+        parser.error("--async only applies to the run mode")
+
+    replicator = AsyncReplicator() if arguments.asynchronous else REPLICATORS[arguments.mode]()
 
+    if arguments.mode == "stream":
+        event_source = RecordedEventSource(arguments.events) if arguments.events else None
+        replicator.stream(event_source)
+    elif arguments.mode == "plan":
+        replicator.plan(arguments.plan)
+    elif arguments.mode == "apply":
+        replicator.apply(arguments.plan)
+    elif arguments.mode == "export":
+        replicator.export_snapshot(arguments.snapshot)
+    elif arguments.mode == "import":
+        replicator.import_snapshot(arguments.snapshot)
+    elif arguments.mode == "coordinate":
+        replicator.coordinate(arguments.store, arguments.workers)
+    elif arguments.mode == "work":
+        replicator.work(arguments.store, arguments.worker_id)
+    elif arguments.mode == "serve":
+        replicator.serve(arguments.cycles)
+    else:
+        replicator.run()
+
+
+if __name__ == "__main__":
+    main()
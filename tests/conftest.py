@@ -0,0 +1,78 @@
+import json
+import os
+import sqlite3
+
+import pytest
+
+# app configures its log file relative to the working directory on import
+os.makedirs("logs", exist_ok=True)
+
+from app.engine_registry import engine_registry
+from app.replicator import Replicator
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    '''
+    Empty source and target SQLite hosts, with the working directory holding
+    the config directory Replicator reads its configuration from.
+    '''
+    (tmp_path / "config").mkdir()
+    (tmp_path / "source").mkdir()
+    (tmp_path / "target").mkdir()
+    monkeypatch.chdir(tmp_path)
+    yield tmp_path
+    engine_registry.dispose_all()
+
+
+def write_config(workspace, file_name = "connections.json", targets = ("target",), **target_options):
+    '''
+    Configuration replicating the source host to the given target hosts of the
+    workspace, every target with target_options.
+    '''
+    for target in targets:
+        (workspace / target).mkdir(exist_ok=True)
+
+    config = {
+        "STATE_DIR": str(workspace / "state"),
+        "replicated_connection": {"HOST": str(workspace / "source"), "PORT": None, "DATABASE": [], "DBMS": "sqlite"},
+        "other_connections": [{"HOST": str(workspace / target), "PORT": None, **target_options} for target in targets],
+    }
+    with open(workspace / "config" / file_name, "w", encoding="utf-8") as file_open:
+        json.dump(config, file_open)
+    return file_name
+
+
+def execute(path, *statements):
+    with sqlite3.connect(path) as connection:
+        for statement in statements:
+            if isinstance(statement, tuple):
+                connection.executemany(*statement)
+            else:
+                connection.execute(statement)
+    connection.close()
+
+
+def fetch(path, sql):
+    with sqlite3.connect(path) as connection:
+        rows = connection.execute(sql).fetchall()
+    connection.close()
+    return rows
+
+
+def replicate(config_file, replicator_class = Replicator):
+    '''
+    One run, with the checkpoint journal closed afterwards.
+    '''
+    replicator = replicator_class(config_file)
+    try:
+        replicator.run()
+    finally:
+        if replicator.journal is not None:
+            replicator.journal.close()
+    return replicator
+
+
+def same_rows(workspace, path, table, target = "target"):
+    sql = f"SELECT * FROM {table} ORDER BY 1"
+    return fetch(workspace / target / path, sql) == fetch(workspace / "source" / path, sql)
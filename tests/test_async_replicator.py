@@ -0,0 +1,24 @@
+from app.async_replicator import AsyncReplicator
+from conftest import execute, fetch, replicate, same_rows, write_config
+
+
+def columns(path, table):
+    return [row[1] for row in fetch(path, f"PRAGMA table_info({table})")]
+
+
+def test_async_run_replicates_structures_and_rows(workspace):
+    execute(
+        workspace / "source" / "shop.sqlite",
+        "CREATE TABLE customers (id INTEGER PRIMARY KEY, name TEXT, email TEXT)",
+        "CREATE TABLE orders (id INTEGER PRIMARY KEY, customer INTEGER REFERENCES customers (id), total REAL)",
+        ("INSERT INTO customers VALUES (?, ?, ?)", [(number, f"customer {number}", None) for number in range(50)]),
+        ("INSERT INTO orders VALUES (?, ?, ?)", [(number, number % 50, number * 2.5) for number in range(200)]),
+    )
+    execute(workspace / "target" / "shop.sqlite", "CREATE TABLE customers (id INTEGER PRIMARY KEY, name TEXT)")
+
+    replicate(write_config(workspace, targets=("target", "other"), DATA=True, LOAD_METHOD="insert"), AsyncReplicator)
+
+    for target in ("target", "other"):
+        assert columns(workspace / target / "shop.sqlite", "customers") == ["id", "name", "email"]
+        assert same_rows(workspace, "shop.sqlite", "customers", target)
+        assert same_rows(workspace, "shop.sqlite", "orders", target)
@@ -0,0 +1,119 @@
+import json
+
+import pytest
+
+from app.change_data_capture import ChangeEvent, SyntheticEventSource
+from app.stream_replicator import StreamReplicator
+from conftest import execute, fetch, replicate, write_config
+
+
+def position(number):
+    return {"file": "binlog.000001", "position": number}
+
+
+def commit(number):
+    return ChangeEvent("commit", position=position(number))
+
+
+def seed(workspace, targets = ("target",)):
+    execute(
+        workspace / "source" / "shop.sqlite",
+        "CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT, price REAL)",
+        ("INSERT INTO items VALUES (?, ?, ?)", [(1, "pen", 1.5), (2, "ink", 3.0), (3, "pad", 2.0)]),
+    )
+    config_file = write_config(workspace, targets=targets, DATA=True, LOAD_METHOD="insert")
+    replicate(config_file)
+    return config_file
+
+
+def saved_position(workspace):
+    return json.loads((workspace / "state" / "binlog_position.json").read_text(encoding="utf-8"))
+
+
+def test_change_applier_applies_committed_transactions(workspace):
+    config_file = seed(workspace)
+    events = [
+        ChangeEvent("insert", "shop", "items", [{"id": 4, "name": "cap", "price": 0.5}]),
+        ChangeEvent("update", "shop", "items", [[{"id": 1, "name": "pen", "price": 1.5}, {"id": 1, "name": "pen", "price": 1.75}]]),
+        commit(10),
+        ChangeEvent("update", "shop", "items", [[{"id": 2, "name": "ink", "price": 3.0}, {"id": 20, "name": "ink", "price": 3.0}]]),
+        ChangeEvent("delete", "shop", "items", [{"id": 3, "name": "pad", "price": 2.0}]),
+        commit(11),
+        ChangeEvent("insert", "shop", "items", [{"id": 5, "name": "uncommitted", "price": 0}]),
+    ]
+
+    StreamReplicator(config_file).stream(SyntheticEventSource(events))
+
+    assert fetch(workspace / "target" / "shop.sqlite", "SELECT * FROM items ORDER BY id") == [
+        (1, "pen", 1.75), (4, "cap", 0.5), (20, "ink", 3.0),
+    ]
+    assert saved_position(workspace) == position(11)
+
+
+def test_resumes_after_the_saved_position(workspace):
+    config_file = seed(workspace)
+    events = [
+        ChangeEvent("insert", "shop", "items", [{"id": 4, "name": "cap", "price": 0.5}]),
+        commit(10),
+        ChangeEvent("insert", "shop", "items", [{"id": 5, "name": "mug", "price": 4.0}]),
+        commit(11),
+    ]
+    StreamReplicator(config_file).stream(SyntheticEventSource(events[:2]))
+    execute(workspace / "target" / "shop.sqlite", "DELETE FROM items WHERE id = 4")
+
+    StreamReplicator(config_file).stream(SyntheticEventSource(events))
+
+    assert fetch(workspace / "target" / "shop.sqlite", "SELECT id FROM items ORDER BY id") == [(1,), (2,), (3,), (5,)]
+
+
+def test_failed_ddl_stops_the_stream_before_its_position(workspace):
+    config_file = seed(workspace, targets=("first", "second"))
+    execute(workspace / "source" / "shop.sqlite", "CREATE TABLE notes (id INTEGER PRIMARY KEY)")
+    execute(workspace / "first" / "shop.sqlite", "CREATE TABLE notes (id INTEGER PRIMARY KEY)")
+    events = [
+        ChangeEvent("insert", "shop", "items", [{"id": 4, "name": "cap", "price": 0.5}]),
+        commit(10),
+        ChangeEvent("ddl", "shop", statement="ALTER TABLE notes ADD COLUMN body TEXT", position=position(11)),
+        ChangeEvent("insert", "shop", "items", [{"id": 5, "name": "mug", "price": 4.0}]),
+        commit(12),
+    ]
+    execute(workspace / "source" / "shop.sqlite", "ALTER TABLE notes ADD COLUMN body TEXT")
+
+    with pytest.raises(ValueError, match="Could not apply DDL on"):
+        StreamReplicator(config_file).stream(SyntheticEventSource(events))
+
+    assert saved_position(workspace) == position(10)
+    for target in ("first", "second"):
+        assert fetch(workspace / target / "shop.sqlite", "SELECT MAX(id) FROM items") == [(4,)]
+
+    execute(workspace / "second" / "shop.sqlite", "CREATE TABLE notes (id INTEGER PRIMARY KEY)")
+    StreamReplicator(config_file).stream(SyntheticEventSource(events))
+
+    assert saved_position(workspace) == position(12)
+    for target in ("first", "second"):
+        assert [row[1] for row in fetch(workspace / target / "shop.sqlite", "PRAGMA table_info(notes)")] == ["id", "body"]
+        assert fetch(workspace / target / "shop.sqlite", "SELECT MAX(id) FROM items") == [(5,)]
+
+
+def test_generated_columns_of_the_row_image_are_left_to_the_target(workspace):
+    execute(
+        workspace / "source" / "shop.sqlite",
+        "CREATE TABLE lines (id INTEGER PRIMARY KEY, price REAL, quantity INTEGER, "
+        "total REAL GENERATED ALWAYS AS (price * quantity) STORED)",
+        "INSERT INTO lines (id, price, quantity) VALUES (1, 2.0, 3)",
+    )
+    config_file = write_config(workspace, DATA=True, LOAD_METHOD="insert")
+    replicate(config_file)
+    events = [
+        ChangeEvent("insert", "shop", "lines", [{"id": 2, "price": 1.5, "quantity": 2, "total": 3.0}]),
+        ChangeEvent("update", "shop", "lines", [[
+            {"id": 1, "price": 2.0, "quantity": 3, "total": 6.0}, {"id": 1, "price": 2.0, "quantity": 4, "total": 8.0},
+        ]]),
+        commit(10),
+    ]
+
+    StreamReplicator(config_file).stream(SyntheticEventSource(events))
+
+    assert fetch(workspace / "target" / "shop.sqlite", "SELECT id, quantity, total FROM lines ORDER BY id") == [
+        (1, 4, 8.0), (2, 2, 3.0),
+    ]
@@ -0,0 +1,44 @@
+from app import change_scheduler
+from app.change_scheduler import ChangeScheduler
+
+
+def test_hottest_tables_go_first_and_cool_down(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(change_scheduler.time, "monotonic", lambda: now[0])
+    scheduler = ChangeScheduler(half_life=10)
+
+    scheduler.record(["shop.orders", "shop.items"], "data")
+    scheduler.record(["shop.orders"], "data")
+    scheduler.record(["shop.items"], "structure")
+    scheduler.record(["shop.orders"], "data")
+    scheduler.record(["shop.notes"], "data")
+
+    assert len(scheduler) == 3
+    assert scheduler.next_tables() == [
+        ("shop.orders", {"data"}), ("shop.items", {"data", "structure"}), ("shop.notes", {"data"}),
+    ]
+    assert len(scheduler) == 0
+
+    now[0] = 30.0
+    scheduler.record(["shop.orders", "shop.notes"], "data")
+    scheduler.record(["shop.notes"], "data")
+
+    assert scheduler.next_tables() == [("shop.notes", {"data"}), ("shop.orders", {"data"})]
+
+
+def test_limit_leaves_tables_for_later_and_requeue_keeps_their_heat(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(change_scheduler.time, "monotonic", lambda: now[0])
+    scheduler = ChangeScheduler(half_life=10)
+    scheduler.record(["shop.orders"] * 3 + ["shop.items"], "data")
+    scheduler.record(["shop.notes"], "structure")
+
+    tables = scheduler.next_tables(limit=1)
+    assert tables == [("shop.orders", {"data"})]
+    assert len(scheduler) == 2
+
+    scheduler.requeue(tables)
+    scheduler.record(["shop.items"], "structure")
+
+    assert scheduler.next_tables(limit=2) == [("shop.orders", {"data"}), ("shop.items", {"data", "structure"})]
+    assert scheduler.next_tables(limit=2) == [("shop.notes", {"structure"})]
@@ -0,0 +1,35 @@
+import pytest
+
+from app.data_copy import DataCopier
+from conftest import execute, fetch, replicate, same_rows, write_config
+
+
+def test_interrupted_copy_resumes_without_duplicating_or_skipping_rows(workspace, monkeypatch):
+    execute(
+        workspace / "source" / "shop.sqlite",
+        "CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)",
+        ("INSERT INTO items VALUES (?, ?)", [(number, f"item {number}") for number in range(1, 1001)]),
+    )
+    config_file = write_config(workspace, DATA=True, LOAD_METHOD="insert", CHUNK_SIZE=100, BATCH_SIZE=30)
+    write_rows = DataCopier.write_rows
+    calls = []
+
+    def interrupted_write_rows(data_copier, writer, target_connection, table, columns, rows):
+        calls.append(len(rows))
+        if len(calls) == 14:
+            raise RuntimeError("connection lost")
+        return write_rows(data_copier, writer, target_connection, table, columns, rows)
+
+    monkeypatch.setattr(DataCopier, "write_rows", interrupted_write_rows)
+    with pytest.raises(ValueError, match="Replication failed"):
+        replicate(config_file)
+
+    target = workspace / "target" / "shop.sqlite"
+    assert fetch(target, "SELECT COUNT(*), MIN(id), MAX(id) FROM items") == [(300, 1, 300)]
+
+    monkeypatch.setattr(DataCopier, "write_rows", write_rows)
+    replicator = replicate(config_file)
+
+    assert [report.rows for report in replicator.data_reports] == [700]
+    assert fetch(target, "SELECT COUNT(*), COUNT(DISTINCT id) FROM items") == [(1000, 1000)]
+    assert same_rows(workspace, "shop.sqlite", "items")
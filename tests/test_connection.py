@@ -0,0 +1,17 @@
+import pytest
+
+from app.connection_db import Connection
+
+
+@pytest.mark.parametrize("settings, replicated_connection, local_infile", [
+    ({"DATA": True}, False, True),
+    ({"DATA": True, "LOAD_METHOD": "infile"}, False, True),
+    ({"DATA": True, "LOAD_METHOD": "insert"}, False, False),
+    ({"DATA": False}, False, False),
+    ({"DATA": True}, True, False),
+])
+def test_local_infile_is_only_enabled_on_loading_targets(settings, replicated_connection, local_infile):
+    connection = Connection({"HOST": "db", "PORT": 3306, "POOL_SIZE": 2, **settings}, replicated_connection)
+
+    assert connection.pool_options.get("connect_args") == ({"local_infile": True} if local_infile else None)
+    assert connection.pool_options["pool_size"] == 2
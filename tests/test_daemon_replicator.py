@@ -0,0 +1,58 @@
+import json
+
+from sqlalchemy import text
+
+from app.backends import BACKENDS
+from app.daemon_replicator import DaemonReplicator
+from app.sqlite_database import SQLiteDatabase
+from conftest import execute, fetch, same_rows, write_config
+
+
+class DeferringDatabase(SQLiteDatabase):
+    '''
+    SQLite backend claiming to add foreign keys with ALTER TABLE, recording
+    them with the rows of their table at that time instead.
+    '''
+    alter_definitions = True
+    added_definitions = []
+
+    def alter_table(self, statement):
+        if " FOREIGN KEY " not in statement:
+            return super().alter_table(statement)
+
+        table = statement.split("`")[1]
+        rows = self.connection.execute(text(f"SELECT COUNT(*) FROM `{table}`")).scalar()
+        self.added_definitions.append((table, rows))
+
+
+def test_tables_created_by_a_cycle_get_their_deferred_definitions_in_that_cycle(workspace, monkeypatch):
+    monkeypatch.setitem(BACKENDS, "deferring", DeferringDatabase)
+    monkeypatch.setattr(DeferringDatabase, "added_definitions", [])
+    source = workspace / "source" / "shop.sqlite"
+    execute(source, "CREATE TABLE authors (id INTEGER PRIMARY KEY, name TEXT)", "INSERT INTO authors VALUES (1, 'ann')")
+    config_file = write_config(workspace, DATA=True, LOAD_METHOD="insert", DEFER_INDEXES=True)
+    config = json.loads((workspace / "config" / config_file).read_text(encoding="utf-8"))
+    config["replicated_connection"]["DBMS"] = "deferring"
+    config["DAEMON"] = {"INTERVAL": 0.01}
+    (workspace / "config" / config_file).write_text(json.dumps(config), encoding="utf-8")
+
+    run_pass = DaemonReplicator.run_pass
+
+    def run_pass_then_add_books(replicator):
+        run_pass(replicator)
+        execute(
+            source,
+            "CREATE TABLE books (id INTEGER PRIMARY KEY, author INTEGER, "
+            "CONSTRAINT `books_author` FOREIGN KEY (author) REFERENCES authors (id))",
+            ("INSERT INTO books VALUES (?, ?)", [(number, 1) for number in range(40)]),
+        )
+
+    monkeypatch.setattr(DaemonReplicator, "run_pass", run_pass_then_add_books)
+    replicator = DaemonReplicator(config_file)
+    replicator.serve(max_cycles=1)
+
+    assert DeferringDatabase.added_definitions == [("books", 40)]
+    assert replicator.deferred_index_builds == {}
+    assert fetch(workspace / "state" / "checkpoints.sqlite", "SELECT COUNT(*) FROM pending_ddl") == [(0,)]
+    assert same_rows(workspace, "shop.sqlite", "books")
+    assert "books_author" not in fetch(workspace / "target" / "shop.sqlite", "SELECT sql FROM sqlite_master WHERE name = 'books'")[0][0]
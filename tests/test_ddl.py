@@ -0,0 +1,53 @@
+from app.ddl import remove_definitions, remove_foreign_keys, split_secondary_definitions
+
+MYSQL_SCRIPT = """CREATE TABLE `books` (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `title` varchar(100) DEFAULT 'a, (b)',
+  `price` decimal(10,2) DEFAULT NULL,
+  `author` int DEFAULT NULL,
+  PRIMARY KEY (`id`),
+  KEY `books_title` (`title`),
+  CONSTRAINT `books_author` FOREIGN KEY (`author`) REFERENCES `authors` (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='books (all)'"""
+
+
+def test_foreign_key_removed_from_a_multi_line_script():
+    assert remove_foreign_keys(MYSQL_SCRIPT, ["books_author"]) == """CREATE TABLE `books` (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `title` varchar(100) DEFAULT 'a, (b)',
+  `price` decimal(10,2) DEFAULT NULL,
+  `author` int DEFAULT NULL,
+  PRIMARY KEY (`id`),
+  KEY `books_title` (`title`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='books (all)'"""
+
+
+def test_secondary_definitions_split_from_a_multi_line_script():
+    script, changes = split_secondary_definitions(MYSQL_SCRIPT, ["id"])
+
+    assert script == """CREATE TABLE `books` (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `title` varchar(100) DEFAULT 'a, (b)',
+  `price` decimal(10,2) DEFAULT NULL,
+  `author` int DEFAULT NULL,
+  PRIMARY KEY (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='books (all)'"""
+    assert changes == [
+        ("ADD INDEX", "ADD KEY `books_title` (`title`)"),
+        ("ADD FOREIGN KEY", "ADD CONSTRAINT `books_author` FOREIGN KEY (`author`) REFERENCES `authors` (`id`)"),
+    ]
+
+
+def test_definitions_removed_from_a_single_line_script():
+    script = (
+        "CREATE TABLE books (id INTEGER PRIMARY KEY, price NUMERIC(10, 2), "
+        "CONSTRAINT books_author FOREIGN KEY (author) REFERENCES authors (id), CHECK (price > 0))"
+    )
+
+    assert remove_definitions(script, lambda definition: definition.startswith("CONSTRAINT")) == (
+        "CREATE TABLE books (id INTEGER PRIMARY KEY, price NUMERIC(10, 2), CHECK (price > 0))"
+    )
+    assert remove_definitions(script, lambda definition: definition.startswith("id ")) == (
+        "CREATE TABLE books (price NUMERIC(10, 2), "
+        "CONSTRAINT books_author FOREIGN KEY (author) REFERENCES authors (id), CHECK (price > 0))"
+    )
@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+from conftest import execute, fetch, replicate, same_rows, write_config
+
+SHOP = (
+    "CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT NOT NULL, price REAL)",
+    "CREATE TABLE blobs (id BLOB PRIMARY KEY, payload BLOB)",
+    ("INSERT INTO items VALUES (?, ?, ?)", [(number, f"item {number}", number * 1.5) for number in range(1, 251)]),
+    ("INSERT INTO blobs VALUES (?, ?)", [(bytes([number, 255 - number]), bytes(number % 7) * 3) for number in range(200)]),
+)
+
+
+@pytest.mark.parametrize("sync_mode", ["delta", "check"])
+def test_delta_sync_repairs_drifted_rows(workspace, sync_mode):
+    execute(workspace / "source" / "shop.sqlite", *SHOP)
+    replicate(write_config(workspace, DATA=True, LOAD_METHOD="insert"))
+
+    target = workspace / "target" / "shop.sqlite"
+    execute(
+        target,
+        "UPDATE items SET price = -1 WHERE id IN (3, 120)",
+        "DELETE FROM items WHERE id = 77",
+        "INSERT INTO items VALUES (1000, 'extra', 0)",
+        "UPDATE blobs SET payload = x'00' WHERE id = x'05fa'",
+        "DELETE FROM blobs WHERE id = x'807f'",
+        "INSERT INTO blobs VALUES (x'ffff', NULL)",
+    )
+    drifted_items = fetch(target, "SELECT * FROM items ORDER BY id")
+
+    replicate(write_config(
+        workspace, "delta.json", DATA=True, SYNC_MODE=sync_mode, CHUNK_SIZE=50, MIN_CHUNK_SIZE=5
+    ))
+
+    [report_path] = (workspace / "state").glob("drift_report_*.json")
+    reports = {report["table"]: report for report in json.loads(report_path.read_text(encoding="utf-8"))}
+    drift = {
+        table: (report["rows_inserted"], report["rows_updated"], report["rows_deleted"]) for table, report in reports.items()
+    }
+    assert drift == {"items": (1, 2, 1), "blobs": (1, 1, 1)}
+    assert all(report["check_only"] == (sync_mode == "check") for report in reports.values())
+
+    if sync_mode == "check":
+        assert fetch(target, "SELECT * FROM items ORDER BY id") == drifted_items
+    else:
+        assert same_rows(workspace, "shop.sqlite", "items")
+        assert same_rows(workspace, "shop.sqlite", "blobs")
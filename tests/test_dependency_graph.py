@@ -0,0 +1,41 @@
+from app.dependency_graph import DependencyGraph
+
+
+def graph(foreign_keys):
+    dependency_graph = DependencyGraph()
+    for table, referenced_tables in foreign_keys.items():
+        dependency_graph.add_table(table)
+        for referenced_table in referenced_tables:
+            dependency_graph.add_table(referenced_table)
+    for table, referenced_tables in foreign_keys.items():
+        for referenced_table in referenced_tables:
+            dependency_graph.add_foreign_key(table, referenced_table, f"fk_{table}_{referenced_table}")
+    return dependency_graph
+
+
+def test_tables_are_sorted_in_levels():
+    dependency_graph = graph({"orders": ["customers", "products"], "lines": ["orders", "products"], "customers": []})
+
+    assert dependency_graph.levels() == [["customers", "products"], ["orders"], ["lines"]]
+    assert dependency_graph.deferred_foreign_keys == {}
+
+
+def test_only_foreign_keys_inside_the_cycle_are_deferred():
+    dependency_graph = graph({
+        "accounts": ["x"],
+        "x": ["y", "z"],
+        "y": ["x", "z"],
+        "z": ["x", "y"],
+    })
+
+    levels = dependency_graph.levels()
+
+    deferred = {constraint for constraints in dependency_graph.deferred_foreign_keys.values() for constraint in constraints}
+    assert "fk_accounts_x" not in deferred
+    assert deferred <= {f"fk_{table}_{other}" for table in "xyz" for other in "xyz"}
+
+    level_of = {table: number for number, level in enumerate(levels) for table in level}
+    for table, references in dependency_graph.foreign_keys.items():
+        for referenced_table, constraint in references:
+            if constraint not in deferred:
+                assert level_of[referenced_table] < level_of[table]
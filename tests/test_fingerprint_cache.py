@@ -0,0 +1,61 @@
+from app.fingerprint_cache import FingerprintCache
+from conftest import execute, fetch, replicate, write_config
+
+
+class Definition:
+    def __init__(self, fingerprint) -> None:
+        self.value = fingerprint
+
+    def fingerprint(self):
+        return self.value
+
+
+class Snapshot:
+    def __init__(self, **fingerprints) -> None:
+        self.tables = {table: Definition(fingerprint) for table, fingerprint in fingerprints.items()}
+
+    def get_table(self, database, table):
+        return self.tables.get(table)
+
+
+def test_table_is_unchanged_while_probes_and_fingerprints_match(tmp_path):
+    fingerprint_cache = FingerprintCache(str(tmp_path / "fingerprints.json"))
+    assert not fingerprint_cache.is_unchanged("source", "target", "shop.items", "p1", "p1")
+
+    fingerprint_cache.update("source", {"shop.items": "p1", "shop.notes": "n1"}, Snapshot(items="f1", notes="f2"))
+    fingerprint_cache.update("target", {"shop.items": "p1", "shop.notes": "n1"}, Snapshot(items="f1", notes="f3"))
+    fingerprint_cache.save()
+
+    reloaded = FingerprintCache(str(tmp_path / "fingerprints.json"))
+    reloaded.load()
+    assert reloaded.is_unchanged("source", "target", "shop.items", "p1", "p1")
+    assert not reloaded.is_unchanged("source", "target", "shop.items", "p2", "p1")
+    assert not reloaded.is_unchanged("source", "target", "shop.items", "p1", None)
+    assert not reloaded.is_unchanged("source", "target", "shop.items", None, "p1")
+    assert not reloaded.is_unchanged("source", "target", "shop.notes", "n1", "n1")
+
+
+def test_dropped_table_leaves_the_cache(tmp_path):
+    fingerprint_cache = FingerprintCache(str(tmp_path / "fingerprints.json"))
+    fingerprint_cache.update("source", {"shop.items": "p1"}, Snapshot(items="f1"))
+    fingerprint_cache.update("source", {"shop.items": "p1"}, Snapshot())
+
+    assert fingerprint_cache.servers == {"source": {}}
+
+
+def test_rerun_skips_tables_unchanged_since_the_last_run(workspace):
+    execute(
+        workspace / "source" / "shop.sqlite",
+        "CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)",
+        "CREATE TABLE notes (id INTEGER PRIMARY KEY, body TEXT)",
+    )
+    config_file = write_config(workspace)
+    replicate(config_file)
+
+    assert list(replicate(config_file).tables_to_replicate.values()) == [set()]
+
+    execute(workspace / "source" / "shop.sqlite", "ALTER TABLE items ADD COLUMN price REAL")
+    replicator = replicate(config_file)
+
+    assert list(replicator.tables_to_replicate.values()) == [{"shop.items"}]
+    assert [row[1] for row in fetch(workspace / "target" / "shop.sqlite", "PRAGMA table_info(items)")] == ["id", "name", "price"]
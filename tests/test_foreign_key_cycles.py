@@ -0,0 +1,31 @@
+import pytest
+
+from conftest import execute, fetch, replicate, same_rows, write_config
+
+CYCLE = (
+    "CREATE TABLE authors (id INTEGER PRIMARY KEY, name TEXT, favourite INTEGER REFERENCES books (id))",
+    "CREATE TABLE books (id INTEGER PRIMARY KEY, title TEXT, author INTEGER REFERENCES authors (id))",
+    "CREATE INDEX books_title ON books (title)",
+    ("INSERT INTO authors VALUES (?, ?, ?)", [(number, f"author {number}", None) for number in range(20)]),
+    ("INSERT INTO books VALUES (?, ?, ?)", [(number, f"book {number}", number % 20) for number in range(60)]),
+)
+
+
+def foreign_keys(path, table):
+    return [(row[2], row[3], row[4]) for row in fetch(path, f"PRAGMA foreign_key_list({table})")]
+
+
+@pytest.mark.parametrize("options", [{}, {"DATA": True, "LOAD_METHOD": "insert", "DEFER_INDEXES": True}])
+def test_foreign_key_cycle_is_replicated(workspace, caplog, options):
+    execute(workspace / "source" / "shop.sqlite", *CYCLE)
+
+    replicate(write_config(workspace, **options))
+
+    assert ("Indexes are not deferred" in caplog.text) == bool(options)
+
+    target = workspace / "target" / "shop.sqlite"
+    assert foreign_keys(target, "authors") == [("books", "favourite", "id")]
+    assert foreign_keys(target, "books") == [("authors", "author", "id")]
+    if options:
+        assert same_rows(workspace, "shop.sqlite", "authors")
+        assert same_rows(workspace, "shop.sqlite", "books")
@@ -0,0 +1,36 @@
+import threading
+
+from sqlalchemy import create_engine, text
+
+from app.instrumentation import Instrumentation
+
+
+def test_concurrent_spans_count_their_own_round_trips():
+    instrumentation = Instrumentation()
+    barrier = threading.Barrier(2)
+
+    def run_statements(name, count):
+        engine = create_engine("sqlite://")
+        instrumentation.attach(engine)
+        with engine.connect() as connection:
+            with instrumentation.span(name):
+                barrier.wait()
+                for _ in range(count):
+                    connection.execute(text("SELECT 1"))
+                barrier.wait()
+        engine.dispose()
+
+    with instrumentation.span("run"):
+        threads = [
+            threading.Thread(target=instrumentation.bind(run_statements), args=(name, count))
+            for name, count in (("first", 3), ("second", 5))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=10)
+
+    spans = {span["name"]: span for span in instrumentation.report()["phases"]}
+    assert {name: span["round_trips"] for name, span in spans.items()} == {"run": 8, "first": 3, "second": 5}
+    assert spans["first"]["parent"] == spans["second"]["parent"] == "run"
+    assert instrumentation.report()["round_trips"] == 8
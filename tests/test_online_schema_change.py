@@ -0,0 +1,86 @@
+from app.connection_db import Connection
+from app.migration_plan import MigrationPlan
+from app.online_schema_change import OnlineSchemaChange, change_name
+from conftest import execute, fetch
+
+
+def connection(workspace):
+    return Connection({"HOST": str(workspace / "target"), "PORT": None, "DBMS": "sqlite", "CHUNK_SIZE": 40})
+
+
+def plan(*changes, table = "items"):
+    migration_plan = MigrationPlan("shop", table)
+    for kind, clause in changes:
+        migration_plan.add(kind, clause)
+    return migration_plan
+
+
+def test_names_of_long_tables_stay_short_and_distinct():
+    first, second = "orders_" + "x" * 60 + "_2023", "orders_" + "x" * 60 + "_2024"
+
+    names = [
+        change_name(table, suffix, prefix)
+        for table in (first, second) for suffix, prefix in (("new", ""), ("old", ""), ("ins", "osc_"))
+    ]
+
+    assert len(set(names)) == 6
+    assert max(len(name) for name in names) <= 64
+
+
+def test_snapshot_of_the_caller_is_used(workspace):
+    execute(
+        workspace / "target" / "shop.sqlite",
+        "CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)",
+        "CREATE TABLE parts (id INTEGER PRIMARY KEY, item INTEGER REFERENCES items (id))",
+        "CREATE TABLE notes (body TEXT)",
+    )
+    target = connection(workspace)
+    snapshot = target.load_schema_snapshot(["shop"])
+
+    def no_introspection(databases):
+        raise AssertionError("the snapshot should be reused")
+
+    target.load_schema_snapshot = no_introspection
+    assert OnlineSchemaChange(target, plan(("ADD COLUMN", "ADD COLUMN price REAL"))).is_possible(snapshot) == "foreign keys"
+    assert OnlineSchemaChange(target, plan(("ADD COLUMN", "ADD COLUMN price REAL"), table="notes")).is_possible(snapshot) == "no primary key"
+    assert OnlineSchemaChange(target, plan(("DROP COLUMN", "DROP COLUMN `id`"), table="parts")).is_possible(snapshot) == "primary key column dropped"
+    assert not OnlineSchemaChange(target, plan(("ADD COLUMN", "ADD COLUMN price REAL"), table="missing")).run(snapshot)
+
+
+def test_shadow_copy_replays_concurrent_writes_and_swaps_the_tables(workspace, monkeypatch):
+    database = workspace / "target" / "shop.sqlite"
+    execute(
+        database,
+        "CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT, legacy TEXT)",
+        "CREATE INDEX items_name ON items (name)",
+        ("INSERT INTO items VALUES (?, ?, ?)", [(number, f"item {number}", "x") for number in range(1, 201)]),
+    )
+    target = connection(workspace)
+    online_schema_change = OnlineSchemaChange(
+        target, plan(("ADD COLUMN", "ADD COLUMN price REAL"), ("DROP COLUMN", "DROP COLUMN `legacy`"))
+    )
+    copy_rows = online_schema_change._OnlineSchemaChange__copy_rows
+
+    def copy_rows_while_writing(columns, key_columns):
+        execute(database, "UPDATE items SET name = 'early' WHERE id = 5")
+        copy_rows(columns, key_columns)
+        execute(
+            database,
+            "INSERT INTO items VALUES (500, 'late', 'x')",
+            "UPDATE items SET name = 'renamed' WHERE id = 10",
+            "UPDATE items SET id = 1000 WHERE id = 11",
+            "DELETE FROM items WHERE id = 20",
+        )
+
+    monkeypatch.setattr(online_schema_change, "_OnlineSchemaChange__copy_rows", copy_rows_while_writing)
+
+    assert online_schema_change.run(target.load_schema_snapshot(["shop"]))
+
+    assert [row[1] for row in fetch(database, "PRAGMA table_info(items)")] == ["id", "name", "price"]
+    rows = dict(fetch(database, "SELECT id, name FROM items"))
+    assert len(rows) == 200
+    assert (rows[5], rows[10], rows[500], rows[1000]) == ("early", "renamed", "late", "item 11")
+    assert 11 not in rows and 20 not in rows
+    assert fetch(database, "SELECT type, name FROM sqlite_master WHERE name <> 'items' ORDER BY name") == [
+        ("index", "items_name"),
+    ]
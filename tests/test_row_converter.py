@@ -0,0 +1,49 @@
+import datetime
+import decimal
+
+from app.bulk_loader import encode_value, is_binary_type
+from app.row_converter import RowConverter, column_kind
+
+COLUMN_TYPES = [
+    "int unsigned", "decimal(10,2)", "varchar(20)", "varbinary(16)", "bit(8)", "datetime", "date", "time", "blob", "point",
+]
+ROWS = [
+    (1, decimal.Decimal("2.50"), "a\tb\\c", b"\x00\t\xff", b"\x05", datetime.datetime(2026, 1, 2, 3, 4, 5),
+     datetime.date(2026, 1, 2), datetime.timedelta(hours=-30, seconds=1), memoryview(b"\n\r"), "x"),
+    (None, None, None, None, None, None, None, None, None, None),
+    (True, 1.5, "é\n", bytearray(b"\\"), b"\x00", "2026-01-02 03:04:05", "2026-01-02", "12:00:00", "ab", b"\x01\t"),
+]
+
+
+def test_column_kinds_from_types():
+    assert [column_kind(column_type) for column_type in COLUMN_TYPES] == [
+        "number", "number", "text", "binary", "binary", "datetime", "date", "time", "binary", None,
+    ]
+    assert column_kind(None) is None
+
+
+def test_load_data_fields_match_value_by_value_encoding():
+    converter = RowConverter([f"c{position}" for position in range(len(COLUMN_TYPES))], COLUMN_TYPES)
+    binary_flags = [is_binary_type(column_type) for column_type in COLUMN_TYPES]
+
+    assert list(converter.encode_rows(ROWS)) == [
+        b"\t".join(encode_value(value, binary) for value, binary in zip(row, binary_flags)) for row in ROWS
+    ]
+    assert list(converter.encode_rows(ROWS[1:2])) == [b"\t".join([b"\\N"] * len(COLUMN_TYPES))]
+    assert next(converter.encode_rows(ROWS)).split(b"\t")[3:5] == [b"0009ff", b"05"]
+
+
+def test_tuples_hand_bytes_for_binary_columns_only():
+    converter = RowConverter(["id", "payload", "flags", "name"], ["int", "blob", "bit(1)", "text"])
+    rows = [(1, b"\x00", b"\x01", "a"), (2, None, None, None)]
+
+    assert all(converted is row for converted, row in zip(converter.tuples(rows), rows))
+    assert converter.tuples([[3, memoryview(b"\xff"), bytearray(b"\x00"), memoryview(b"kept")]]) == [
+        (3, b"\xff", b"\x00", memoryview(b"kept")),
+    ]
+    assert type(converter.tuples([(4, memoryview(b"\x01"), None, None)])[0][1]) is bytes
+
+    text_converter = RowConverter(["id", "name"], ["int", "text"])
+    text_rows = [(1, "a"), (2, None)]
+    assert text_converter.tuples(text_rows) is text_rows
+    assert text_converter.tuples([[1, "a"], [2, None]]) == text_rows
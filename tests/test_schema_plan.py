@@ -0,0 +1,48 @@
+import pytest
+
+from app.plan_replicator import PlanReplicator
+from app.schema_plan import SchemaPlan
+from conftest import execute, fetch, write_config
+
+
+def columns(path, table):
+    return [row[1] for row in fetch(path, f"PRAGMA table_info({table})")]
+
+
+def test_saved_plan_is_applied_without_introspecting_again(workspace):
+    execute(
+        workspace / "source" / "shop.sqlite",
+        "CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT NOT NULL, price REAL)",
+        "CREATE TABLE notes (id INTEGER PRIMARY KEY, body TEXT)",
+    )
+    execute(workspace / "target" / "shop.sqlite", "CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT NOT NULL)")
+    config_file = write_config(workspace)
+    path = str(workspace / "plan.json")
+
+    PlanReplicator(config_file).plan(path)
+
+    target = workspace / "target" / "shop.sqlite"
+    assert columns(target, "items") == ["id", "name"]
+    assert fetch(target, "SELECT name FROM sqlite_master WHERE name = 'notes'") == []
+    assert "ADD COLUMN" in (workspace / "plan.sql").read_text(encoding="utf-8")
+
+    schema_plan = SchemaPlan.load(path)
+    [target_name] = schema_plan.targets()
+    assert [(statement.table, statement.kind) for statement in schema_plan.statements_for(target_name)] == [
+        ("items", "ALTER TABLE"), ("notes", "CREATE TABLE"),
+    ]
+
+    execute(workspace / "source" / "shop.sqlite", "ALTER TABLE items ADD COLUMN stock INTEGER")
+    PlanReplicator(config_file).apply(path)
+
+    assert columns(target, "items") == ["id", "name", "price"]
+    assert columns(target, "notes") == ["id", "body"]
+
+
+def test_apply_refuses_a_plan_for_another_target(workspace):
+    execute(workspace / "source" / "shop.sqlite", "CREATE TABLE items (id INTEGER PRIMARY KEY)")
+    path = str(workspace / "plan.json")
+    PlanReplicator(write_config(workspace, targets=("other",))).plan(path)
+
+    with pytest.raises(ValueError, match="Plan targets not configured"):
+        PlanReplicator(write_config(workspace)).apply(path)
@@ -0,0 +1,69 @@
+import datetime
+import decimal
+
+import pytest
+
+from app.snapshot_replicator import SnapshotReplicator
+from app.snapshot import SnapshotReader, SnapshotWriter, decode_segment, encode_segment
+from conftest import execute, fetch, write_config
+
+
+def test_segment_round_trip_keeps_every_value_type():
+    rows = [
+        (None, True, 1, 2 ** 70, 1.25, "texto ç", b"\x00\xff", decimal.Decimal("10.50")),
+        (
+            datetime.datetime(2024, 2, 29, 23, 59, 59, 123456), datetime.date(2024, 1, 1), datetime.time(12, 30),
+            datetime.timedelta(days=-1, seconds=5), -2 ** 63, "", b"", False,
+        ),
+        ("mixed", 7, None, b"bytes", "", 0.0, decimal.Decimal("-0.001"), {"b", "a"}),
+    ]
+
+    decoded = decode_segment(encode_segment(rows))
+
+    assert decoded[:2] == rows[:2]
+    assert decoded[2] == rows[2][:-1] + ("a,b",)
+    assert [type(value) for value in decoded[1]] == [type(value) for value in rows[1]]
+
+
+def test_reader_rejects_another_format(tmp_path):
+    path = tmp_path / "old.drs"
+    path.write_bytes(b"DRSNAP01" + bytes(64))
+
+    with pytest.raises(ValueError, match="export it again"):
+        SnapshotReader(str(path))
+
+
+def test_writer_and_reader_round_trip(tmp_path):
+    path = str(tmp_path / "snapshot.drs")
+    batches = [[(number, bytes([number])) for number in range(start, start + 3)] for start in (0, 3)]
+
+    with SnapshotWriter(path, "source") as snapshot_writer:
+        snapshot_writer.set_schema(["shop"], [[], [], [], []], {("shop", "blobs"): "CREATE TABLE blobs (id INTEGER)"})
+        assert snapshot_writer.write_table("shop", "blobs", ["id", "payload"], batches + [[]]) == 6
+
+    with SnapshotReader(path, read_workers=2) as snapshot_reader:
+        assert snapshot_reader.source == "source"
+        assert snapshot_reader.create_statement("shop", "blobs") == "CREATE TABLE blobs (id INTEGER)"
+        assert snapshot_reader.columns("shop", "blobs") == ["id", "payload"]
+        assert list(snapshot_reader.read_table("shop", "blobs")) == batches
+
+
+def test_export_and_import_restore_the_source(workspace):
+    execute(
+        workspace / "source" / "shop.sqlite",
+        "CREATE TABLE customers (id BLOB PRIMARY KEY, name TEXT)",
+        "CREATE TABLE orders (id INTEGER PRIMARY KEY, customer BLOB REFERENCES customers (id), total NUMERIC)",
+        ("INSERT INTO customers VALUES (?, ?)", [(bytes([number, 0]), f"customer {number}") for number in range(30)]),
+        ("INSERT INTO orders VALUES (?, ?, ?)", [(number, bytes([number % 30, 0]), number * 2.5) for number in range(100)]),
+    )
+    config_file = write_config(workspace, DATA=True, LOAD_METHOD="insert")
+    snapshot_path = str(workspace / "shop.drs")
+
+    SnapshotReplicator(config_file).export_snapshot(snapshot_path)
+    replicator = SnapshotReplicator(config_file)
+    replicator.import_snapshot(snapshot_path)
+    replicator.journal.close()
+
+    for table in ("customers", "orders"):
+        sql = f"SELECT * FROM {table} ORDER BY id"
+        assert fetch(workspace / "target" / "shop.sqlite", sql) == fetch(workspace / "source" / "shop.sqlite", sql)
@@ -0,0 +1,33 @@
+from conftest import execute, fetch, replicate, same_rows, write_config
+
+SOURCE_TABLES = (
+    "CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT NOT NULL, price REAL)",
+    "CREATE TABLE blobs (id BLOB PRIMARY KEY, payload BLOB)",
+    ("INSERT INTO items VALUES (?, ?, ?)", [(number, f"item {number}", number * 1.5) for number in range(1, 251)]),
+    ("INSERT INTO blobs VALUES (?, ?)", [(bytes([number, 255 - number]), bytes(number % 7) * 3) for number in range(200)]),
+)
+
+
+def columns(path, table):
+    return [row[1] for row in fetch(path, f"PRAGMA table_info({table})")]
+
+
+def test_structure_diff_adds_missing_tables_and_columns(workspace):
+    execute(workspace / "source" / "shop.sqlite", *SOURCE_TABLES[:2])
+    execute(workspace / "target" / "shop.sqlite", "CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT NOT NULL)")
+
+    replicate(write_config(workspace))
+
+    target = workspace / "target" / "shop.sqlite"
+    assert columns(target, "items") == ["id", "name", "price"]
+    assert columns(target, "blobs") == ["id", "payload"]
+    assert fetch(target, "SELECT COUNT(*) FROM items") == [(0,)]
+
+
+def test_full_copy_with_integer_and_binary_keys(workspace):
+    execute(workspace / "source" / "shop.sqlite", *SOURCE_TABLES)
+
+    replicate(write_config(workspace, DATA=True, LOAD_METHOD="insert", BATCH_SIZE=64))
+
+    assert same_rows(workspace, "shop.sqlite", "items")
+    assert same_rows(workspace, "shop.sqlite", "blobs")
@@ -0,0 +1,38 @@
+import threading
+
+from app.connection_db import Connection
+from app.tee_copy import TeeCopier
+from conftest import execute, same_rows
+
+
+def connection(workspace, host):
+    return Connection({
+        "HOST": str(workspace / host), "PORT": None, "DBMS": "sqlite", "DATA": True, "LOAD_METHOD": "insert",
+        "BATCH_SIZE": 10, "CHUNK_SIZE": 100,
+    })
+
+
+def test_failing_target_does_not_block_the_reader_or_the_other_targets(workspace):
+    execute(
+        workspace / "source" / "shop.sqlite",
+        "CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)",
+        ("INSERT INTO items VALUES (?, ?)", [(number, f"item {number}") for number in range(1, 1001)]),
+    )
+    (workspace / "failing").mkdir()
+    execute(workspace / "target" / "shop.sqlite", "CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)")
+    execute(workspace / "failing" / "shop.sqlite", "CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT CHECK (id < 250))")
+    source = connection(workspace, "source")
+    target, failing = connection(workspace, "target"), connection(workspace, "failing")
+    table = source.load_schema_snapshot(["shop"]).get_table("shop", "items")
+    tee_copier = TeeCopier(source, [failing, target], buffer_batches=1)
+    reports = {}
+
+    copy = threading.Thread(target=lambda: reports.update(tee_copier.copy_table(table)), daemon=True)
+    copy.start()
+    copy.join(timeout=30)
+
+    assert not copy.is_alive()
+    assert list(tee_copier.failures) == [failing.name]
+    assert list(reports) == [target.name] and reports[target.name].rows == 1000
+    assert same_rows(workspace, "shop.sqlite", "items")
+    assert tee_copier.copy_table(table).keys() == {target.name}
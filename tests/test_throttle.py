@@ -0,0 +1,63 @@
+from app.connection_db import Connection
+from app.throttle import Throttle
+from conftest import execute, replicate, same_rows, write_config
+
+
+class Target:
+    name = "target"
+
+    def __init__(self, threads_running = None) -> None:
+        self.threads_running = threads_running
+        self.samples = []
+
+    def sample_health(self, database_connection = None):
+        self.samples.append(database_connection)
+        return self.threads_running, None
+
+
+def test_pace_is_left_as_configured_without_ceilings():
+    target = Target()
+    throttle = Throttle(target, {}, 100)
+
+    for _ in range(20):
+        throttle.wait(0.5)
+
+    assert throttle.current_batch_size() == 100
+    assert throttle.sleep_seconds == 0
+    assert target.samples == []
+
+
+def test_batches_shrink_over_a_ceiling_and_grow_back_below_half():
+    target = Target(threads_running=50)
+    throttle = Throttle(target, {"MAX_THREADS_RUNNING": 20, "SAMPLE_INTERVAL": 0, "MAX_SLEEP_SECONDS": 0.001}, 100)
+    held_connection = object()
+
+    throttle.wait(0.01, held_connection)
+    throttle.wait(0.01, held_connection)
+    assert throttle.current_batch_size() == 25
+    assert throttle.sleep_seconds == 0.001
+    assert target.samples == [held_connection, held_connection]
+
+    target.threads_running = 5
+    for _ in range(30):
+        throttle.wait(0.01)
+    assert throttle.current_batch_size() == 1000
+    assert throttle.sleep_seconds == 0
+
+
+def test_throttled_copy_samples_the_connection_it_holds(workspace, monkeypatch):
+    execute(
+        workspace / "source" / "shop.sqlite",
+        "CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)",
+        ("INSERT INTO items VALUES (?, ?)", [(number, f"item {number}") for number in range(1, 501)]),
+    )
+    samples = []
+    monkeypatch.setattr(Connection, "sample_health", lambda connection, database_connection = None: samples.append(database_connection) or (1, None))
+
+    replicate(write_config(
+        workspace, DATA=True, LOAD_METHOD="insert", BATCH_SIZE=50,
+        THROTTLE={"MAX_THREADS_RUNNING": 10, "SAMPLE_INTERVAL": 0},
+    ))
+
+    assert same_rows(workspace, "shop.sqlite", "items")
+    assert samples and None not in samples
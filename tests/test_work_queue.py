@@ -0,0 +1,114 @@
+import datetime
+import decimal
+import threading
+import time
+
+from app.key_ranges import KeyRange
+from app.work_queue import WorkQueue, WorkUnit
+
+
+def structure_and_ranges(bounds):
+    units = [WorkUnit("shop:structure", "structure", "target", "shop")]
+    for position, (lower, upper) in enumerate(zip([None] + bounds, bounds + [None])):
+        units.append(WorkUnit(
+            f"shop.items:{position:03d}", "data_range", "target", "shop", "items",
+            KeyRange(lower, upper), "shop:structure"
+        ))
+    return units
+
+
+def test_workers_claim_every_unit_once(tmp_path):
+    path = str(tmp_path / "work_units.sqlite")
+    coordinator = WorkQueue(path)
+    coordinator.add_units(structure_and_ranges([(number * 10,) for number in range(1, 40)]))
+    claims = []
+    early_claims = []
+    structure_done = threading.Event()
+
+    def work(worker):
+        work_queue = WorkQueue(path)
+        try:
+            while not work_queue.is_finished():
+                unit = work_queue.claim(worker)
+                if unit is None:
+                    time.sleep(0.01)
+                    continue
+                if unit.kind == "data_range" and not structure_done.is_set():
+                    early_claims.append(unit.unit_id)
+                claims.append(unit.unit_id)
+                if unit.kind == "structure":
+                    structure_done.set()
+                work_queue.complete(unit, worker, {"rows": 10})
+        finally:
+            work_queue.close()
+
+    workers = [threading.Thread(target=work, args=(f"worker-{number}",)) for number in range(4)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join(timeout=30)
+
+    assert early_claims == []
+    assert sorted(claims) == sorted(set(claims))
+    assert len(claims) == 41
+    assert coordinator.counts() == {"done": 41}
+    coordinator.close()
+
+
+def test_expired_lease_is_claimed_by_another_worker(tmp_path):
+    path = str(tmp_path / "work_units.sqlite")
+    first, second = WorkQueue(path, lease_seconds=0.05), WorkQueue(path, lease_seconds=0.05)
+    first.add_units([WorkUnit("shop:structure", "structure", "target", "shop")])
+
+    unit = first.claim("first")
+    assert second.claim("second") is None
+    time.sleep(0.1)
+
+    reclaimed = second.claim("second")
+    assert reclaimed.unit_id == unit.unit_id and reclaimed.attempts == 2
+    assert not first.renew(unit, "first")
+
+    first.complete(unit, "first", {"rows": 1})
+    assert not second.is_finished()
+    second.complete(reclaimed, "second", {"rows": 2})
+    assert second.results() == [("shop:structure", "target", {"rows": 2})]
+    first.close()
+    second.close()
+
+
+def test_unit_fails_after_max_attempts(tmp_path):
+    work_queue = WorkQueue(str(tmp_path / "work_units.sqlite"), max_attempts=2)
+    work_queue.add_units(structure_and_ranges([(100,)]))
+
+    for _ in range(2):
+        unit = work_queue.claim("worker")
+        assert unit.kind == "structure"
+        work_queue.fail(unit, "worker", "no route to host")
+
+    assert work_queue.claim("worker") is None
+    assert work_queue.is_finished()
+    assert [unit_id for unit_id, _, _ in work_queue.failures()] == [
+        "shop.items:000", "shop.items:001", "shop:structure",
+    ]
+    work_queue.close()
+
+
+def test_leased_ranges_keep_the_type_of_their_bounds(tmp_path):
+    bounds = [
+        (b"\x00\x10", datetime.datetime(2024, 5, 1, 8, 30), decimal.Decimal("1.50")),
+        (b"\x7f\xff", datetime.datetime(2024, 5, 2), decimal.Decimal("10")),
+    ]
+    work_queue = WorkQueue(str(tmp_path / "work_units.sqlite"))
+    work_queue.add_units(structure_and_ranges(bounds))
+    structure = work_queue.claim("worker")
+    work_queue.complete(structure, "worker")
+
+    ranges = []
+    for _ in range(3):
+        unit = work_queue.claim("worker")
+        ranges.append((unit.key_range.lower, unit.key_range.upper))
+        work_queue.complete(unit, "worker")
+
+    assert ranges == [(None, bounds[0]), (bounds[0], bounds[1]), (bounds[1], None)]
+    assert all(type(value) is type(expected) for value, expected in zip(ranges[1][0], bounds[0]))
+    work_queue.close()